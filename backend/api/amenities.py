@@ -1,54 +1,397 @@
-from fastapi import APIRouter, Query, HTTPException
-from typing import Optional, List, Dict, Any
-from db import supabase
+from fastapi import APIRouter, Query, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional, List, Dict, Any, Iterator, Tuple
+from db import get_supabase
+from poi.queries import POI_LOOKUP, find_nearby, text_matches, within_distance
+from poi.snapshot import get_snapshot
+from poi.spatial_index import INDEX_COLUMNS
+from poi.text_index import normalize_text
+from poi.vector_index import embed_query, get_vector_index
+from api.response_cache import cache_key, cached_entry, cached_response, cell_candidates, response_cache
+from metrics import annotate, count_cache, stage
+import asyncio
+import base64
+import heapq
+import json
 import math
 
 router = APIRouter(
 )
 
+SEARCH_RADIUS_KM = 20  # Hardcoded radius
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+STREAM_PAGE_SIZE = 500
+SUGGEST_LIMIT = 10
 
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371.0  # Earth radius in km
-    φ1, φ2 = map(math.radians, (lat1, lat2))
-    Δφ = math.radians(lat2 - lat1)
-    Δλ = math.radians(lon2 - lon1)
-    a = (math.sin(Δφ / 2) ** 2 +
-         math.cos(φ1) * math.cos(φ2) * math.sin(Δλ / 2) ** 2)
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+# Columns returned when no `fields` are requested. The 1024-dim `embedding`
+# vector is opt-in: it is many times larger than everything the map shows.
+LEAN_FIELDS = list(INDEX_COLUMNS)
+AVAILABLE_FIELDS = LEAN_FIELDS + ["embedding", "distance_m"]
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return LEAN_FIELDS
+    requested = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in AVAILABLE_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+
+def encode_cursor(key: Any) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def decode_cursor(cursor: Optional[str], around_point: bool = False) -> Any:
+    """
+    The key encoded in `cursor`: the last id of a listing, or the last
+    [distance, id] of a listing around a point. Raises a 400 when the cursor
+    does not decode to the key of the requested kind of listing.
+    """
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if around_point:
+        if (isinstance(key, list) and len(key) == 2 and (_is_int(key[0]) or isinstance(key[0], float))
+                and math.isfinite(key[0]) and _is_int(key[1])):
+            return [float(key[0]), key[1]]
+    elif _is_int(key):
+        return key
+    raise HTTPException(status_code=400, detail="Invalid cursor for this listing")
+
+
+def _project(row: Dict[str, Any], fields: List[str], distance_m: Optional[float] = None) -> Dict[str, Any]:
+    projected = {f: row.get(f) for f in fields if f != "distance_m"}
+    if "distance_m" in fields:
+        projected["distance_m"] = distance_m
+    return projected
+
+
+def _with_columns(hits: List[Tuple[float, Dict]], fields: List[str]) -> List[Tuple[float, Dict]]:
+    """Fetches requested columns the lookup did not return (e.g. embedding) for these rows only."""
+    missing = [f for f in fields if f != "distance_m" and hits and f not in hits[0][1]]
+    if not missing:
+        return hits
+    ids = [row["id"] for _, row in hits]
+    response = get_supabase().table("medical_amenity").select(", ".join(["id"] + missing)).in_("id", ids).execute()
+    extra = {row["id"]: row for row in response.data or []}
+    return [(d, {**row, **extra.get(row["id"], {})}) for d, row in hits]
+
+
+def _rows_by_id(ids: List[int], fields: List[str]) -> Dict[int, Dict[str, Any]]:
+    """The rows with these ids, from the snapshot or the table (see POI_LOOKUP)."""
+    if POI_LOOKUP != "db":
+        snapshot = get_snapshot()
+        return {i: record for i, record in ((i, snapshot.get(i)) for i in ids) if record is not None}
+    columns = ", ".join(dict.fromkeys(["id"] + [f for f in fields if f != "distance_m"]))
+    rows = get_supabase().table("medical_amenity").select(columns).in_("id", ids).execute().data
+    return {row["id"]: row for row in rows or []}
+
+
+def nearby_amenities(
+        lat: float,
+        lon: float,
+        amenity: Optional[str] = None,
+        name: Optional[str] = None,
+        radius_km: float = SEARCH_RADIUS_KM,
+        after: Optional[List] = None,
+        fields: Optional[List[str]] = None,
+) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    Looks up amenities around a point, applying the same case-insensitive
+    substring filters as the plain database query.
+
+    Returns:
+        List[Tuple[float, Dict]]: (distance in meters, row) pairs ordered by
+            distance then id, starting after the `after` (distance, id) key.
+    """
+    columns = ", ".join(dict.fromkeys(["id", "lat", "lon"] + [f for f in fields or LEAN_FIELDS if f != "distance_m"]))
+    candidates = cell_candidates(
+        "amenities", lat, lon, radius_km * 1000,
+        lambda c_lat, c_lon, radius_m: find_nearby(c_lat, c_lon, radius_m, amenity_like=amenity, name_like=name,
+                                                   columns=columns),
+        amenity, name, columns)
+    hits = within_distance(candidates, lat, lon, radius_km * 1000)
+    hits.sort(key=lambda hit: (hit[0], hit[1]["id"]))
+    if after is not None:
+        hits = [hit for hit in hits if [hit[0], hit[1]["id"]] > after]
+    return hits
+
+
+def _table_query(columns: List[str], amenity: Optional[str], name: Optional[str]):
+    query = get_supabase().table("medical_amenity").select(", ".join(dict.fromkeys(["id"] + columns)))
+    if amenity:
+        query = query.ilike("amenity_type", f"%{amenity}%")
+    if name:
+        query = query.ilike("metadata->>name", f"%{name}%")
+    return query.order("id")
+
+
+def _list_rows(fields: List[str], amenity: Optional[str], name: Optional[str],
+               after: Optional[int], limit: int) -> List[Dict[str, Any]]:
+    """Up to `limit` rows in id order after the id `after`, from the snapshot or the table (see POI_LOOKUP)."""
+    if POI_LOOKUP == "db":
+        query = _table_query([f for f in fields if f != "distance_m"], amenity, name)
+        if after is not None:
+            query = query.gt("id", after)
+        return query.limit(limit).execute().data or []
+
+    snapshot = get_snapshot()
+    matches = text_matches(snapshot, amenity, name)
+    if matches is None:
+        rows = []
+        for record in snapshot.scan(after):
+            rows.append(record)
+            if len(rows) == limit:
+                break
+    else:
+        ids = heapq.nsmallest(limit, (i for i in matches if after is None or i > after))
+        rows = [snapshot.get(i) for i in ids]
+    return [row for _, row in _with_columns([(None, row) for row in rows], fields)]
+
+
+def _stream_table(fields: List[str], amenity: Optional[str], name: Optional[str],
+                  after: Optional[int], limit: Optional[int]) -> Iterator[str]:
+    """Pages through the amenities in id order, yielding one NDJSON line per row as soon as its page arrives."""
+    sent = 0
+    while limit is None or sent < limit:
+        page_size = STREAM_PAGE_SIZE if limit is None else min(STREAM_PAGE_SIZE, limit - sent)
+        rows = _list_rows(fields, amenity, name, after, page_size)
+        for row in rows:
+            yield json.dumps(_project(row, fields)) + "\n"
+        sent += len(rows)
+        if len(rows) < page_size:
+            return
+        after = rows[-1]["id"]
+
+
+def _stream_nearby(fields: List[str], amenity: Optional[str], name: Optional[str], lat: float, lon: float,
+                   after: Optional[List], limit: Optional[int]) -> Iterator[str]:
+    """
+    Yields one NDJSON line per amenity around the point, nearest first. The
+    lookup runs when the stream starts; columns it did not return are then
+    fetched one page of STREAM_PAGE_SIZE rows at a time, each page sent as
+    soon as it is complete.
+    """
+    hits = nearby_amenities(lat, lon, amenity, name, after=after, fields=fields)
+    if limit is not None:
+        hits = hits[:limit]
+    for start in range(0, len(hits), STREAM_PAGE_SIZE):
+        for d, row in _with_columns(hits[start:start + STREAM_PAGE_SIZE], fields):
+            yield json.dumps(_project(row, fields, d)) + "\n"
+
+
+def _page(field_list: List[str], amenity: Optional[str], name: Optional[str], lat: Optional[float],
+          lon: Optional[float], after: Any, limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of results and the cursor of the next page, if any."""
+    if lat is not None and lon is not None:
+        hits = nearby_amenities(lat, lon, amenity, name, after=after, fields=field_list)
+        page = _with_columns(hits[:limit], field_list)
+        next_cursor = None
+        if len(hits) > limit:
+            last_distance, last_row = page[-1]
+            next_cursor = encode_cursor([last_distance, last_row["id"]])
+        return [_project(row, field_list, d) for d, row in page], next_cursor
+
+    rows = _list_rows(field_list, amenity, name, after, limit + 1)
+    next_cursor = encode_cursor(rows[limit - 1]["id"]) if len(rows) > limit else None
+    return [_project(row, field_list) for row in rows[:limit]], next_cursor
+
+
+def _suggest(q: str, amenity: Optional[str], lat: Optional[float], lon: Optional[float], radius_km: float,
+             typos: int, field_list: List[str], limit: int) -> List[Dict[str, Any]]:
+    """Suggestions for `q`: nearest first around a point, otherwise names starting with `q` first."""
+    columns = ", ".join(dict.fromkeys(["id", "lat", "lon"] + [f for f in field_list if f != "distance_m"]))
+    if lat is not None and lon is not None:
+        candidates = cell_candidates(
+            "suggest", lat, lon, radius_km * 1000,
+            lambda c_lat, c_lon, radius_m: find_nearby(c_lat, c_lon, radius_m, amenity_like=amenity, name_like=q,
+                                                       columns=columns, name_prefix=True, typos=typos),
+            amenity, q, typos, columns)
+        hits = within_distance(candidates, lat, lon, radius_km * 1000)
+        hits.sort(key=lambda hit: (hit[0], hit[1]["id"]))
+        hits = _with_columns(hits[:limit], field_list)
+        return [_project(row, field_list, d) for d, row in hits]
+
+    if POI_LOOKUP == "db":
+        rows = _table_query([f for f in field_list if f != "distance_m"], amenity, q).limit(limit).execute().data
+        return [_project(row, field_list) for row in rows or []]
+
+    snapshot = get_snapshot()
+    needle = normalize_text(q)
+    names = snapshot.text_index
+
+    def rank(amenity_id):
+        name = names.text(amenity_id) or ""
+        return not name.startswith(needle), name, amenity_id
+
+    ids = heapq.nsmallest(limit, text_matches(snapshot, amenity, q, prefix=True, typos=typos), key=rank)
+    hits = _with_columns([(None, snapshot.get(i)) for i in ids], field_list)
+    return [_project(row, field_list) for _, row in hits]
 
 
 @router.get("/", response_model=List[Dict[str, Any]])
 async def get_amenities(
+        request: Request,
         amenity: Optional[str] = Query(None, description="Amenity type (substring match)"),
         name: Optional[str] = Query(None, description="Metadata name (substring match)"),
         lat: Optional[float] = Query(None),
-        lon: Optional[float] = Query(None)
+        lon: Optional[float] = Query(None),
+        fields: Optional[str] = Query(None, description=f"Comma-separated columns out of {', '.join(AVAILABLE_FIELDS)}. "
+                                                        f"Defaults to {', '.join(LEAN_FIELDS)}."),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT,
+                                     description=f"Page size. Defaults to {DEFAULT_LIMIT}; unbounded when streaming."),
+        cursor: Optional[str] = Query(None, description="Value of the X-Next-Cursor header of the previous page"),
+        format: str = Query("json", pattern="^(json|ndjson)$",
+                            description="'ndjson' streams one JSON object per line as rows are produced"),
 ):
+    """
+    Lists amenities, optionally around a point (sorted by distance, within
+    20 km) and filtered by type and name. Results are paginated: when more
+    rows follow, the X-Next-Cursor response header holds the cursor of the
+    next page.
+
+    Distances are measured from the exact point; the candidate rows around
+    it are cached per ~150 m geohash cell, so that nearby users share the
+    lookup, and pages without a point are cached whole. JSON pages carry an
+    ETag and a Last-Modified header; a request that sends them back gets a
+    304 while the data is unchanged.
+    """
     try:
-        query = supabase.table("medical_amenity").select("*")
+        field_list = parse_fields(fields)
+        # Filters are case-insensitive, normalize them so equivalent requests share a cache entry
+        amenity = (amenity or "").strip().lower() or None
+        name = (name or "").strip().lower() or None
+        if lat is None or lon is None:
+            lat = lon = None
+        after = decode_cursor(cursor, around_point=lat is not None)
+
+        if format == "ndjson":
+            # Sync generators are iterated off the event loop by StreamingResponse
+            if lat is not None:
+                lines = _stream_nearby(field_list, amenity, name, lat, lon, after, limit)
+            else:
+                lines = _stream_table(field_list, amenity, name, after, limit)
+            return StreamingResponse(lines, media_type="application/x-ndjson")
+
+        limit = limit or DEFAULT_LIMIT
+        # Pages around a point depend on its exact coordinates; only their candidates are cached
+        parts = ("amenities", amenity, name, field_list, limit, cursor)
+        key = cache_key(*parts) if lat is None else None
+        entry = count_cache("response", response_cache.get(key)) if key is not None else None
+        if entry is None:
+            # The page may need database queries, which block: run it off the event loop
+            with stage("lookup"):
+                body, next_cursor = await asyncio.to_thread(_page, field_list, amenity, name, lat, lon, after, limit)
+            annotate("rows", len(body))
+            with stage("serialize"):
+                entry = cached_entry(body, {"X-Next-Cursor": next_cursor} if next_cursor else None)
+            key = key or (cache_key(*parts) if lat is None else None)  # the lookup may have loaded the snapshot
+            if key is not None:
+                response_cache.set(key, entry)
+        return cached_response(request, entry)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if amenity:
-            query = query.ilike("amenity_type", f"%{amenity}%")
-        if name:
-            query = query.ilike("metadata->>name", f"%{name}%")
 
-        response = query.execute()
-        if not response.data:
+@router.get("/suggest", response_model=List[Dict[str, Any]])
+async def suggest_amenities(
+        request: Request,
+        q: str = Query(..., min_length=1, description="What the user typed so far"),
+        amenity: Optional[str] = Query(None, description="Amenity type (substring match)"),
+        lat: Optional[float] = Query(None),
+        lon: Optional[float] = Query(None),
+        radius_km: float = Query(SEARCH_RADIUS_KM, gt=0, description="Only used together with lat/lon"),
+        typos: int = Query(1, ge=0, le=2, description="Typos tolerated in q, once it is long enough"),
+        limit: int = Query(SUGGEST_LIMIT, ge=1, le=MAX_LIMIT),
+        fields: Optional[str] = Query(None, description="Same as for GET /amenities/"),
+):
+    """
+    Search-as-you-type over the amenity names: the amenities with a word in
+    their name starting with `q`, ignoring case and accents and tolerating
+    `typos`. Around lat/lon they are ordered by distance, otherwise names
+    starting with `q` come first. Answered from the in-memory trigram
+    index; with POI_LOOKUP=db it is a plain substring match in the database.
+    """
+    try:
+        field_list = parse_fields(fields)
+        amenity = (amenity or "").strip().lower() or None
+        q = normalize_text(q)
+        if not q:
             return []
+        if lat is None or lon is None:
+            lat = lon = None
 
-        results = response.data
+        # As for GET /amenities/, suggestions around a point only share their candidates
+        parts = ("suggest", amenity, q, typos, field_list, limit)
+        key = cache_key(*parts) if lat is None else None
+        entry = count_cache("response", response_cache.get(key)) if key is not None else None
+        if entry is None:
+            with stage("lookup"):
+                body = await asyncio.to_thread(_suggest, q, amenity, lat, lon, radius_km, typos, field_list, limit)
+            annotate("rows", len(body))
+            with stage("serialize"):
+                entry = cached_entry(body)
+            key = key or (cache_key(*parts) if lat is None else None)  # the lookup may have loaded the snapshot
+            if key is not None:
+                response_cache.set(key, entry)
+        return cached_response(request, entry)
 
-        # Proximity filter (hardcoded radius = 20km)
-        if lat is not None and lon is not None:
-            def within_radius(item):
-                try:
-                    return haversine(lat, lon, float(item["lat"]), float(item["lon"])) <= 20  # Hardcoded radius
-                except (ValueError, TypeError):
-                    return False
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-            results = [item for item in results if within_radius(item)]
 
-        return results
+@router.get("/search", response_model=List[Dict[str, Any]])
+async def search_amenities(
+        q: str = Query(..., min_length=1, description="What to look for, e.g. 'wheelchair accessible orthopaedic clinic'"),
+        k: int = Query(10, ge=1, le=100, description="Number of results"),
+        lat: Optional[float] = Query(None),
+        lon: Optional[float] = Query(None),
+        radius_km: float = Query(SEARCH_RADIUS_KM, gt=0, description="Only used together with lat/lon"),
+        fields: Optional[str] = Query(None, description="Same as for GET /amenities/"),
+):
+    """
+    Ranks amenities by how similar their metadata embedding is to the query,
+    optionally only those within `radius_km` of lat/lon. Each result carries
+    its cosine similarity as "score".
+    """
+    try:
+        field_list = parse_fields(fields)
+        # Embedding the query and (re)loading the index are CPU/IO heavy, keep them off the event loop
+        with stage("embed"):
+            query_vector = await asyncio.to_thread(embed_query, q)
+        with stage("vector_index"):
+            index = await asyncio.to_thread(get_vector_index)
+
+        if lat is not None and lon is not None:
+            hits = await asyncio.to_thread(nearby_amenities, lat, lon, radius_km=radius_km, fields=field_list)
+            nearby = {row["id"]: (d, row) for d, row in hits}
+            matches = index.search(query_vector, k, candidate_ids=nearby)
+            hits = [nearby[i] for i, _ in matches]
+        else:
+            matches = index.search(query_vector, k)
+            by_id = await asyncio.to_thread(_rows_by_id, [i for i, _ in matches], field_list)
+            matches = [(i, score) for i, score in matches if i in by_id]
+            hits = [(None, by_id[i]) for i, _ in matches]
+
+        hits = await asyncio.to_thread(_with_columns, hits, field_list)
+        return [{**_project(row, field_list, d), "score": score} for (d, row), (_, score) in zip(hits, matches)]
 
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
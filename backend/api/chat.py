@@ -1,73 +1,91 @@
+import asyncio
 import json
 import os
-import time
 import random
-from typing import List, Dict
+from typing import Any, AsyncIterator, List, Dict, Optional, Tuple, Union
 
-import google.generativeai as genai
 from dotenv import load_dotenv
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from db import supabase
-from geopy.distance import geodesic
+from api.response_cache import cell_candidates, cell_margin_m, snap
+from metrics import annotate, intent_retries, result_rows, stage
+from poi.distance import distances_m
+from poi.opening_hours import format_minute_of_week, minute_of_week, opening_hours_of
+from poi.queries import find_nearby, find_nearest
+from poi.snapshot import metadata_of, opening_hours_of_row
 
-from query_intent.analyze import analyze_intent
+from query_intent.analyze import normalize_amenity_types, resolve_intent, resolve_intents
 
 load_dotenv()
 
 router = APIRouter()
 
-# Initialize Google Generative AI
-genai.configure(api_key=os.getenv("GENAI_API_KEY"))
-model = genai.GenerativeModel("gemini-2.0-flash-lite")
+INTENT_DEADLINE_S = float(os.getenv("INTENT_DEADLINE_S", "8"))
+CHAT_BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "500"))
+# Locations kept per geohash cell for ranking; a far larger radius only costs a lookup when they do not suffice
+CHAT_CANDIDATES = int(os.getenv("CHAT_CANDIDATES", "100"))
+# When they do not, the nearest locations to the user are looked up, four times as many each round up to this many
+CHAT_MAX_CANDIDATES = int(os.getenv("CHAT_MAX_CANDIDATES", "1600"))
+TOP_N = 5
 
 
 class ChatRequest(BaseModel):
     message: str = Field(..., description="The user's input message.")
     user_lat: float = Field(..., description="The user's latitude.")
     user_lon: float = Field(..., description="The user's longitude.")
+    per_type_quota: Optional[int] = Field(None, ge=1, description="Maximum number of results per amenity type.")
 
 
 class ChatResponse(BaseModel):
     reply: str = Field(..., description="The bot's response.")
-    link_to_amenities: str = Field(..., description="Link to the amenities page.")
+    link_to_amenities: str = Field("", description="Link to the amenities page.")
+
+
+class ChatBatchRequest(BaseModel):
+    items: List[ChatRequest] = Field(..., min_length=1, max_length=CHAT_BATCH_MAX_ITEMS,
+                                     description="The messages to answer.")
+
+
+class ChatBatchResult(BaseModel):
+    response: Optional[ChatResponse] = Field(None, description="The reply, as POST /chat/ would have given it.")
+    error: Optional[str] = Field(None, description="Why this item could not be answered, when it could not.")
+
+
+class ChatBatchResponse(BaseModel):
+    results: List[ChatBatchResult] = Field(..., description="One result per item, in the order of the request.")
 
 
 def get_relevant_locations(
-        amenity_type: str,
+        amenity_types: Union[str, List[str]],
         user_lat: float,
         user_lon: float,
         radius_m: int,
-) -> List[Dict]:
+        limit: Optional[int] = None,
+) -> List[Tuple[float, Dict]]:
     """
-    Fetches locations from Supabase based on amenity type and filters them
-    by distance from the given coordinates and within the specified radius.
+    Looks up locations of the given amenity types within the specified radius
+    of the given coordinates, through the in-memory snapshot or a query
+    restricted to the search area (see POI_LOOKUP). All types are searched
+    in a single lookup.
 
     Args:
-        amenity_type (str): The type of amenity to search for.
+        amenity_types (Union[str, List[str]]): The type(s) of amenity to search for.
         user_lat (float): The user's latitude.
         user_lon (float): The user's longitude.
         radius_m (int): The radius in meters to search within.
+        limit (int, optional): Only the `limit` nearest locations. All of
+            them when None.
 
     Returns:
-        List[Dict]: A list of dictionaries, where each dictionary represents
-                    a location that matches the criteria.
+        List[Tuple[float, Dict]]: (distance in meters, location) pairs,
+                                  nearest first.
     """
-    # Fetch data from Supabase for the given amenity types
-    response = supabase.table("medical_amenity").select("*").eq("amenity_type", amenity_type).execute()
-
-    locations = response.data  # This will be a list of dictionaries
-
-    relevant_locations = []
-    for location in locations:
-        location_lat = location["lat"]
-        location_lon = location["lon"]
-        # Calculate distance
-        distance = geodesic((user_lat, user_lon), (location_lat, location_lon)).meters
-        if distance <= radius_m:
-            relevant_locations.append(location)
-
-    return relevant_locations
+    if isinstance(amenity_types, str):
+        amenity_types = [amenity_types]
+    if limit is not None:
+        return find_nearest(user_lat, user_lon, limit, radius_m, amenity_types)
+    return find_nearby(user_lat, user_lon, radius_m, amenity_types)
 
 
 def is_open(metadata: str, current_time_str: str) -> bool:
@@ -82,86 +100,133 @@ def is_open(metadata: str, current_time_str: str) -> bool:
 
     Returns:
         bool: True if the location is open, False otherwise.
-              Returns True if opening_hours is not provided.
-
-    NOTE:  This is a simplified version.  A robust implementation
-           would require a more sophisticated library like 'opening_hours'
-           to handle complex opening hour formats.
+              Returns False if opening_hours is missing or not understood.
     """
-
-    try:
-        metadata_dict = json.loads(metadata)
-        opening_hours = metadata_dict.get("opening_hours")
-
-        if not opening_hours:
-            return False  # If no opening hours are provided, assume closed
-
-        day = current_time_str[:2]  # e.g., "Mo"
-        time_str = current_time_str[3:]  # e.g., "09:00"
-
-        # Very basic parsing - assumes "Mo 09:00-17:00" format
-        schedule = opening_hours.split(",")
-        for day_schedule in schedule:
-            if day in day_schedule:
-                open_time_str, close_time_str = day_schedule.split(" ")[1].split("-")
-                open_time = int(open_time_str.replace(":", ""))
-                close_time = int(close_time_str.replace(":", ""))
-                current_time = int(time_str.replace(":", ""))
-                if open_time <= current_time <= close_time:
-                    return True
-                else:
-                    return False
-        return False  # If the day isn't found
-
-    except (json.JSONDecodeError, ValueError, KeyError) as e:
-        print(f"Error parsing opening hours: {e}")
-        return True  # Be safe, assume open if parsing fails
+    opening_hours = opening_hours_of(metadata)
+    return opening_hours is not None and opening_hours.is_open(minute_of_week(current_time_str))
 
 
-def rank_and_format_locations(
+def rank_locations(
         locations: List[Dict],
         user_lat: float,
         user_lon: float,
         current_time_str: str,
-        top_n: int = 5
-) -> str:
+        top_n: int = TOP_N,
+        per_type_quota: Optional[int] = None,
+        radius_m: Optional[float] = None,
+) -> List[Dict]:
     """
-    Ranks locations by distance and open status, and formats the top N results
-    into a user-friendly string.
+    Ranks locations by distance and open status and keeps the top N. Locations
+    of different amenity types are merged into one ranking.
 
     Args:
         locations (List[Dict]): A list of location dictionaries.
         user_lat (float): The user's latitude.
         user_lon (float): The user's longitude.
         current_time_str (str): The current time string ("Day HH:MM").
-        top_n (int, optional): The number of top locations to return. Defaults to 5.
+        top_n (int, optional): The number of top locations to return. Defaults to TOP_N.
+        per_type_quota (int, optional): Maximum number of locations of any one
+            amenity type among the top N. Unlimited when None.
+        radius_m (float, optional): Leave out locations further than this
+            from the user, e.g. candidates looked up for a whole geohash cell.
+
+    Returns:
+        List[Dict]: The top N, best first. Each entry holds the "location", its
+                    "distance_m" from the user, whether it is "open_now" and its
+                    opening "status" as shown to the user.
+    """
+
+    # Measured from the user in one batch; lookups shared by nearby users measure from elsewhere
+    with stage("distance"):
+        measured = distances_m(user_lat, user_lon, [loc["lat"] for loc in locations],
+                               [loc["lon"] for loc in locations]).tolist() if locations else []
+        distances = {id(loc): d for loc, d in zip(locations, measured)}
+        if radius_m is not None:
+            locations = [loc for loc in locations if distances[id(loc)] <= radius_m]
+
+    def calculate_distance(loc):
+        return distances[id(loc)]
+
+    with stage("rank"):
+        # Rank by distance
+        ranked_locations = sorted(locations, key=calculate_distance)
+
+        # Further prioritize by "open now", in a single pass over the ranked list
+        now = minute_of_week(current_time_str)
+        open_locations, closed_locations = [], []
+        for loc in ranked_locations:
+            opening_hours = opening_hours_of_row(loc)
+            if opening_hours is not None and opening_hours.is_open(now):
+                open_locations.append((loc, opening_hours))
+            else:
+                closed_locations.append((loc, opening_hours))
+        final_ranked = open_locations + closed_locations  # Open ones come first
+
+        if per_type_quota is None:
+            selected = final_ranked[:top_n]
+        else:
+            selected, per_type = [], {}
+            for entry in final_ranked:
+                amenity_type = entry[0]["amenity_type"]
+                if per_type.get(amenity_type, 0) < per_type_quota:
+                    per_type[amenity_type] = per_type.get(amenity_type, 0) + 1
+                    selected.append(entry)
+                    if len(selected) == top_n:
+                        break
+
+        ranked = []
+        for loc, opening_hours in selected:
+            next_open = opening_hours.next_open(now) if opening_hours is not None else None
+            if next_open == now:
+                status = "✅ Open Now"
+            elif next_open is not None:
+                status = f"Currently Closed (opens {format_minute_of_week(next_open)})"
+            else:
+                status = "Currently Closed"
+            ranked.append({"location": loc, "distance_m": calculate_distance(loc),
+                           "open_now": next_open == now, "status": status})
+    return ranked
+
+
+def format_location(position: int, entry: Dict) -> str:
+    """One line of the reply for a ranked location, `position` counting from 1."""
+    metadata = metadata_of(entry["location"])
+    name = metadata.get("name", "Unknown")
+    address = metadata.get("address", "No address provided")
+    distance_km = entry["distance_m"] / 1000
+    return f"{position}. {name} - {address} ({distance_km:.2f} km away) - {entry['status']}\n"
+
+
+def format_header(ranked: List[Dict], top_n: int = TOP_N) -> str:
+    amenity_types = ", ".join(dict.fromkeys(entry["location"]["amenity_type"] for entry in ranked))
+    return f"Here are the top {top_n} {amenity_types} locations:\n\n"
+
+
+def rank_and_format_locations(
+        locations: List[Dict],
+        user_lat: float,
+        user_lon: float,
+        current_time_str: str,
+        top_n: int = TOP_N,
+        per_type_quota: Optional[int] = None,
+) -> str:
+    """
+    Ranks locations by distance and open status, and formats the top N results
+    into a user-friendly string (see rank_locations).
 
     Returns:
         str: A formatted string with the top N locations, ranked by
              distance and open status.
     """
+    return format_reply(rank_locations(locations, user_lat, user_lon, current_time_str, top_n, per_type_quota), top_n)
 
-    def calculate_distance(loc):
-        return geodesic((user_lat, user_lon), (loc["lat"], loc["lon"])).meters
-
-    # Rank by distance
-    ranked_locations = sorted(locations, key=calculate_distance)
-
-    # Further prioritize by "open now"
-    open_locations = [loc for loc in ranked_locations if is_open(loc["metadata"], current_time_str)]
-    closed_locations = [loc for loc in ranked_locations if loc not in open_locations]
-    final_ranked = open_locations + closed_locations  # Open ones come first
-
-    formatted_results = f"Here are the top {top_n} {final_ranked[0]['amenity_type']} locations:\n\n"
-    for i, loc in enumerate(final_ranked[:top_n]):
-        distance_km = calculate_distance(loc) / 1000
-        metadata = json.loads(loc["metadata"])
-        name = metadata.get("name", "Unknown")
-        address = metadata.get("address", "No address provided")
-        is_currently_open = "✅ Open Now" if is_open(loc["metadata"], current_time_str) else "Currently Closed"
-        formatted_results += (
-            f"{i + 1}. {name} - {address} ({distance_km:.2f} km away) - {is_currently_open}\n"
-        )
+
+def format_reply(ranked: List[Dict], top_n: int = TOP_N) -> str:
+    """The reply listing the ranked locations (see rank_locations)."""
+    with stage("format"):
+        formatted_results = format_header(ranked, top_n)
+        for i, entry in enumerate(ranked):
+            formatted_results += format_location(i + 1, entry)
     return formatted_results
 
 
@@ -176,54 +241,199 @@ def get_current_time_str() -> str:
     return datetime.now().strftime("%a %H:%M")  # e.g., "Mon 09:00"
 
 
-def analyze_intent_with_retry(user_query: str, max_retries: int = 5) -> object:
+async def analyze_intent_with_retry(
+        user_query: str,
+        max_retries: Optional[int] = None,
+        deadline_s: float = INTENT_DEADLINE_S,
+) -> object:
     """
-    Attempts to analyze user intent with exponential backoff retry logic.
+    Attempts to analyze user intent with exponential backoff retry logic,
+    without blocking the event loop. Attempts and backoff sleeps share one
+    deadline: once it has passed no new attempt is started and a running
+    one is cancelled.
 
     Args:
         user_query (str): The user's query text
-        max_retries (int): Maximum number of retry attempts
+        max_retries (int, optional): Maximum number of retry attempts. Only
+            the deadline bounds the retries when None.
+        deadline_s (float): Time budget in seconds for all attempts together
 
     Returns:
-        object: The intent object from analyze_intent
+        object: The intent object from resolve_intent
 
     Raises:
-        ValueError: If all retry attempts fail
+        ValueError: If all retry attempts fail or the deadline is exceeded
     """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + deadline_s
     retries = 0
+    attempts = 0
     last_exception = None
 
-    while retries <= max_retries:
+    while max_retries is None or retries <= max_retries:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            last_exception = TimeoutError(f"deadline of {deadline_s:.1f}s exceeded")
+            break
+        attempts += 1
+        if attempts > 1:
+            intent_retries.inc()
         try:
-            intent = analyze_intent(user_query)
+            intent = await asyncio.wait_for(resolve_intent(user_query), timeout=remaining)
 
             # Check if the intent is valid
             if intent.valid_query:
+                annotate("intent_attempts", attempts)
                 return intent
             else:
                 # Invalid intent but with a reason - retry with exponential backoff
-                print(f"Retry {retries + 1}/{max_retries}: Intent invalid - {intent.reason_invalid}")
+                print(f"Retry {retries + 1}: Intent invalid - {intent.reason_invalid}")
                 last_exception = ValueError(intent.reason_invalid)
+        except asyncio.TimeoutError:
+            last_exception = TimeoutError(f"deadline of {deadline_s:.1f}s exceeded")
+            break
         except Exception as e:
             # Handle any other exceptions that might occur
-            print(f"Retry {retries + 1}/{max_retries}: Exception occurred - {str(e)}")
+            print(f"Retry {retries + 1}: Exception occurred - {str(e)}")
             last_exception = e
 
         # Increment retry counter
         retries += 1
 
-        # Don't sleep if this was the last attempt
-        if retries <= max_retries:
-            # Calculate backoff time with jitter for distributed systems
-            backoff_time = min(0.1 * (2 ** retries) + random.uniform(0, 0.1), 5)
+        # Calculate backoff time with jitter for distributed systems, never sleeping past the deadline
+        backoff_time = min(0.1 * (2 ** retries) + random.uniform(0, 0.1), 5, deadline - loop.time())
+        if backoff_time > 0 and (max_retries is None or retries <= max_retries):
             print(f"Waiting {backoff_time:.2f} seconds before next retry...")
-            time.sleep(backoff_time)
+            await asyncio.sleep(backoff_time)
 
     # If we've exhausted all retries, raise the last exception
+    annotate("intent_attempts", attempts)
     if last_exception:
-        raise ValueError(f"All {max_retries} intent analysis attempts failed: {str(last_exception)}")
+        raise ValueError(f"All {attempts} intent analysis attempts failed: {str(last_exception)}")
     else:
-        raise ValueError(f"All {max_retries} intent analysis attempts failed without a specific error")
+        raise ValueError(f"All {attempts} intent analysis attempts failed without a specific error")
+
+
+async def find_locations(amenity_types: List[str], user_lat: float, user_lon: float, radius_m: int) -> List[Dict]:
+    """
+    The CHAT_CANDIDATES locations nearest to the centre of the user's geohash
+    cell, within `radius_m` of some point of the cell: users in the same cell
+    share them (see cell_candidates). Looked up off the event loop (the index
+    may need a reload). Rank them with find_ranked_locations, which measures
+    the distances from the user and evaluates opening hours for the request
+    at hand.
+    """
+    with stage("lookup"):
+        locations = await asyncio.to_thread(
+            cell_candidates, "chat-locations", user_lat, user_lon, radius_m,
+            lambda lat, lon, radius: get_relevant_locations(amenity_types, lat, lon, radius, CHAT_CANDIDATES),
+            sorted(amenity_types), CHAT_CANDIDATES,
+        )
+    annotate("rows", len(locations))
+    result_rows.observe(len(locations), stage="chat")
+    return locations
+
+
+def _cell_reach_m(candidates: List[Dict], user_lat: float, user_lon: float) -> float:
+    """
+    How far from the user the cell's cut-off candidates hold every location:
+    the last one's distance from the cell centre minus the cell's half-diagonal.
+    """
+    _, centre_lat, centre_lon = snap(user_lat, user_lon)
+    reach = distances_m(centre_lat, centre_lon, [candidates[-1]["lat"]], [candidates[-1]["lon"]])[0]
+    return float(reach) - cell_margin_m(user_lat, user_lon)
+
+
+def _ranks_all(ranked: List[Dict], complete: bool, reach_m: float, top_n: int) -> bool:
+    """
+    Whether `ranked` is what ranking every location within the radius would
+    give, for candidates that hold every location up to `reach_m` from the
+    user (all of them when `complete`). Further locations only matter when
+    one of the top N is closed, or when the top N are not all closer than that.
+    """
+    if complete:
+        return True
+    if len(ranked) < top_n or not all(entry["open_now"] for entry in ranked):
+        return False
+    return ranked[-1]["distance_m"] < reach_m
+
+
+async def iter_ranked_locations(
+        amenity_types: List[str],
+        user_lat: float,
+        user_lon: float,
+        radius_m: int,
+        current_time_str: str,
+        per_type_quota: Optional[int] = None,
+        candidates: Optional[List[Dict]] = None,
+        top_n: int = TOP_N,
+) -> AsyncIterator[Dict]:
+    """
+    The top N locations for the user (see rank_locations), best first, each
+    yielded as soon as no location that is not looked up yet can rank before
+    it: an open location closer than every location not looked up is final.
+    They are ranked from the candidates of their geohash cell (find_locations,
+    unless `candidates` are given). When those may miss a better location,
+    e.g. an open one further away than the closed ones they hold, the
+    locations nearest to the user are looked up instead, without caching
+    them, four times as many each round until the ranking is settled. At
+    CHAT_MAX_CANDIDATES it is kept as is: an open location further than all
+    of those (at night, say) is then not preferred over the closed ones.
+    """
+    if candidates is None:
+        candidates = await find_locations(amenity_types, user_lat, user_lon, radius_m)
+    ranked = rank_locations(candidates, user_lat, user_lon, current_time_str, top_n, per_type_quota, radius_m)
+    complete = len(candidates) < CHAT_CANDIDATES
+    reach_m = 0.0 if complete else _cell_reach_m(candidates, user_lat, user_lon)
+    limit, emitted = CHAT_CANDIDATES, 0
+    while True:
+        settled = _ranks_all(ranked, complete, reach_m, top_n) or limit >= CHAT_MAX_CANDIDATES
+        # Further lookups only add locations beyond reach_m, so the entries yielded stay the head of the ranking
+        for entry in ranked[emitted:]:
+            if not settled and not (entry["open_now"] and entry["distance_m"] < reach_m):
+                break
+            emitted += 1
+            yield entry
+        if settled:
+            return
+        limit = min(limit * 4, CHAT_MAX_CANDIDATES)
+        with stage("lookup_all"):
+            hits = await asyncio.to_thread(get_relevant_locations, amenity_types, user_lat, user_lon, radius_m,
+                                           limit)
+        annotate("rows_all", len(hits))
+        ranked = rank_locations([location for _, location in hits], user_lat, user_lon, current_time_str, top_n,
+                                per_type_quota)
+        complete = len(hits) < limit
+        reach_m = hits[-1][0] if hits else 0.0
+
+
+async def find_ranked_locations(
+        amenity_types: List[str],
+        user_lat: float,
+        user_lon: float,
+        radius_m: int,
+        current_time_str: str,
+        per_type_quota: Optional[int] = None,
+        candidates: Optional[List[Dict]] = None,
+        top_n: int = TOP_N,
+) -> List[Dict]:
+    """The top N locations for the user, best first (see iter_ranked_locations)."""
+    return [entry async for entry in iter_ranked_locations(amenity_types, user_lat, user_lon, radius_m,
+                                                           current_time_str, per_type_quota, candidates, top_n)]
+
+
+def amenities_link(user_lat: float, user_lon: float, amenity_types: List[str]) -> str:
+    return f"localhost:3002/amenities?lat={user_lat}&lon={user_lon}&amenity_type={','.join(amenity_types)}"
+
+
+def no_locations_reply(amenity_types: List[str]) -> ChatResponse:
+    return ChatResponse(
+        reply=f"Sorry, I couldn't find any {' or '.join(amenity_types)} locations within the specified radius.")
+
+
+def not_understood_reply() -> ChatResponse:
+    return ChatResponse(
+        reply="I'm sorry, I couldn't understand what type of location you're looking for. Could you please rephrase your request?")
 
 
 @router.post("/", response_model=ChatResponse)
@@ -241,35 +451,179 @@ async def chat(
 
     try:
         # Use retry logic for intent analysis
-        intent = analyze_intent_with_retry(user_query, max_retries=10)
+        with stage("intent"):
+            intent = await analyze_intent_with_retry(user_query)
 
         # Extract necessary information from intent
-        amenity_type = intent.amenity_types[0]  # Or handle multiple types if needed
+        amenity_types = normalize_amenity_types(intent.amenity_types)
+        if not amenity_types:
+            raise ValueError("The intent did not name any amenity type")
         radius_m = intent.radius_m
 
-        # Get relevant locations from Supabase
-        locations = get_relevant_locations(
-            amenity_type, user_lat, user_lon, radius_m
-        )
-
-        if not locations:
-            return ChatResponse(reply=f"Sorry, I couldn't find any {amenity_type}s within the specified radius.")
-
-        current_time_str = get_current_time_str()
-
         # Rank and format the locations
-        response = rank_and_format_locations(
-            locations, user_lat, user_lon, current_time_str
-        )
+        ranked = await find_ranked_locations(amenity_types, user_lat, user_lon, radius_m, get_current_time_str(),
+                                             request.per_type_quota)
+        if not ranked:
+            return no_locations_reply(amenity_types)
+        response = format_reply(ranked)
 
-        generate_link = f"localhost:3002/amenities?lat={user_lat}&lon={user_lon}&amenity_type={amenity_type}"
-
-        return ChatResponse(reply=response, link_to_amenities=generate_link)
+        return ChatResponse(reply=response, link_to_amenities=amenities_link(user_lat, user_lon, amenity_types))
 
     except ValueError as e:
         # Handle intent analysis failures
-        return ChatResponse(
-            reply=f"I'm sorry, I couldn't understand what type of location you're looking for. Could you please rephrase your request?")
+        return not_understood_reply()
     except Exception as e:
         # Handle other unexpected errors
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/batch", response_model=ChatBatchResponse)
+async def chat_batch(
+        request: ChatBatchRequest,
+):
+    """
+    Answers many messages at once. Repeated messages are analyzed once and
+    the rest are classified several per model call (see resolve_intents).
+    Items asking for the same amenity types and radius from the same
+    geohash cell share one location lookup. Each item gets either a response
+    or an error; unlike POST /chat/, invalid intents are not retried.
+    """
+    items = request.items
+    try:
+        with stage("intent"):
+            intents = await asyncio.wait_for(resolve_intents([item.message for item in items]),
+                                             timeout=INTENT_DEADLINE_S)
+    except asyncio.TimeoutError:
+        error = f"Intent analysis exceeded its deadline of {INTENT_DEADLINE_S:.1f}s"
+        return ChatBatchResponse(results=[ChatBatchResult(error=error) for _ in items])
+
+    results: List[Optional[ChatBatchResult]] = [None] * len(items)
+    searches: Dict[tuple, tuple] = {}  # lookup key -> arguments of find_locations
+    lookups: Dict[int, tuple] = {}  # item position -> (lookup key, amenity types)
+    for i, (item, intent) in enumerate(zip(items, intents)):
+        if isinstance(intent, Exception):
+            results[i] = ChatBatchResult(error=str(intent))
+            continue
+        amenity_types = normalize_amenity_types(intent.amenity_types) if intent.valid_query else []
+        if not amenity_types:
+            results[i] = ChatBatchResult(response=not_understood_reply())
+            continue
+        cell, _, _ = snap(item.user_lat, item.user_lon)
+        key = (cell, tuple(sorted(amenity_types)), intent.radius_m)
+        searches.setdefault(key, (amenity_types, item.user_lat, item.user_lon, intent.radius_m))
+        lookups[i] = (key, amenity_types)
+
+    found = await asyncio.gather(*(find_locations(*arguments) for arguments in searches.values()),
+                                 return_exceptions=True)
+    locations_by_key = dict(zip(searches, found))
+
+    current_time_str = get_current_time_str()
+
+    async def rank(i: int, key: tuple, amenity_types: List[str]) -> List[Dict]:
+        locations = locations_by_key[key]
+        if isinstance(locations, Exception):
+            raise locations
+        item = items[i]
+        return await find_ranked_locations(amenity_types, item.user_lat, item.user_lon, key[2], current_time_str,
+                                           item.per_type_quota, candidates=locations)
+
+    rankings = await asyncio.gather(*(rank(i, *lookup) for i, lookup in lookups.items()), return_exceptions=True)
+    for (i, (key, amenity_types)), ranked in zip(lookups.items(), rankings):
+        item = items[i]
+        if isinstance(ranked, Exception):
+            results[i] = ChatBatchResult(error=str(ranked))
+        elif not ranked:
+            results[i] = ChatBatchResult(response=no_locations_reply(amenity_types))
+        else:
+            reply = format_reply(ranked)
+            link = amenities_link(item.user_lat, item.user_lon, amenity_types)
+            results[i] = ChatBatchResult(response=ChatResponse(reply=reply, link_to_amenities=link))
+    annotate("lookups", len(searches))
+    return ChatBatchResponse(results=results)
+
+
+async def chat_events(request: ChatRequest) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    The steps of `chat` as (event, data) pairs, each produced as soon as it
+    is known: "progress" when a stage starts, "intent" once the intent is
+    resolved, one "location" per ranked result, best first, as soon as it is
+    final (see iter_ranked_locations), and finally "done" with the
+    ChatResponse that `chat` would have returned. An unexpected failure ends
+    the stream with an "error" event instead.
+    """
+    user_lat, user_lon = request.user_lat, request.user_lon
+    try:
+        yield "progress", {"stage": "intent"}
+        with stage("intent"):
+            intent = await analyze_intent_with_retry(request.message)
+        amenity_types = normalize_amenity_types(intent.amenity_types)
+        if not amenity_types:
+            raise ValueError("The intent did not name any amenity type")
+        yield "intent", {"amenity_types": amenity_types, "radius_m": intent.radius_m}
+
+        yield "progress", {"stage": "search"}
+        ranked, lines = [], []
+        async for entry in iter_ranked_locations(amenity_types, user_lat, user_lon, intent.radius_m,
+                                                 get_current_time_str(), request.per_type_quota):
+            ranked.append(entry)
+            line = format_location(len(ranked), entry)
+            lines.append(line)
+            location = entry["location"]
+            metadata = metadata_of(location)
+            yield "location", {
+                "rank": len(ranked),
+                "id": location["id"],
+                "amenity_type": location["amenity_type"],
+                "name": metadata.get("name"),
+                "address": metadata.get("address"),
+                "lat": location["lat"],
+                "lon": location["lon"],
+                "distance_m": round(entry["distance_m"], 1),
+                "open_now": entry["open_now"],
+                "status": entry["status"],
+                "line": line.rstrip("\n"),
+            }
+        if not ranked:
+            yield "done", no_locations_reply(amenity_types).model_dump()
+            return
+        reply = format_header(ranked) + "".join(lines)
+        yield "done", ChatResponse(reply=reply,
+                                   link_to_amenities=amenities_link(user_lat, user_lon, amenity_types)).model_dump()
+
+    except ValueError:
+        yield "done", not_understood_reply().model_dump()
+    except Exception as e:
+        yield "error", {"detail": str(e)}
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _ndjson(event: str, data: Dict[str, Any]) -> str:
+    return json.dumps({"event": event, "data": data}) + "\n"
+
+
+@router.post("/stream")
+async def chat_stream(
+        request: ChatRequest,
+        format: str = Query("sse", pattern="^(sse|ndjson)$",
+                            description="'sse' for Server-Sent Events, 'ndjson' for one JSON event per line"),
+):
+    """
+    Streaming variant of POST /chat/: progress events, then each ranked
+    location, then the ChatResponse as the final "done" event (see
+    chat_events), so clients can render results before the reply is complete.
+    """
+    encode = _sse if format == "sse" else _ndjson
+
+    async def body():
+        async for event, data in chat_events(request):
+            yield encode(event, data)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        # Keep proxies from buffering the events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
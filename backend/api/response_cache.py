@@ -0,0 +1,140 @@
+"""
+Response cache shared by the /amenities and /chat endpoints.
+
+Requests from the same neighbourhood differ only in the last decimals of
+their coordinates, so what they share is the set of candidate rows for the
+whole geohash cell of the point: the rows within the search radius plus the
+cell's half-diagonal of its centre, which includes every row within the
+radius of any point in the cell. Each request then measures the distances
+from its own coordinates. The cell becomes part of the cache key, next to
+the normalized filters and the dataset version. A refresh of the data
+therefore never serves an old entry, and entries also expire after
+RESPONSE_CACHE_TTL_S seconds.
+"""
+import hashlib
+import json
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+
+from metrics import count_cache
+from poi.distance import distances_m
+from poi.geohash import geohash_bounds, geohash_cell
+from poi.queries import POI_LOOKUP
+from poi.snapshot import dataset_version, snapshot_store
+from query_intent.cache import LRUCache
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "4096"))
+RESPONSE_CACHE_TTL_S = float(os.getenv("RESPONSE_CACHE_TTL_S", "300"))
+# 7 characters is a cell of ~150 m x ~150 m (less east-west away from the equator)
+GEOHASH_PRECISION = int(os.getenv("RESPONSE_CACHE_GEOHASH_PRECISION", "7"))
+# Candidate sets larger than this are used for the request at hand but not cached
+CANDIDATE_CACHE_MAX_ROWS = int(os.getenv("RESPONSE_CACHE_CANDIDATE_ROWS", "2000"))
+
+response_cache = LRUCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_S)
+
+
+def snap(lat: float, lon: float) -> Tuple[str, float, float]:
+    """The geohash cell of a point and the centre of that cell, which requests are answered for."""
+    return geohash_cell(lat, lon, GEOHASH_PRECISION)
+
+
+def cell_margin_m(lat: float, lon: float) -> float:
+    """Distance in meters from the centre of the point's geohash cell to its farthest corner."""
+    _, lat_lo, lat_hi, lon_lo, lon_hi = geohash_bounds(lat, lon, GEOHASH_PRECISION)
+    corners = distances_m((lat_lo + lat_hi) / 2, (lon_lo + lon_hi) / 2,
+                          [lat_lo, lat_lo, lat_hi, lat_hi], [lon_lo, lon_hi, lon_lo, lon_hi])
+    return float(corners.max()) + 1.0  # rounding slack
+
+
+def cell_candidates(
+        name: str,
+        lat: float,
+        lon: float,
+        radius_m: float,
+        lookup: Callable[[float, float, float], List[Tuple[float, Any]]],
+        *filters: Any,
+) -> List[Any]:
+    """
+    The rows that may lie within `radius_m` of some point of the geohash cell
+    of (lat, lon), shared by the requests from that cell.
+
+    Args:
+        name (str): Which lookup this is, part of the cache key.
+        lat (float): Latitude of the request.
+        lon (float): Longitude of the request.
+        radius_m (float): The search radius of the request.
+        lookup: Called as lookup(centre_lat, centre_lon, radius_m) on a miss,
+            returns (distance, row) pairs.
+        *filters: Everything else the lookup depends on, part of the cache key.
+
+    Returns:
+        List: The rows, without distances: they are measured from the cell
+              centre, callers measure from their own coordinates.
+    """
+    cell, centre_lat, centre_lon = snap(lat, lon)
+    key = cache_key(name, cell, radius_m, *filters)
+    rows = count_cache("candidates", response_cache.get(key)) if key is not None else None
+    if rows is None:
+        rows = [row for _, row in lookup(centre_lat, centre_lon, radius_m + cell_margin_m(lat, lon))]
+        key = key or cache_key(name, cell, radius_m, *filters)  # the lookup loaded the snapshot
+        if key is not None and len(rows) <= CANDIDATE_CACHE_MAX_ROWS:
+            response_cache.set(key, rows)
+    return rows
+
+
+def _version() -> Optional[str]:
+    # The database lookup has no snapshot to version; its entries only expire
+    return "db" if POI_LOOKUP == "db" else dataset_version()
+
+
+def cache_key(*parts: Any) -> Optional[str]:
+    """
+    The cache key of a response or lookup, or None while the snapshot is not
+    loaded yet: that counts as a miss, and the key is never what loads it on
+    the event loop.
+    """
+    version = _version()
+    return None if version is None else json.dumps([version, *parts], default=str)
+
+
+def _last_modified() -> float:
+    snapshot = None if POI_LOOKUP == "db" else snapshot_store.current()
+    return 0.0 if snapshot is None else snapshot.loaded_at
+
+
+def cached_entry(body: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Serializes a response body once and derives its validators."""
+    content = json.dumps(body).encode()
+    return {
+        "content": content,
+        "headers": dict(headers or {}),
+        "etag": f'"{hashlib.sha256(content).hexdigest()[:32]}"',
+        "last_modified": _last_modified(),
+    }
+
+
+def _not_modified(request: Request, entry: Dict[str, Any]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or entry["etag"] in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and entry["last_modified"]:
+        try:
+            return int(entry["last_modified"]) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cached_response(request: Request, entry: Dict[str, Any]) -> Response:
+    """The cached JSON response, or an empty 304 when the client's copy is still current."""
+    headers = {**entry["headers"], "ETag": entry["etag"], "Cache-Control": "no-cache"}
+    if entry["last_modified"]:
+        headers["Last-Modified"] = formatdate(entry["last_modified"], usegmt=True)
+    if _not_modified(request, entry):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["content"], media_type="application/json", headers=headers)
@@ -0,0 +1,4 @@
+import os
+
+# Set before anything imports db: benchmarks never talk to the real Supabase
+os.environ["SUPABASE_URL"] = "memory://"
@@ -0,0 +1,167 @@
+"""
+Deterministic local stand-ins for Supabase and Gemini, and a synthetic POI
+dataset generator, so the API can be benchmarked without network access.
+"""
+import asyncio
+import json
+import time
+import zlib
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from db_memory import MemoryClient
+
+# (name, lat, lon) of the cities synthetic amenities are scattered around
+CITIES: List[Tuple[str, float, float]] = [
+    ("Antwerp", 51.2194, 4.4025),
+    ("Brussels", 50.8503, 4.3517),
+    ("Ghent", 51.0543, 3.7174),
+    ("Amsterdam", 52.3676, 4.9041),
+    ("Paris", 48.8566, 2.3522),
+    ("Berlin", 52.5200, 13.4050),
+    ("London", 51.5072, -0.1276),
+    ("Madrid", 40.4168, -3.7038),
+    ("Rome", 41.9028, 12.4964),
+    ("New York", 40.7128, -74.0060),
+]
+CITY_SPREAD_M = 8000  # standard deviation of the distance from the city centre
+
+# Relative frequencies roughly as in the OSM health extract
+AMENITY_WEIGHTS: Dict[str, float] = {
+    "pharmacy": 0.30, "doctors": 0.22, "dentist": 0.15, "clinic": 0.10, "veterinary": 0.07,
+    "hospital": 0.05, "nursing_home": 0.05, "childcare": 0.04, "social_facility": 0.02,
+}
+
+OPENING_HOURS = [
+    None,
+    "24/7",
+    "Mo-Fr 08:00-18:00",
+    "Mo-Fr 09:00-12:30,13:30-18:30; Sa 09:00-12:00",
+    "Mo-Fr 08:30-19:00; Sa 09:00-17:00; Su off",
+    "Mo,Tu,Th,Fr 09:00-17:00; We 09:00-12:00; PH off",
+    "Mo-Su 22:00-06:00",
+    "Mo-Sa 08:00-20:00",
+]
+
+
+def synthetic_rows(count: int, seed: int = 0) -> List[Dict]:
+    """`count` medical_amenity rows scattered around CITIES, reproducible for a given seed."""
+    rng = np.random.default_rng(seed)
+    cities = rng.integers(0, len(CITIES), count)
+    centre_lat = np.array([CITIES[c][1] for c in cities])
+    centre_lon = np.array([CITIES[c][2] for c in cities])
+    north_m, east_m = rng.normal(0, CITY_SPREAD_M, count), rng.normal(0, CITY_SPREAD_M, count)
+    lats = centre_lat + north_m / 111320.0
+    lons = centre_lon + east_m / (111320.0 * np.cos(np.radians(centre_lat)))
+
+    types = list(AMENITY_WEIGHTS)
+    weights = np.array(list(AMENITY_WEIGHTS.values()))
+    type_idx = rng.choice(len(types), count, p=weights / weights.sum())
+    hours_idx = rng.integers(0, len(OPENING_HOURS), count)
+
+    rows = []
+    for i in range(count):
+        amenity_type = types[type_idx[i]]
+        metadata = {"amenity": amenity_type, "name": f"{amenity_type.replace('_', ' ').title()} {i}",
+                    "address": f"{i % 300 + 1} Main Street, {CITIES[cities[i]][0]}"}
+        if OPENING_HOURS[hours_idx[i]]:
+            metadata["opening_hours"] = OPENING_HOURS[hours_idx[i]]
+        rows.append({
+            "id": i + 1,
+            "amenity_type": amenity_type,
+            "metadata": json.dumps(metadata),
+            "lat": float(lats[i]),
+            "lon": float(lons[i]),
+        })
+    return rows
+
+
+def synthetic_client(count: int, seed: int = 0) -> MemoryClient:
+    return MemoryClient({"medical_amenity": synthetic_rows(count, seed)})
+
+
+def random_points(count: int, seed: int = 1) -> List[Tuple[float, float]]:
+    """Request coordinates: users spread around the same cities as the data."""
+    rng = np.random.default_rng(seed)
+    points = []
+    for _ in range(count):
+        _, lat, lon = CITIES[rng.integers(0, len(CITIES))]
+        north_m, east_m = rng.normal(0, CITY_SPREAD_M / 2, 2)
+        points.append((lat + north_m / 111320.0, lon + east_m / (111320.0 * np.cos(np.radians(lat)))))
+    return points
+
+
+class DelayedClient:
+    """
+    Wraps a client so every `execute()` of a query built from it first sleeps
+    `latency_s`, as a round trip to Supabase would.
+    """
+
+    def __init__(self, target, latency_s: float):
+        self._target = target
+        self._latency_s = latency_s
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name == "execute":
+            def execute():
+                if self._latency_s:
+                    time.sleep(self._latency_s)
+                return attr()
+            return execute
+        if callable(attr):
+            def call(*args, **kwargs):
+                result = attr(*args, **kwargs)
+                if hasattr(result, "execute") or hasattr(result, "select"):
+                    return DelayedClient(result, self._latency_s)
+                return result
+            return call
+        return attr
+
+
+def fake_gemini_response(text: str):
+    """Mimics the parts of GenerateContentResponse that parse_gemini_response reads."""
+    part = SimpleNamespace(text=text)
+    return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+
+class FakeGeminiModel:
+    """
+    Answers every prompt after `latency_s` with a valid intent whose amenity
+    type is derived from the query text, so answers are deterministic. Batch
+    prompts get one intent per query.
+    """
+
+    TYPES = ["pharmacy", "doctors", "dentist", "clinic", "hospital"]
+
+    def __init__(self, latency_s: float = 0.0):
+        self.latency_s = latency_s
+        self.calls = 0
+
+    def _intent(self, query: str) -> Dict:
+        amenity_type = self.TYPES[zlib.crc32(query.encode()) % len(self.TYPES)]
+        return {"amenity_types": [amenity_type], "radius_m": 5000, "valid_query": True}
+
+    def _answer(self, prompt: str):
+        self.calls += 1
+        if "\nUser queries:\n" in prompt:
+            lines = prompt.rsplit("\nUser queries:\n", 1)[1].splitlines()
+            answer = []
+            for line in lines:
+                index, query = line.split(": ", 1)
+                answer.append({"index": int(index), **self._intent(json.loads(query))})
+        else:
+            answer = self._intent(prompt.rsplit("User query: ", 1)[-1])
+        return fake_gemini_response("```json\n" + json.dumps(answer) + "\n```")
+
+    def generate_content(self, prompt, **kwargs):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return self._answer(str(prompt))
+
+    async def generate_content_async(self, prompt, **kwargs):
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return self._answer(str(prompt))
@@ -0,0 +1,267 @@
+"""
+Offline load test and micro-benchmarks of the API.
+
+Supabase is replaced by an in-memory client holding a synthetic dataset and
+Gemini by a fake model, both with configurable injected latency. Each
+endpoint is driven in-process through its ASGI app; results (p50/p95/p99
+latency, requests per second, memory) are written as JSON and can be
+checked against an earlier run:
+
+    python -m benchmarks.run --sizes 1000,10000,100000 --output results.json
+    python -m benchmarks.run --baseline results.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+import db
+import main
+from api import amenities, chat
+from api.response_cache import response_cache
+from benchmarks.fakes import (DelayedClient, FakeGeminiModel, fake_gemini_response, random_points,
+                              synthetic_client, synthetic_rows)
+from poi.distance import haversine_m
+from poi.snapshot import snapshot_store
+from query_intent import analyze
+from query_intent.cache import intent_cache
+from query_intent.model import get_model, set_model
+
+CHAT_MESSAGES = [
+    "pharmacy near me",                          # answered by the local fast path
+    "I need a dentist within 2 km",
+    "ik zoek een apotheek",
+    "where can I get my flu shot",               # needs the model
+    "my dog is limping, who can look at it",
+    "something for a bad headache tonight",
+    "I think I broke my wrist",
+    "a place to check my blood pressure",
+]
+
+# What a user has typed so far in the search box, typos included
+SUGGEST_PREFIXES = ["p", "ph", "phar", "pharmacy 12", "dent", "dnetist", "hosp", "clinc", "vet"]
+
+
+def rss_mb() -> float:
+    """Resident set size of this process, in MiB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def install(rows: int, db_latency_s: float, llm_latency_s: float) -> Dict[str, float]:
+    """Points the app at a fresh synthetic dataset and fake model, and loads the snapshot."""
+    client = DelayedClient(synthetic_client(rows), db_latency_s)
+    db.supabase = client
+    set_model(FakeGeminiModel(llm_latency_s))
+    response_cache.clear()
+    intent_cache.clear()
+
+    snapshot_store._snapshot = None
+    before = rss_mb()
+    start = time.perf_counter()
+    snapshot_store.get()
+    return {"snapshot_load_s": time.perf_counter() - start, "snapshot_rss_mb": rss_mb() - before}
+
+
+def summarize(latencies: List[float], elapsed_s: float, errors: int) -> Dict[str, float]:
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "rps": len(latencies) / elapsed_s if elapsed_s else 0.0,
+    }
+
+
+async def load_test(send: Callable, requests: List[Any], concurrency: int) -> Dict[str, float]:
+    """Sends `requests` through `send(client, request)` from `concurrency` concurrent workers."""
+    latencies: List[float] = []
+    errors = 0
+    pending = iter(requests)
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def worker():
+            nonlocal errors
+            for request in pending:
+                start = time.perf_counter()
+                response = await send(client, request)
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code >= 400
+
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {**summarize(latencies, elapsed, errors), "rss_mb": rss_mb(), "rss_delta_mb": rss_mb() - rss_before}
+
+
+def endpoint_scenarios(rows: int, count: int, seed: int) -> Dict[str, tuple]:
+    rng = random.Random(seed)
+    points = random_points(count, seed)
+
+    async def nearby(client, point):
+        return await client.get("/amenities/", params={"lat": point[0], "lon": point[1], "limit": 50})
+
+    async def nearby_filtered(client, point):
+        return await client.get("/amenities/", params={"lat": point[0], "lon": point[1], "amenity": "pharm",
+                                                       "limit": 50})
+
+    async def nearby_named(client, point):
+        return await client.get("/amenities/", params={"lat": point[0], "lon": point[1], "name": "pharmacy 1",
+                                                       "limit": 50})
+
+    async def suggest(client, request):
+        point, typed = request
+        return await client.get("/amenities/suggest", params={"q": typed, "lat": point[0], "lon": point[1]})
+
+    async def listing(client, after_id):
+        return await client.get("/amenities/", params={"limit": 100, "cursor": amenities.encode_cursor(after_id)})
+
+    async def chat_message(client, request):
+        (lat, lon), message = request
+        return await client.post("/chat/", json={"message": message, "user_lat": lat, "user_lon": lon})
+
+    return {
+        "GET /amenities (nearby)": (nearby, points),
+        "GET /amenities (nearby, type filter)": (nearby_filtered, points),
+        "GET /amenities (nearby, name filter)": (nearby_named, points),
+        "GET /amenities/suggest": (suggest, [(p, rng.choice(SUGGEST_PREFIXES)) for p in points]),
+        "GET /amenities (list page)": (listing, [rng.randrange(rows) for _ in range(count)]),
+        "POST /chat": (chat_message, [(p, rng.choice(CHAT_MESSAGES)) for p in points]),
+    }
+
+
+def microbench(fn: Callable[[], Any], repeat: int = 5, min_time_s: float = 0.2) -> Dict[str, float]:
+    """Median time per call over `repeat` rounds, each long enough to time reliably."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= min_time_s / 10:
+            break
+        number *= 10
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+    return {"us_per_call": float(np.median(timings) * 1e6), "calls_per_round": number}
+
+
+def micro_benchmarks(seed: int) -> Dict[str, Dict[str, float]]:
+    rng = np.random.default_rng(seed)
+    lats, lons = rng.uniform(50.8, 51.3, 10_000), rng.uniform(3.7, 4.5, 10_000)
+    locations = synthetic_rows(200, seed)
+    metadata = json.dumps({"opening_hours": "Mo-Fr 09:00-12:30,13:30-18:30; Sa 09:00-12:00"})
+    response = fake_gemini_response('```json\n{"amenity_types": ["pharmacy"], "radius_m": 5000}\n```')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return {
+            "haversine (1 point)": microbench(lambda: haversine_m(51.22, 4.40, lats[:1], lons[:1])),
+            "haversine (10k points)": microbench(lambda: haversine_m(51.22, 4.40, lats, lons)),
+            "is_open": microbench(lambda: chat.is_open(metadata, "Wed 10:30")),
+            "rank_and_format_locations (200)": microbench(
+                lambda: chat.rank_and_format_locations(locations, 51.22, 4.40, "Wed 10:30")),
+            "parse_gemini_response": microbench(lambda: analyze.parse_gemini_response(response)),
+        }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Lists the measurements that got more than `tolerance` slower than in `baseline`."""
+    regressions = []
+    for size, run in results["datasets"].items():
+        for name, stats in run["endpoints"].items():
+            old = baseline.get("datasets", {}).get(size, {}).get("endpoints", {}).get(name)
+            if old and stats["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{name} @ {size} rows: p95 {old['p95_ms']:.2f} -> {stats['p95_ms']:.2f} ms")
+    for name, stats in results["micro"].items():
+        old = baseline.get("micro", {}).get(name)
+        if old and stats["us_per_call"] > old["us_per_call"] * (1 + tolerance):
+            regressions.append(f"{name}: {old['us_per_call']:.2f} -> {stats['us_per_call']:.2f} us/call")
+    return regressions
+
+
+def run(args) -> Dict:
+    results = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "datasets": {},
+        "micro": micro_benchmarks(args.seed),
+    }
+    for rows in args.sizes:
+        print(f"Dataset of {rows} rows", file=sys.stderr)
+        with contextlib.redirect_stdout(io.StringIO()):
+            setup = install(rows, args.db_latency_ms / 1000, args.llm_latency_ms / 1000)
+        endpoints = {}
+        for name, (send, requests) in endpoint_scenarios(rows, args.requests, args.seed).items():
+            with contextlib.redirect_stdout(io.StringIO()):
+                endpoints[name] = asyncio.run(load_test(send, requests, args.concurrency))
+            print(f"  {name}: p50 {endpoints[name]['p50_ms']:.2f} ms, p95 {endpoints[name]['p95_ms']:.2f} ms, "
+                  f"p99 {endpoints[name]['p99_ms']:.2f} ms, {endpoints[name]['rps']:.0f} req/s", file=sys.stderr)
+        results["datasets"][str(rows)] = {**setup, "endpoints": endpoints,
+                                          "llm_calls": get_model().calls}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline API load test and micro-benchmarks.")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        type=lambda s: [int(n) for n in s.split(",")], help="Dataset sizes, comma-separated")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per endpoint and dataset")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="Injected delay per Supabase query")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Injected delay per Gemini call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    results = run(args)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,103 @@
+"""
+Cold-start budget check: how long a fresh process takes to import the app
+and to answer its first requests, against a budget in milliseconds.
+
+Every run is a new interpreter (`--child`), so nothing is warm; Supabase and
+Gemini are replaced by the offline fakes. Exits with 1 when the median of a
+measurement exceeds its budget:
+
+    python -m benchmarks.startup --runs 5 --import-budget-ms 1000 --first-request-budget-ms 1500
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+
+def measure_child(rows: int) -> Dict[str, float]:
+    """Runs in the fresh interpreter: imports the app, starts it and sends one request per endpoint."""
+    start = time.perf_counter()
+    import main
+    import_ms = (time.perf_counter() - start) * 1000
+
+    import httpx
+    import db
+    from benchmarks.fakes import FakeGeminiModel, synthetic_client
+    from query_intent.model import set_model
+
+    db.supabase = synthetic_client(rows)
+    set_model(FakeGeminiModel())
+
+    async def first_requests() -> Dict[str, float]:
+        timings = {"import_ms": import_ms}
+        start = time.perf_counter()
+        async with main.app.router.lifespan_context(main.app):
+            timings["startup_ms"] = (time.perf_counter() - start) * 1000
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+                start = time.perf_counter()
+                response = await client.get("/amenities/", params={"lat": 51.22, "lon": 4.40, "limit": 10})
+                response.raise_for_status()
+                timings["first_amenities_ms"] = (time.perf_counter() - start) * 1000
+
+                start = time.perf_counter()
+                response = await client.post("/chat/", json={"message": "where can I get my flu shot",
+                                                             "user_lat": 51.22, "user_lon": 4.40})
+                response.raise_for_status()
+                timings["first_chat_ms"] = (time.perf_counter() - start) * 1000
+        # What a cold start costs the first user: import, startup and their request
+        timings["first_request_ms"] = import_ms + timings["startup_ms"] + timings["first_amenities_ms"]
+        return timings
+
+    return asyncio.run(first_requests())
+
+
+def run_child(rows: int, startup_mode: str) -> Dict[str, float]:
+    env = {**os.environ, "STARTUP_MODE": startup_mode, "SUPABASE_URL": "memory://"}
+    completed = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--child", "--rows", str(rows)],
+                               capture_output=True, text=True, env=env, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def check(medians: Dict[str, float], budgets: Dict[str, float]) -> List[str]:
+    """Lists the measurements over their budget."""
+    return [f"{name}: {medians[name]:.0f} ms > budget {budget:.0f} ms"
+            for name, budget in budgets.items() if budget is not None and medians[name] > budget]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure import time and first-request latency of a cold start.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes to measure")
+    parser.add_argument("--rows", type=int, default=10000, help="Size of the synthetic dataset")
+    parser.add_argument("--startup-mode", default="lazy", choices=["lazy", "eager"])
+    parser.add_argument("--import-budget-ms", type=float, default=1000)
+    parser.add_argument("--first-request-budget-ms", type=float, default=2500,
+                        help="Budget for import, startup and the first /amenities request together")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                timings = measure_child(args.rows)
+            finally:
+                sys.stdout = stdout
+        print(json.dumps(timings))
+        sys.exit(0)
+
+    runs = [run_child(args.rows, args.startup_mode) for _ in range(args.runs)]
+    medians = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+    for name, value in medians.items():
+        print(f"{name}: {value:.1f} ms (median of {args.runs})", file=sys.stderr)
+
+    failures = check(medians, {"import_ms": args.import_budget_ms,
+                               "first_request_ms": args.first_request_budget_ms})
+    for failure in failures:
+        print(f"OVER BUDGET {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
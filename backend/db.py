@@ -1,7 +1,7 @@
 import os
+import threading
 
 from dotenv import load_dotenv
-from supabase import create_client
 
 load_dotenv()
 
@@ -9,4 +9,50 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
\ No newline at end of file
+_client_lock = threading.Lock()
+
+
+def _create_client():
+    if SUPABASE_URL and SUPABASE_URL.startswith("memory://"):
+        # Local stand-in, e.g. SUPABASE_URL=memory://data/medical_amenities_cleaned.csv (memory:// starts empty)
+        from db_memory import MemoryClient
+
+        csv_path = SUPABASE_URL[len("memory://"):]
+        return MemoryClient.from_csv(csv_path) if csv_path else MemoryClient()
+
+    if SUPABASE_URL and SUPABASE_URL.startswith(("postgres://", "postgresql://")):
+        # Straight to Postgres through an asyncpg pool instead of the REST API (see db_postgres.py)
+        from db_postgres import PostgresClient
+
+        return PostgresClient(SUPABASE_URL)
+
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+def get_supabase():
+    """
+    The shared Supabase client, created on first use so that importing the
+    app does not load the Supabase SDK. Assigning `db.supabase` replaces it.
+    """
+    client = globals().get("supabase")
+    if client is None:
+        with _client_lock:
+            client = globals().get("supabase")
+            if client is None:
+                client = globals()["supabase"] = _create_client()
+    return client
+
+
+def close_supabase() -> None:
+    """Releases the client's connections, for clients that hold any."""
+    client = globals().pop("supabase", None)
+    if client is not None and hasattr(client, "close"):
+        client.close()
+
+
+def __getattr__(name: str):
+    # `from db import supabase` keeps working, creating the client on first access
+    if name == "supabase":
+        return get_supabase()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
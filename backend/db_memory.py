@@ -0,0 +1,236 @@
+"""
+In-memory stand-in for the Supabase client, covering the subset of the
+PostgREST query builder this service uses. Select it with
+SUPABASE_URL=memory://path/to/medical_amenities_cleaned.csv to run the API
+locally without a database.
+"""
+import ast
+import json
+import math
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+
+
+class MemoryResponse:
+    def __init__(self, data: List[Dict]):
+        self.data = data
+
+
+def _value(row: Dict, column: str) -> Any:
+    if "->>" in column:
+        column, key = column.split("->>", 1)
+        value = row.get(column)
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except json.JSONDecodeError:
+                return None
+        value = (value or {}).get(key)
+        return None if value is None else str(value)
+    return row.get(column)
+
+
+def _like(pattern: str) -> re.Pattern:
+    regex = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in pattern)
+    return re.compile(regex, re.IGNORECASE | re.DOTALL)
+
+
+class MemoryQuery:
+    """A chainable query over the rows of one in-memory table."""
+
+    def __init__(self, table: "MemoryTable", rows: Optional[List[Dict]] = None):
+        self._table = table
+        self._rows = rows
+        self._filters: List[Callable[[Dict], bool]] = []
+        self._columns: Optional[List[str]] = None
+        self._order: List[tuple] = []
+        self._offset = 0
+        self._limit: Optional[int] = None
+
+    def select(self, columns: str = "*", **kwargs) -> "MemoryQuery":
+        names = [c.strip() for c in columns.split(",")]
+        self._columns = None if "*" in names else names
+        return self
+
+    def _filter(self, column: str, check: Callable[[Any], bool]) -> "MemoryQuery":
+        self._filters.append(lambda row: check(_value(row, column)))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, lambda v: v == value)
+
+    def neq(self, column, value):
+        return self._filter(column, lambda v: v != value)
+
+    def gt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v > value)
+
+    def gte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v >= value)
+
+    def lt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v < value)
+
+    def lte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v <= value)
+
+    def in_(self, column, values):
+        values = set(values)
+        return self._filter(column, lambda v: v in values)
+
+    def ilike(self, column, pattern):
+        regex = _like(pattern)
+        return self._filter(column, lambda v: v is not None and regex.fullmatch(str(v)) is not None)
+
+    def order(self, column: str, desc: bool = False, **kwargs) -> "MemoryQuery":
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size: int, **kwargs) -> "MemoryQuery":
+        self._limit = size
+        return self
+
+    def range(self, start: int, end: int, **kwargs) -> "MemoryQuery":
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def execute(self) -> MemoryResponse:
+        rows = self._table.rows if self._rows is None else self._rows
+        rows = [row for row in rows if all(check(row) for check in self._filters)]
+        for column, desc in reversed(self._order):
+            rows.sort(key=lambda row: (_value(row, column) is None, _value(row, column)), reverse=desc)
+        end = None if self._limit is None else self._offset + self._limit
+        rows = rows[self._offset:end]
+        if self._columns is not None:
+            rows = [{c: row.get(c) for c in self._columns} for row in rows]
+        else:
+            rows = [dict(row) for row in rows]
+        return MemoryResponse(rows)
+
+
+class MemoryInsert:
+    def __init__(self, table: "MemoryTable", data):
+        self._table = table
+        self._data = data if isinstance(data, list) else [data]
+
+    def execute(self) -> MemoryResponse:
+        inserted = [self._table.insert_row(dict(row)) for row in self._data]
+        return MemoryResponse(inserted)
+
+
+class MemoryUpsert:
+    def __init__(self, table: "MemoryTable", data, on_conflict: str = "id"):
+        self._table = table
+        self._data = data if isinstance(data, list) else [data]
+        self._on_conflict = on_conflict
+
+    def execute(self) -> MemoryResponse:
+        return MemoryResponse(self._table.upsert_rows([dict(row) for row in self._data], self._on_conflict))
+
+
+class MemoryTable:
+    def __init__(self, rows: Optional[List[Dict]] = None):
+        self.rows: List[Dict] = []
+        self._next_id = 1
+        for row in rows or []:
+            self.insert_row(row)
+
+    def insert_row(self, row: Dict) -> Dict:
+        if row.get("id") is None:
+            row["id"] = self._next_id
+        self._next_id = max(self._next_id, int(row["id"]) + 1)
+        self.rows.append(row)
+        return row
+
+    def upsert_rows(self, rows: List[Dict], on_conflict: str = "id") -> List[Dict]:
+        """Updates the rows matching on the `on_conflict` columns in place and inserts the rest."""
+        keys = [c.strip() for c in on_conflict.split(",")]
+        existing = {tuple(row.get(k) for k in keys): row for row in self.rows}
+        upserted = []
+        for row in rows:
+            match = existing.get(tuple(row.get(k) for k in keys))
+            if match is not None:
+                match.update(row)
+                upserted.append(match)
+            else:
+                upserted.append(self.insert_row(row))
+                existing[tuple(row.get(k) for k in keys)] = row
+        return upserted
+
+
+class MemoryTableRef:
+    """What `client.table(name)` returns: the entry point for reads and writes."""
+
+    def __init__(self, table: MemoryTable):
+        self._table = table
+
+    def select(self, columns: str = "*", **kwargs) -> MemoryQuery:
+        return MemoryQuery(self._table).select(columns)
+
+    def insert(self, data, **kwargs) -> MemoryInsert:
+        return MemoryInsert(self._table, data)
+
+    def upsert(self, data, on_conflict: str = "id", **kwargs) -> MemoryUpsert:
+        return MemoryUpsert(self._table, data, on_conflict)
+
+
+class MemoryClient:
+    """Drop-in replacement for `supabase.create_client(...)` backed by Python lists."""
+
+    def __init__(self, tables: Optional[Dict[str, List[Dict]]] = None):
+        self.tables: Dict[str, MemoryTable] = {name: MemoryTable(rows) for name, rows in (tables or {}).items()}
+        self.functions: Dict[str, Callable[["MemoryClient", Dict], List[Dict]]] = {
+            "nearby_amenities": _nearby_amenities,
+        }
+
+    @classmethod
+    def from_csv(cls, path: str) -> "MemoryClient":
+        """Loads a cleaned amenities CSV (data/medical_amenities_cleaned.csv) into medical_amenity."""
+        import pandas as pd
+        df = pd.read_csv(path)
+        rows = []
+        for record in df.to_dict("records"):
+            metadata = record.get("metadata")
+            metadata = ast.literal_eval(metadata) if isinstance(metadata, str) else {}
+            lat, lon = record.get("lat"), record.get("lon")
+            rows.append({
+                "id": int(record["id"]),
+                "amenity_type": record.get("amenity"),
+                "metadata": json.dumps(metadata),
+                "lat": None if pd.isna(lat) else float(lat),
+                "lon": None if pd.isna(lon) else float(lon),
+            })
+        return cls({"medical_amenity": rows})
+
+    def table(self, name: str) -> MemoryTableRef:
+        return MemoryTableRef(self.tables.setdefault(name, MemoryTable()))
+
+    def rpc(self, name: str, params: Optional[Dict] = None) -> MemoryQuery:
+        rows = self.functions[name](self, params or {})
+        return MemoryQuery(MemoryTable(), rows)
+
+
+def _nearby_amenities(client: MemoryClient, params: Dict) -> List[Dict]:
+    """Python twin of sql/nearby_amenities.sql."""
+    lat, lon, radius_m = params["p_lat"], params["p_lon"], params["p_radius_m"]
+    amenity_types = params.get("p_amenity_types")
+    dlat = radius_m / 110574.0
+    dlon = radius_m / (110574.0 * max(math.cos(math.radians(min(89.0, abs(lat) + dlat))), 1e-6))
+    hits = []
+    for row in client.tables.get("medical_amenity", MemoryTable()).rows:
+        if row.get("lat") is None or row.get("lon") is None:
+            continue
+        if abs(row["lat"] - lat) > dlat or abs(row["lon"] - lon) > dlon:
+            continue
+        if amenity_types and row.get("amenity_type") not in amenity_types:
+            continue
+        φ1, φ2 = math.radians(lat), math.radians(row["lat"])
+        a = (math.sin((φ2 - φ1) / 2) ** 2
+             + math.cos(φ1) * math.cos(φ2) * math.sin(math.radians(row["lon"] - lon) / 2) ** 2)
+        distance = 2 * 6371008.8 * math.asin(math.sqrt(a))
+        if distance <= radius_m:
+            hits.append((distance, row))
+    hits.sort(key=lambda hit: hit[0])
+    limit = params.get("p_limit")
+    return [row for _, row in hits[:limit]]
@@ -1,10 +1,83 @@
-from fastapi import FastAPI
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+
+import metrics
 from api import amenities, chat
+from db import close_supabase
+from poi.queries import POI_LOOKUP
+from poi.snapshot import snapshot_store
+
+# "eager" loads the amenity snapshot before taking requests and refreshes it from a background
+# thread. "lazy" (the default on Vercel) starts serving at once: the snapshot, the Supabase
+# client and the Gemini model are all created by the first request that needs them.
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy" if os.getenv("VERCEL") else "eager")
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if POI_LOOKUP != "db" and STARTUP_MODE == "eager":
+        await asyncio.to_thread(snapshot_store.start)
+    yield
+    snapshot_store.stop()
+    close_supabase()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(amenities.router, prefix="/amenities", tags=["Amenities"])
 app.include_router(chat.router, prefix="/chat", tags=["Chat"])
 
+# cProfile and pyinstrument can only profile one request at a time
+_profile_lock = threading.Lock()
+
+
+def _route_template(scope) -> str:
+    """The matched path template (e.g. /amenities/search), which keeps the metric labels bounded."""
+    # Routes of an included router only know their path relative to its prefix
+    included = getattr(scope.get("fastapi", {}).get("effective_route_context"), "path_format", None)
+    return included or getattr(scope.get("route"), "path", "unmatched")
+
+
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    """
+    Times every request, reports its stages in the Server-Timing header and
+    profiles it when PROFILING_ENABLED=1 and the request sends X-Profile: 1.
+    """
+    timings = metrics.start_request()
+    profiler = None
+    if metrics.PROFILING_ENABLED and request.headers.get("x-profile") == "1" and _profile_lock.acquire(False):
+        profiler = metrics.RequestProfiler(request.url.path)
+        profiler.start()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        if profiler is not None:
+            report = profiler.stop()
+            _profile_lock.release()
+    elapsed = time.perf_counter() - start
+
+    route = _route_template(request.scope)
+    metrics.http_requests.inc(method=request.method, route=route, status=response.status_code)
+    metrics.http_duration.observe(elapsed, method=request.method, route=route)
+    response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed)
+    if profiler is not None:
+        response.headers["X-Profile-Report"] = report
+    return response
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Counters and histograms in the Prometheus text exposition format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
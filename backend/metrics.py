@@ -0,0 +1,203 @@
+"""
+Lightweight request instrumentation: per-stage timings reported in the
+Server-Timing header of the request they belong to, and process-wide
+counters and histograms rendered in the Prometheus text format on /metrics.
+
+Recording a stage costs two perf_counter calls and a lock, so it stays on
+in production.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond lookups to slow model calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(n, "")) for n in self.labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts with a final +Inf bucket, sum, count)
+        self._values: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+REGISTRY: List = []
+
+http_requests = Counter("http_requests_total", "HTTP requests served.", ("method", "route", "status"))
+http_duration = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+stage_duration = Histogram("stage_duration_seconds", "Time spent per request stage.", ("stage",))
+cache_requests = Counter("cache_requests_total", "Cache lookups by cache and result.", ("cache", "result"))
+llm_calls = Counter("llm_calls_total", "Calls to the intent model by outcome.", ("outcome",))
+llm_duration = Histogram("llm_call_duration_seconds", "Latency of calls to the intent model.")
+llm_hedges = Counter("llm_hedged_calls_total", "Hedged (duplicate) calls sent to the intent model.")
+intent_sources = Counter("intent_resolved_total", "Resolved intents by the stage that answered.", ("source",))
+intent_retries = Counter("intent_retries_total", "Intent analysis attempts beyond the first.")
+result_rows = Histogram("lookup_rows", "Rows returned by amenity lookups.", ("stage",),
+                        buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000))
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# Per-request list of (name, milliseconds or None, description), set by the middleware
+_timings: ContextVar[Optional[List[Tuple[str, Optional[float], str]]]] = ContextVar("timings", default=None)
+
+
+def start_request() -> List[Tuple[str, Optional[float], str]]:
+    timings: List[Tuple[str, Optional[float], str]] = []
+    _timings.set(timings)
+    return timings
+
+
+def record(stage: str, seconds: float) -> None:
+    """Records a stage duration for the histogram and, inside a request, its Server-Timing header."""
+    stage_duration.observe(seconds, stage=stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((stage, seconds * 1000, ""))
+
+
+def annotate(name: str, value) -> None:
+    """Adds a value without duration (a row count, a retry count) to the request's Server-Timing header."""
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, None, str(value)))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def count_cache(cache: str, value):
+    """Counts a cache lookup as a hit or a miss and passes its result through."""
+    cache_requests.inc(cache=cache, result="miss" if value is None else "hit")
+    return value
+
+
+def server_timing(timings: List[Tuple[str, Optional[float], str]], total_s: float) -> str:
+    entries = []
+    for name, duration_ms, description in timings:
+        entry = name
+        if duration_ms is not None:
+            entry += f";dur={duration_ms:.2f}"
+        if description:
+            entry += f';desc="{description}"'
+        entries.append(entry)
+    entries.append(f"total;dur={total_s * 1000:.2f}")
+    return ", ".join(entries)
+
+
+class RequestProfiler:
+    """
+    Profiles one request when PROFILING_ENABLED=1 and the client asks for it.
+    Uses pyinstrument's sampling profiler when installed, cProfile otherwise,
+    and writes the report to PROFILE_DIR.
+    """
+
+    def __init__(self, label: str):
+        self.label = label.strip("/").replace("/", "_") or "root"
+        try:
+            from pyinstrument import Profiler
+            self._profiler = Profiler(interval=0.001, async_mode="enabled")
+            self._sampling = True
+        except ImportError:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._sampling = False
+
+    def start(self) -> None:
+        if self._sampling:
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self) -> str:
+        """Stops profiling and returns the path of the report."""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stem = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-{time.time_ns() % 10**9}-{self.label}")
+        if self._sampling:
+            self._profiler.stop()
+            path = stem + ".html"
+            with open(path, "w") as f:
+                f.write(self._profiler.output_html())
+        else:
+            self._profiler.disable()
+            path = stem + ".prof"
+            self._profiler.dump_stats(path)
+        return path
@@ -0,0 +1,207 @@
+"""
+Versioned binary snapshot of medical_amenity that uvicorn workers memory-map
+instead of each loading their own copy (build it with scripts/build_dataset.py).
+
+Layout: an 8-byte magic, the little-endian u32 length of a JSON table of
+contents, the table of contents itself, then 64-byte aligned sections:
+
+    ids          int64[n]
+    lat, lon     float64[n]        NaN when unknown
+    type_code    uint16[n]         index into the amenity type names
+    meta_offset  uint64[n + 1]     row i's metadata is heap[meta_offset[i]:meta_offset[i + 1]]
+    heap         uint8[...]        UTF-8 metadata JSON strings, back to back
+    has_embedding uint8[n]
+    embedding    float32[n, dim]   zeros where has_embedding is 0
+    hours_code   uint32[n]         index into the distinct opening_hours strings, "" when there are none
+
+Arrays are read-only views on the mapping, so every process mapping the
+same file shares one copy of its pages through the page cache.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+MAGIC = b"POIDSET1"
+ALIGNMENT = 64
+DATASET_PATH = os.getenv("POI_DATASET_PATH")
+
+
+def parse_embedding(value) -> Optional[List[float]]:
+    # pgvector columns come back from PostgREST as "[0.1,0.2,...]" strings
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return json.loads(value)
+    return list(value)
+
+
+def _opening_hours_text(metadata) -> str:
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except json.JSONDecodeError:
+            return ""
+    raw = metadata.get("opening_hours") if isinstance(metadata, dict) else None
+    return raw if isinstance(raw, str) else ""
+
+
+def write_dataset(path: str, rows: Iterable[Dict], version: str) -> int:
+    """
+    Writes medical_amenity rows (id, amenity_type, metadata, lat, lon and
+    optionally embedding) to `path`. The file is written next to it and
+    moved into place, so readers never map a partial file.
+
+    Returns:
+        int: The number of rows written.
+    """
+    rows = sorted(rows, key=lambda row: row["id"])
+    n = len(rows)
+    types = sorted({row.get("amenity_type") or "" for row in rows})
+    type_codes = {name: code for code, name in enumerate(types)}
+
+    metadata = [(row.get("metadata") or "").encode() if not isinstance(row.get("metadata"), dict)
+                else json.dumps(row["metadata"]).encode() for row in rows]
+    meta_offset = np.zeros(n + 1, dtype=np.uint64)
+    np.cumsum([len(m) for m in metadata], out=meta_offset[1:])
+
+    embeddings = [parse_embedding(row.get("embedding")) for row in rows]
+    dim = next((len(e) for e in embeddings if e), 0)
+    embedding = np.zeros((n, dim), dtype=np.float32)
+    has_embedding = np.zeros(n, dtype=np.uint8)
+    for i, vector in enumerate(embeddings):
+        if vector:
+            embedding[i] = vector
+            has_embedding[i] = 1
+
+    hours = [_opening_hours_text(row.get("metadata")) for row in rows]
+    hours_names = sorted(set(hours) | {""})
+    hours_codes = {text: code for code, text in enumerate(hours_names)}
+
+    def coordinate(row, key):
+        value = row.get(key)
+        return np.nan if value is None else float(value)
+
+    sections = {
+        "ids": np.array([row["id"] for row in rows], dtype=np.int64),
+        "lat": np.array([coordinate(row, "lat") for row in rows], dtype=np.float64),
+        "lon": np.array([coordinate(row, "lon") for row in rows], dtype=np.float64),
+        "type_code": np.array([type_codes[row.get("amenity_type") or ""] for row in rows], dtype=np.uint16),
+        "meta_offset": meta_offset,
+        "heap": np.frombuffer(b"".join(metadata), dtype=np.uint8),
+        "has_embedding": has_embedding,
+        "embedding": embedding,
+        "hours_code": np.array([hours_codes[text] for text in hours], dtype=np.uint32),
+    }
+
+    # Place the sections after a table of contents sized with room for their offsets
+    toc = {"version": version, "rows": n, "dim": dim, "amenity_types": types, "opening_hours": hours_names,
+           "sections": {}}
+    toc_size = len(json.dumps(toc)) + 100 * len(sections) + 64
+    offset = _align(len(MAGIC) + 4 + toc_size)
+    for name, array in sections.items():
+        toc["sections"][name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+        offset = _align(offset + array.nbytes)
+    toc_bytes = json.dumps(toc).encode()
+    assert len(toc_bytes) <= toc_size, "table of contents outgrew its reserved space"
+    toc_bytes = toc_bytes.ljust(toc_size)
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", toc_size) + toc_bytes)
+        for name, array in sections.items():
+            f.seek(toc["sections"][name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(max(offset, f.tell()))
+    os.replace(tmp_path, path)
+    return n
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class MappedDataset:
+    """Read-only, zero-copy view of a dataset file written by `write_dataset`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.file_id = (stat.st_ino, stat.st_mtime_ns)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a POI dataset file")
+        (toc_size,) = struct.unpack_from("<I", self._mmap, len(MAGIC))
+        toc = json.loads(self._mmap[len(MAGIC) + 4:len(MAGIC) + 4 + toc_size])
+        self.version: str = toc["version"]
+        self.dim: int = toc["dim"]
+        self.amenity_types: List[str] = toc["amenity_types"]
+        self.opening_hours: List[str] = toc.get("opening_hours", [])
+
+        arrays = {}
+        for name, section in toc["sections"].items():
+            count = int(np.prod(section["shape"], dtype=np.int64))
+            array = np.frombuffer(self._mmap, dtype=np.dtype(section["dtype"]), count=count, offset=section["offset"])
+            arrays[name] = array.reshape(section["shape"])
+        self.ids: np.ndarray = arrays["ids"]
+        self.lat: np.ndarray = arrays["lat"]
+        self.lon: np.ndarray = arrays["lon"]
+        self.type_code: np.ndarray = arrays["type_code"]
+        self.has_embedding: np.ndarray = arrays["has_embedding"]
+        self.embedding: np.ndarray = arrays["embedding"]
+        # None in files written before opening hours were split out of the metadata
+        self.hours_code: Optional[np.ndarray] = arrays.get("hours_code")
+        self._meta_offset = arrays["meta_offset"]
+        self._heap = arrays["heap"]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def metadata(self, i: int) -> str:
+        start, end = int(self._meta_offset[i]), int(self._meta_offset[i + 1])
+        return self._heap[start:end].tobytes().decode()
+
+    def row(self, i: int) -> Dict:
+        """Row `i` in the shape medical_amenity rows come back from the database."""
+        lat, lon = float(self.lat[i]), float(self.lon[i])
+        return {
+            "id": int(self.ids[i]),
+            "amenity_type": self.amenity_types[self.type_code[i]] or None,
+            "metadata": self.metadata(i) or None,
+            "lat": None if np.isnan(lat) else lat,
+            "lon": None if np.isnan(lon) else lon,
+        }
+
+    def rows(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self.row(i)
+
+
+_dataset: Optional[MappedDataset] = None
+_dataset_lock = threading.Lock()
+
+
+def get_mapped_dataset(path: Optional[str] = None) -> Optional[MappedDataset]:
+    """
+    The dataset at `path` (default POI_DATASET_PATH), or None when no dataset
+    is configured. Once the build script has replaced the file, the next call
+    maps the new version; views handed out earlier keep the old mapping.
+    """
+    global _dataset
+    path = path or DATASET_PATH
+    if not path:
+        return None
+    stat = os.stat(path)
+    current = _dataset
+    if current is not None and current.path == path and current.file_id == (stat.st_ino, stat.st_mtime_ns):
+        return current
+    with _dataset_lock:
+        if _dataset is None or _dataset.path != path or _dataset.file_id != (stat.st_ino, stat.st_mtime_ns):
+            _dataset = MappedDataset(path)
+        return _dataset
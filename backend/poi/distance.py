@@ -0,0 +1,113 @@
+import math
+import os
+from typing import Sequence, Union
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8  # mean Earth radius
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+# Shortest distance a degree of latitude spans under either method, for sizing search boxes: the
+# haversine sphere has 111195 m per degree, the WGS-84 ellipsoid 110574 m at the equator. A box this
+# many degrees per meter wide always contains the search circle.
+METERS_PER_DEG_LAT = min(math.radians(EARTH_RADIUS_M), 110574.0)
+
+HAVERSINE = "haversine"
+GEODESIC = "geodesic"
+DISTANCE_METHOD = os.getenv("POI_DISTANCE_METHOD", HAVERSINE)
+
+ArrayLike = Union[float, Sequence[float], np.ndarray]
+
+
+def haversine_m(lat: float, lon: float, lats: ArrayLike, lons: ArrayLike) -> np.ndarray:
+    """
+    Great-circle distance in meters from one point to an array of points.
+
+    Args:
+        lat (float): Latitude of the origin.
+        lon (float): Longitude of the origin.
+        lats (ArrayLike): Latitudes of the targets.
+        lons (ArrayLike): Longitudes of the targets.
+
+    Returns:
+        np.ndarray: float64 distances, one per target.
+    """
+    φ1 = np.radians(lat)
+    φ2 = np.radians(np.asarray(lats, dtype=np.float64))
+    Δφ = φ2 - φ1
+    Δλ = np.radians(np.asarray(lons, dtype=np.float64) - lon)
+    a = np.sin(Δφ / 2) ** 2 + np.cos(φ1) * np.cos(φ2) * np.sin(Δλ / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def geodesic_m(lat: float, lon: float, lats: ArrayLike, lons: ArrayLike, iterations: int = 20) -> np.ndarray:
+    """
+    Ellipsoidal (WGS-84) distance in meters from one point to an array of
+    points, using Vincenty's inverse formula evaluated on the whole array.
+
+    Agrees with `geopy.distance.geodesic` to well under a millimeter at the
+    distances we search over. The rare nearly-antipodal pairs where the
+    iteration does not converge fall back to the haversine distance.
+
+    Args:
+        lat (float): Latitude of the origin.
+        lon (float): Longitude of the origin.
+        lats (ArrayLike): Latitudes of the targets.
+        lons (ArrayLike): Longitudes of the targets.
+        iterations (int, optional): Fixed number of lambda iterations. Defaults to 20.
+
+    Returns:
+        np.ndarray: float64 distances, one per target.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    f, a, b = WGS84_F, WGS84_A, WGS84_B
+
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lats)))
+    L = np.radians(lons - lon)
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(iterations):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cosU2 * sin_lam, cosU1 * sinU2 - sinU1 * cosU2 * cos_lam)
+            cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cosU1 * cosU2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            cos_2sm = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha)
+            C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            lam_prev = lam
+            lam = L + (1 - C) * f * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sm + C * cos_sigma * (-1 + 2 * cos_2sm ** 2)))
+        converged = np.abs(lam - lam_prev) < 1e-12
+
+        u2 = cos2_alpha * (a ** 2 - b ** 2) / b ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (cos_2sm + B / 4 * (
+                cos_sigma * (-1 + 2 * cos_2sm ** 2) - B / 6 * cos_2sm * (-3 + 4 * sin_sigma ** 2) * (
+                -3 + 4 * cos_2sm ** 2)))
+        distance = b * A * (sigma - delta_sigma)
+
+    bad = ~converged | ~np.isfinite(distance)
+    if np.any(bad):
+        distance = np.where(bad, haversine_m(lat, lon, lats, lons), distance)
+    return distance
+
+
+def distances_m(lat: float, lon: float, lats: ArrayLike, lons: ArrayLike, method: str = None) -> np.ndarray:
+    """
+    Distance in meters from one point to an array of points using the given
+    method ("haversine" or "geodesic"), or POI_DISTANCE_METHOD when omitted.
+    """
+    method = method or DISTANCE_METHOD
+    if method == GEODESIC:
+        return geodesic_m(lat, lon, lats, lons)
+    if method == HAVERSINE:
+        return haversine_m(lat, lon, lats, lons)
+    raise ValueError(f"Unknown distance method: {method}")
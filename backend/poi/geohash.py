@@ -0,0 +1,36 @@
+from typing import Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_bounds(lat: float, lon: float, precision: int) -> Tuple[str, float, float, float, float]:
+    """
+    Encodes a point as a geohash of `precision` characters.
+
+    Returns:
+        Tuple[str, float, float, float, float]: The geohash and the
+            (lat_min, lat_max, lon_min, lon_max) bounds of its cell.
+    """
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            value = value * 2 + (lon >= mid)
+            lon_lo, lon_hi = (mid, lon_hi) if lon >= mid else (lon_lo, mid)
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            value = value * 2 + (lat >= mid)
+            lat_lo, lat_hi = (mid, lat_hi) if lat >= mid else (lat_lo, mid)
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars), lat_lo, lat_hi, lon_lo, lon_hi
+
+
+def geohash_cell(lat: float, lon: float, precision: int) -> Tuple[str, float, float]:
+    """The geohash of the point and the centre of its cell."""
+    geohash, lat_lo, lat_hi, lon_lo, lon_hi = geohash_bounds(lat, lon, precision)
+    return geohash, (lat_lo + lat_hi) / 2, (lon_lo + lon_hi) / 2
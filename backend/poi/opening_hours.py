@@ -0,0 +1,196 @@
+import bisect
+import json
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
+
+DAYS = ["Mo", "Tu", "We", "Th", "Fr", "Sa", "Su"]
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+_DAY = r"(?:Mo|Tu|We|Th|Fr|Sa|Su|PH|SH)"
+_DAY_SELECTOR = re.compile(rf"^({_DAY}(?:-{_DAY})?(?:\s*,\s*{_DAY}(?:-{_DAY})?)*)(?:\s+|$)")
+_TIME_SPAN = re.compile(r"^(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\+?$")
+# A comma followed by a day name starts an additional rule ("Mo-Sa 09:00-12:30, Mo-Fr 13:30-18:30")
+_ADDITIONAL_RULE = re.compile(rf"(?<=\d)\s*,\s*(?={_DAY}\b)")
+_COMMENT = re.compile(r'"[^"]*"')
+
+
+class OpeningHours:
+    """
+    An OSM `opening_hours` value compiled into a minute-of-week bitmap plus
+    the sorted list of opening intervals it was built from.
+
+    Minute 0 is Monday 00:00. `is_open` is a single bit test and `next_open`
+    a bisect over a handful of intervals, so both are effectively constant
+    time however often they are called.
+    """
+
+    __slots__ = ("raw", "intervals", "_bitmap", "_starts")
+
+    def __init__(self, raw: str, intervals: List[Tuple[int, int]]):
+        self.raw = raw
+        self.intervals = intervals  # sorted, non-overlapping [start, end) in minutes of week
+        self._starts = [start for start, _ in intervals]
+        bitmap = bytearray(MINUTES_PER_WEEK // 8)
+        for start, end in intervals:
+            for minute in range(start, end):
+                bitmap[minute >> 3] |= 1 << (minute & 7)
+        self._bitmap = bytes(bitmap)
+
+    def is_open(self, minute_of_week: int) -> bool:
+        minute = minute_of_week % MINUTES_PER_WEEK
+        return bool(self._bitmap[minute >> 3] & (1 << (minute & 7)))
+
+    def next_open(self, minute_of_week: int) -> Optional[int]:
+        """
+        Returns the minute of the week at which the location next opens, the
+        given minute itself if it is open right now, or None if it never opens.
+        """
+        if not self.intervals:
+            return None
+        minute = minute_of_week % MINUTES_PER_WEEK
+        if self.is_open(minute):
+            return minute
+        i = bisect.bisect_right(self._starts, minute)
+        return self._starts[i] if i < len(self._starts) else self._starts[0]
+
+
+def _expand_days(selector: str) -> List[int]:
+    days = []
+    for part in re.split(r"\s*,\s*", selector):
+        if "-" in part:
+            first, last = part.split("-")
+            if first not in DAYS or last not in DAYS:
+                continue
+            i, j = DAYS.index(first), DAYS.index(last)
+            days.extend(k % 7 for k in range(i, i + (j - i) % 7 + 1))
+        elif part in DAYS:
+            days.append(DAYS.index(part))
+    return days
+
+
+def _parse_spans(times: str) -> Optional[List[Tuple[int, int]]]:
+    spans = []
+    for part in re.split(r"\s*,\s*", times):
+        match = _TIME_SPAN.match(part)
+        if not match:
+            return None
+        h1, m1, h2, m2 = map(int, match.groups())
+        start, end = h1 * 60 + m1, h2 * 60 + m2
+        if start > MINUTES_PER_DAY or end > MINUTES_PER_DAY:
+            return None
+        if end <= start:
+            end += MINUTES_PER_DAY  # runs past midnight
+        spans.append((start, end))
+    return spans
+
+
+def _merge(intervals: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    # Unroll the week boundary so every interval lies within [0, MINUTES_PER_WEEK)
+    flat = []
+    for start, end in intervals:
+        if end > MINUTES_PER_WEEK:
+            flat.append((start, MINUTES_PER_WEEK))
+            flat.append((0, end - MINUTES_PER_WEEK))
+        else:
+            flat.append((start, end))
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(flat):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+@lru_cache(maxsize=4096)
+def compile_opening_hours(raw: str) -> Optional[OpeningHours]:
+    """
+    Compiles an OSM `opening_hours` string such as
+    "Mo-Fr 09:00-18:30; Sa 10:30-17:30; Su off".
+
+    Supports weekday ranges and lists, several time spans per rule, spans past
+    midnight, "off"/"closed", "24/7", later rules overriding earlier ones and
+    ", "-separated additional rules. Public/school holiday rules and comments
+    are ignored. Compiled values are cached per distinct string.
+
+    Returns:
+        Optional[OpeningHours]: None if the string cannot be understood
+                                (e.g. "by appointment").
+    """
+    text = _COMMENT.sub("", raw or "").strip()
+    if not text:
+        return None
+    if text == "24/7":
+        return OpeningHours(raw, [(0, MINUTES_PER_WEEK)])
+
+    week: Dict[int, List[Tuple[int, int]]] = {}
+    understood = False
+    for rule in (r.strip() for r in re.split(r";|\|\|", text)):
+        for n, part in enumerate(_ADDITIONAL_RULE.split(rule)):
+            part = part.strip()
+            if not part:
+                continue
+            match = _DAY_SELECTOR.match(part)
+            if match:
+                days = _expand_days(match.group(1))
+                times = part[match.end():].strip()
+                if not days:
+                    continue  # holiday-only rule
+            else:
+                days = list(range(7))
+                times = part
+            if times in ("off", "closed"):
+                spans = []
+            else:
+                spans = _parse_spans(times)
+                if spans is None:
+                    continue
+            understood = True
+            for day in days:
+                if n == 0:
+                    week[day] = list(spans)
+                else:
+                    week.setdefault(day, []).extend(spans)
+
+    if not understood:
+        return None
+    intervals = [(day * MINUTES_PER_DAY + start, day * MINUTES_PER_DAY + end)
+                 for day, spans in week.items() for start, end in spans]
+    return OpeningHours(raw, _merge(intervals))
+
+
+@lru_cache(maxsize=65536)
+def opening_hours_of(metadata: Union[str, None]) -> Optional[OpeningHours]:
+    """
+    Returns the compiled opening hours of a `metadata` JSON string as stored
+    in the medical_amenity table. The JSON is decoded once per distinct
+    metadata string.
+    """
+    if not metadata:
+        return None
+    try:
+        raw = json.loads(metadata).get("opening_hours")
+    except (json.JSONDecodeError, AttributeError):
+        return None
+    return compile_opening_hours(raw) if isinstance(raw, str) else None
+
+
+def minute_of_week(when: Union[datetime, str]) -> int:
+    """
+    Converts a datetime, or a "Day HH:MM" string such as "Mon 09:00" or
+    "Mo 09:00", into minutes since Monday 00:00.
+    """
+    if isinstance(when, datetime):
+        return when.weekday() * MINUTES_PER_DAY + when.hour * 60 + when.minute
+    day, time_str = when.split()
+    hours, minutes = time_str.split(":")
+    return DAYS.index(day[:2]) * MINUTES_PER_DAY + int(hours) * 60 + int(minutes)
+
+
+def format_minute_of_week(minute: int) -> str:
+    """Formats minutes since Monday 00:00 as "Day HH:MM"."""
+    day, rest = divmod(minute % MINUTES_PER_WEEK, MINUTES_PER_DAY)
+    return f"{DAYS[day]} {rest // 60:02d}:{rest % 60:02d}"
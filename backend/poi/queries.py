@@ -0,0 +1,188 @@
+import math
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+from metrics import result_rows, stage
+from poi.distance import METERS_PER_DEG_LAT, distances_m
+from poi.snapshot import Snapshot, get_snapshot
+from poi.text_index import normalize_text
+
+# "index": answer lookups from the in-memory snapshot of the table (default).
+# "db": push the search area down into the medical_amenity query on every request.
+POI_LOOKUP = os.getenv("POI_LOOKUP", "index")
+# Name of the server-side function from sql/nearby_amenities.sql, when it is deployed
+POI_NEARBY_RPC = os.getenv("POI_NEARBY_RPC")
+# Up to this many name matches, their distance is measured directly instead of searching the grid
+TEXT_REFINE_MAX_ROWS = 1000
+
+
+def bounding_box(lat: float, lon: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """
+    Returns the (lat_min, lat_max, lon_min, lon_max) box enclosing the circle
+    of `radius_m` around the point. Degrees are sized with METERS_PER_DEG_LAT,
+    the shortest degree of latitude, so no point inside the circle falls outside
+    the box under either distance method; it does not wrap the antimeridian.
+    """
+    dlat = radius_m / METERS_PER_DEG_LAT
+    cos_lat = math.cos(math.radians(min(89.0, abs(lat) + dlat)))
+    dlon = min(180.0, dlat / max(cos_lat, 1e-6))
+    return max(-90.0, lat - dlat), min(90.0, lat + dlat), max(-180.0, lon - dlon), min(180.0, lon + dlon)
+
+
+def within_distance(rows: List[Dict], lat: float, lon: float, radius_m: float) -> List[Tuple[float, Dict]]:
+    """Exact distance check on the candidate rows: (distance in meters, row) pairs within `radius_m`, nearest first."""
+    rows = [row for row in rows if row.get("lat") is not None and row.get("lon") is not None]
+    if not rows:
+        return []
+    distances = distances_m(lat, lon, [float(row["lat"]) for row in rows], [float(row["lon"]) for row in rows])
+    hits = [(d, row) for d, row in zip(distances.tolist(), rows) if d <= radius_m]
+    hits.sort(key=lambda hit: hit[0])
+    return hits
+
+
+def fetch_nearby(
+        client,
+        lat: float,
+        lon: float,
+        radius_m: float,
+        amenity_types: Optional[List[str]] = None,
+        amenity_like: Optional[str] = None,
+        name_like: Optional[str] = None,
+        columns: str = "*",
+) -> List[Tuple[float, Dict]]:
+    """
+    Queries medical_amenity for the rows within `radius_m` of a point,
+    sending the bounding box of the search circle (or a call to the
+    POI_NEARBY_RPC function) to the database so only candidates near the
+    point are transferred, then refining them with the exact distance.
+
+    Args:
+        client: A Supabase client, or any stand-in with the same query builder.
+        lat (float): Latitude of the search centre.
+        lon (float): Longitude of the search centre.
+        radius_m (float): The search radius in meters.
+        amenity_types (List[str], optional): Exact amenity types to keep.
+        amenity_like (str, optional): Amenity type substring (case-insensitive).
+        name_like (str, optional): Metadata name substring (case-insensitive).
+        columns (str, optional): Columns to select. Defaults to all.
+
+    Returns:
+        List[Tuple[float, Dict]]: (distance in meters, row) pairs sorted by
+                                  ascending distance.
+    """
+    if POI_NEARBY_RPC:
+        query = client.rpc(POI_NEARBY_RPC, {
+            "p_lat": lat, "p_lon": lon, "p_radius_m": radius_m, "p_amenity_types": amenity_types,
+        }).select(columns)
+    else:
+        lat_min, lat_max, lon_min, lon_max = bounding_box(lat, lon, radius_m)
+        query = (client.table("medical_amenity").select(columns)
+                 .gte("lat", lat_min).lte("lat", lat_max)
+                 .gte("lon", lon_min).lte("lon", lon_max))
+        if amenity_types:
+            query = query.in_("amenity_type", amenity_types)
+
+    if amenity_like:
+        query = query.ilike("amenity_type", f"%{amenity_like}%")
+    if name_like:
+        query = query.ilike("metadata->>name", f"%{name_like}%")
+
+    with stage("db"):
+        rows = query.execute().data or []
+    result_rows.observe(len(rows), stage="db")
+    return within_distance(rows, lat, lon, radius_m)
+
+
+def text_matches(
+        snapshot: Snapshot,
+        amenity_like: Optional[str] = None,
+        name_like: Optional[str] = None,
+        prefix: bool = False,
+        typos: int = 0,
+) -> Optional[Set]:
+    """
+    Ids of the snapshot's amenities whose type contains `amenity_like` and
+    whose name contains `name_like` (or has a word starting with it when
+    `prefix`), through the trigram index. Case and accents are ignored.
+
+    Returns:
+        Optional[Set]: The matching ids, or None when neither filter is set.
+    """
+    if not amenity_like and not name_like:
+        return None
+    with stage("text_search"):
+        index = snapshot.text_index
+        matches = None
+        if amenity_like:
+            matches = index.search(amenity_like, "amenity_type")
+        if name_like:
+            names = index.search(name_like, "name", prefix=prefix, typos=typos)
+            matches = names if matches is None else matches & names
+    return matches
+
+
+def find_nearby(
+        lat: float,
+        lon: float,
+        radius_m: float,
+        amenity_types: Optional[List[str]] = None,
+        amenity_like: Optional[str] = None,
+        name_like: Optional[str] = None,
+        columns: str = "*",
+        name_prefix: bool = False,
+        typos: int = 0,
+) -> List[Tuple[float, Dict]]:
+    """
+    Finds the amenities within `radius_m` of a point through the lookup
+    selected by POI_LOOKUP. Takes the same filters as `fetch_nearby`;
+    `columns` only applies to the database lookup, index rows always carry
+    INDEX_COLUMNS. The index lookup also ignores accents, and takes the
+    `name_prefix` and `typos` options of `text_matches`, which the database
+    lookup does not support.
+
+    Returns:
+        List[Tuple[float, Dict]]: (distance in meters, row) pairs sorted by
+                                  ascending distance.
+    """
+    if POI_LOOKUP == "db":
+        from db import get_supabase
+        return fetch_nearby(get_supabase(), lat, lon, radius_m, amenity_types, amenity_like, name_like, columns)
+
+    snapshot = get_snapshot()
+    index = snapshot.index
+    if amenity_like:
+        # The grid is bucketed per type, so the type filter picks buckets rather than ids
+        needle = normalize_text(amenity_like)
+        matching = [t for t in index.amenity_types if t and needle in normalize_text(t)]
+        amenity_types = [t for t in amenity_types if t in matching] if amenity_types else matching
+    names = text_matches(snapshot, name_like=name_like, prefix=name_prefix, typos=typos)
+    if names is None:
+        return index.within_radius(lat, lon, radius_m, amenity_types)
+    if len(names) <= TEXT_REFINE_MAX_ROWS:
+        # Few names match: measure the distance to those rows only
+        rows = [snapshot.get(amenity_id) for amenity_id in names]
+        if amenity_types is not None:
+            rows = [row for row in rows if row.amenity_type in amenity_types]
+        return within_distance(rows, lat, lon, radius_m)
+    return [(d, row) for d, row in index.within_radius(lat, lon, radius_m, amenity_types) if row.id in names]
+
+
+def find_nearest(
+        lat: float,
+        lon: float,
+        k: int,
+        radius_m: float,
+        amenity_types: Optional[List[str]] = None,
+) -> List[Tuple[float, Dict]]:
+    """
+    The `k` amenities closest to a point within `radius_m`, through the
+    lookup selected by POI_LOOKUP.
+
+    Returns:
+        List[Tuple[float, Dict]]: Up to `k` (distance in meters, row) pairs
+                                  sorted by ascending distance.
+    """
+    if POI_LOOKUP == "db":
+        from db import get_supabase
+        return fetch_nearby(get_supabase(), lat, lon, radius_m, amenity_types)[:k]
+    return get_snapshot().index.nearest(lat, lon, k, amenity_types, max_radius_m=radius_m)
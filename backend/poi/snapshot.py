@@ -0,0 +1,428 @@
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from metrics import stage
+from poi.dataset import MappedDataset, get_mapped_dataset
+from poi.opening_hours import OpeningHours, compile_opening_hours, opening_hours_of
+from poi.spatial_index import INDEX_COLUMNS, ArraySpatialIndex, SpatialIndex
+from poi.text_index import TextIndex
+
+# Seconds between two incremental refreshes of the snapshot
+SNAPSHOT_REFRESH_S = float(os.getenv("POI_SNAPSHOT_REFRESH_S", "60"))
+# Seconds between two full reloads, which also drop rows deleted from the table
+SNAPSHOT_FULL_RELOAD_S = float(os.getenv("POI_SNAPSHOT_FULL_RELOAD_S", str(24 * 3600)))
+# Column bumped on every change of a row (see sql/medical_amenity_updated_at.sql)
+SNAPSHOT_VERSION_COLUMN = os.getenv("POI_SNAPSHOT_VERSION_COLUMN", "updated_at")
+# Seconds of versions before the snapshot's that an incremental refresh fetches again. The column holds
+# the start of the writing transaction, so a row whose transaction commits late lands behind it.
+SNAPSHOT_REFRESH_OVERLAP_S = float(os.getenv("POI_SNAPSHOT_REFRESH_OVERLAP_S", "300"))
+LOAD_PAGE_SIZE = 1000
+_UNCOMPILED = object()  # opening hours of a mapped record that are compiled when first read
+
+
+def decode_metadata(metadata) -> Dict[str, Any]:
+    if isinstance(metadata, dict):
+        return metadata
+    if isinstance(metadata, str):
+        try:
+            decoded = json.loads(metadata)
+        except json.JSONDecodeError:
+            return {}
+        return decoded if isinstance(decoded, dict) else {}
+    return {}
+
+
+class AmenityRecord:
+    """
+    One medical_amenity row held by the snapshot. `metadata` stays the JSON
+    string the table stores (and the API returns); `data` is that string
+    decoded once at load time, and `opening_hours` its opening hours compiled
+    then (None when missing or not understood). Records can be read like the
+    row dicts the database returns (`record["lat"]`, `record.get("metadata")`),
+    so they pass through the same code paths.
+    """
+
+    __slots__ = ("id", "amenity_type", "metadata", "lat", "lon", "data", "opening_hours", "version")
+
+    def __init__(self, row: Dict[str, Any], version_column: Optional[str] = None):
+        self.id = row["id"]
+        self.amenity_type = row.get("amenity_type")
+        self.metadata = row.get("metadata")
+        self.lat = None if row.get("lat") is None else float(row["lat"])
+        self.lon = None if row.get("lon") is None else float(row["lon"])
+        self.data = decode_metadata(self.metadata)
+        raw_hours = self.data.get("opening_hours")
+        self.opening_hours = compile_opening_hours(raw_hours) if isinstance(raw_hours, str) else None
+        self.version = row.get(version_column) if version_column else None
+
+    def keys(self):
+        return INDEX_COLUMNS
+
+    def __getitem__(self, key: str):
+        if key not in INDEX_COLUMNS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key) -> bool:
+        return key in INDEX_COLUMNS
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in INDEX_COLUMNS else default
+
+    def __repr__(self) -> str:
+        return f"AmenityRecord(id={self.id!r}, amenity_type={self.amenity_type!r})"
+
+
+class MappedRecord(AmenityRecord):
+    """
+    Row `position` of the memory-mapped dataset. The id, type and coordinates
+    are read when the record is built, and so are the opening hours when the
+    snapshot compiled them (`hours`, by hours code); `metadata` is only
+    copied out of the mapping, and `data` decoded, when first read.
+    """
+
+    __slots__ = ("_dataset", "_position", "_metadata", "_data", "_opening_hours")
+
+    def __init__(self, dataset: MappedDataset, position: int, amenity_id: int, amenity_type: Optional[str],
+                 lat: float, lon: float, opening_hours=_UNCOMPILED):
+        self._dataset, self._position = dataset, position
+        self.id = amenity_id
+        self.amenity_type = amenity_type
+        self.lat = None if math.isnan(lat) else lat
+        self.lon = None if math.isnan(lon) else lon
+        self.version = None
+        self._metadata = self._data = None
+        self._opening_hours = opening_hours
+
+    @classmethod
+    def at(cls, dataset: MappedDataset, positions: np.ndarray,
+           hours: Optional[List[Optional[OpeningHours]]] = None) -> List["MappedRecord"]:
+        """Records of these rows, reading each column once for all of them."""
+        types = dataset.amenity_types
+        if hours is None or dataset.hours_code is None:
+            opening_hours = [_UNCOMPILED] * len(positions)
+        else:
+            opening_hours = [hours[code] for code in dataset.hours_code[positions].tolist()]
+        return [cls(dataset, position, amenity_id, types[code] or None, lat, lon, compiled)
+                for position, amenity_id, code, lat, lon, compiled in zip(
+                    positions.tolist(), dataset.ids[positions].tolist(), dataset.type_code[positions].tolist(),
+                    dataset.lat[positions].tolist(), dataset.lon[positions].tolist(), opening_hours)]
+
+    @property
+    def metadata(self) -> Optional[str]:
+        if self._metadata is None:
+            self._metadata = self._dataset.metadata(self._position)
+        return self._metadata or None
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = decode_metadata(self.metadata)
+        return self._data
+
+    @property
+    def opening_hours(self) -> Optional[OpeningHours]:
+        if self._opening_hours is _UNCOMPILED:
+            self._opening_hours = opening_hours_of(self.metadata)
+        return self._opening_hours
+
+
+def metadata_of(row) -> Dict[str, Any]:
+    """Decoded metadata of a snapshot record or of a plain database row."""
+    if isinstance(row, AmenityRecord):
+        return row.data
+    return decode_metadata(row.get("metadata"))
+
+
+def opening_hours_of_row(row) -> Optional[OpeningHours]:
+    """Compiled opening hours of a snapshot record or of a plain database row."""
+    if isinstance(row, AmenityRecord):
+        return row.opening_hours
+    return opening_hours_of(row.get("metadata"))
+
+
+def _text_entries(records: Iterable[AmenityRecord]) -> Iterator:
+    for record in records:
+        yield record.id, {"name": record.data.get("name"), "amenity_type": record.amenity_type}
+
+
+class Snapshot:
+    """
+    Immutable in-memory copy of medical_amenity: records ordered by id, the
+    spatial index over them and, built on first use, the trigram index over
+    their names and types. A refresh builds a new snapshot and swaps it in,
+    so readers always see one consistent version.
+    """
+
+    def __init__(self, records: Iterable[AmenityRecord], version=None):
+        self.records: List[AmenityRecord] = sorted(records, key=lambda r: r.id)
+        self.ids: List = [r.id for r in self.records]
+        self.index = SpatialIndex.from_rows(self.records)
+        self.version = version
+        self.loaded_at = time.time()
+        self._text_index: Optional[TextIndex] = None
+        self._text_lock = threading.Lock()
+
+    @property
+    def text_index(self) -> TextIndex:
+        """Trigram index of the names and amenity types, for the name and type filters."""
+        if self._text_index is None:
+            with self._text_lock, stage("text_index"):
+                if self._text_index is None:
+                    self._text_index = TextIndex.from_entries(_text_entries(self.scan()))
+        return self._text_index
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, amenity_id) -> Optional[AmenityRecord]:
+        position = bisect_right(self.ids, amenity_id) - 1
+        if position >= 0 and self.ids[position] == amenity_id:
+            return self.records[position]
+        return None
+
+    def scan(self, after=None) -> Iterator[AmenityRecord]:
+        """Records in id order, starting after the id `after`."""
+        start = 0 if after is None else bisect_right(self.ids, after)
+        for position in range(start, len(self.records)):
+            yield self.records[position]
+
+    def merge(self, rows: List[Dict], version_column: Optional[str]) -> "Snapshot":
+        """A new snapshot with `rows` added or replacing the records with the same id."""
+        records = {r.id: r for r in self.scan()}
+        changed = [AmenityRecord(row, version_column) for row in rows]
+        for record in changed:
+            records[record.id] = record
+        snapshot = Snapshot(records.values(), _max_version(rows, version_column, self.version))
+        if self._text_index is not None:
+            # Only the changed rows are re-indexed, the rest is shared with this snapshot's index
+            snapshot._text_index = self._text_index.updated(_text_entries(changed))
+        return snapshot
+
+
+class MappedSnapshot(Snapshot):
+    """
+    Snapshot over the memory-mapped dataset (see poi/dataset.py). Ids,
+    coordinates, types and metadata stay in the mapping every worker shares;
+    the spatial index sorts positions into those arrays and records are only
+    built for the rows a lookup returns. What each worker holds on its own is
+    that sort order, the distinct opening hours compiled and, once a name or
+    type filter needs it, the text index.
+    """
+
+    def __init__(self, dataset: MappedDataset):
+        self.dataset = dataset
+        self._hours = [compile_opening_hours(raw) if raw else None for raw in dataset.opening_hours]
+        self.ids: np.ndarray = dataset.ids
+        self.index = ArraySpatialIndex(dataset.lat, dataset.lon, dataset.type_code, dataset.amenity_types,
+                                       self._records)
+        self.version = dataset.version
+        self.loaded_at = time.time()
+        self._text_index: Optional[TextIndex] = None
+        self._text_lock = threading.Lock()
+
+    def _records(self, positions: np.ndarray) -> List[MappedRecord]:
+        return MappedRecord.at(self.dataset, positions, self._hours)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def get(self, amenity_id) -> Optional[AmenityRecord]:
+        position = int(np.searchsorted(self.ids, amenity_id))
+        if position < len(self.ids) and self.ids[position] == amenity_id:
+            return self._records(np.array([position]))[0]
+        return None
+
+    def scan(self, after=None) -> Iterator[AmenityRecord]:
+        """Records in id order, starting after the id `after`."""
+        start = 0 if after is None else int(np.searchsorted(self.ids, after, side="right"))
+        for batch in range(start, len(self.ids), LOAD_PAGE_SIZE):
+            yield from self._records(np.arange(batch, min(batch + LOAD_PAGE_SIZE, len(self.ids))))
+
+
+def _with_text_index_of(snapshot: Snapshot, previous: Optional[Snapshot]) -> Snapshot:
+    """Builds the text index of a reloaded snapshot before it is swapped in, if the previous one had it built."""
+    if previous is not None and previous._text_index is not None:
+        snapshot.text_index
+    return snapshot
+
+
+def _max_version(rows: List[Dict], version_column: Optional[str], current=None):
+    versions = [row[version_column] for row in rows if version_column and row.get(version_column) is not None]
+    if current is not None:
+        versions.append(current)
+    return max(versions) if versions else None
+
+
+def _is_changed(snapshot: Snapshot, row: Dict, version_column: str) -> bool:
+    record = snapshot.get(row["id"])
+    return record is None or record.version != row.get(version_column)
+
+
+def _overlap_start(version, seconds: float):
+    """The version `seconds` before `version`: timestamps (or ISO strings) move back in time, numbers by `seconds`."""
+    if seconds <= 0:
+        return version
+    if isinstance(version, datetime):
+        return version - timedelta(seconds=seconds)
+    if isinstance(version, str):
+        try:
+            return (datetime.fromisoformat(version) - timedelta(seconds=seconds)).isoformat()
+        except ValueError:
+            return version
+    if isinstance(version, (int, float)) and not isinstance(version, bool):
+        return version - seconds
+    return version
+
+
+def _fetch_rows(columns: List[str], since=None, version_column: Optional[str] = None) -> List[Dict]:
+    """Pages through medical_amenity in id order, optionally only rows changed after `since`."""
+    from db import get_supabase
+    supabase = get_supabase()
+    rows = []
+    while True:
+        query = supabase.table("medical_amenity").select(", ".join(columns))
+        if since is not None:
+            query = query.gt(version_column, since)
+        if rows:
+            query = query.gt("id", rows[-1]["id"])
+        page = query.order("id").limit(LOAD_PAGE_SIZE).execute().data or []
+        rows.extend(page)
+        if len(page) < LOAD_PAGE_SIZE:
+            return rows
+
+
+class SnapshotStore:
+    """
+    Holds the current snapshot and keeps it fresh: a full load first, then
+    only the rows whose version column moved past the snapshot's version,
+    less SNAPSHOT_REFRESH_OVERLAP_S for rows whose transaction committed
+    late; rows fetched again unchanged are skipped. Without that column
+    every refresh is a full reload. With POI_DATASET_PATH
+    the snapshot is a MappedSnapshot over the memory-mapped dataset, reloaded
+    when a new version of the file appears. When a refresh fails the
+    previous snapshot keeps being served.
+
+    Refreshes run in a background thread started by `start()`. Without it
+    (lazy startup), the first request after the refresh interval starts a
+    one-off refresh in the background instead.
+    """
+
+    def __init__(self, version_column: Optional[str] = SNAPSHOT_VERSION_COLUMN):
+        self.version_column = version_column or None
+        self._snapshot: Optional[Snapshot] = None
+        self._full_loaded_at = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _columns(self) -> List[str]:
+        return list(INDEX_COLUMNS) + ([self.version_column] if self.version_column else [])
+
+    def _load_full(self) -> Snapshot:
+        self._checked_at = time.monotonic()
+        dataset = get_mapped_dataset()
+        if dataset is not None:
+            self._full_loaded_at = time.monotonic()
+            return MappedSnapshot(dataset)
+        try:
+            rows = _fetch_rows(self._columns())
+        except Exception as e:
+            if not self.version_column or self.version_column not in str(e):
+                raise
+            print(f"Snapshot: no usable '{self.version_column}' column, refreshing with full reloads")
+            self.version_column = None
+            rows = _fetch_rows(self._columns())
+        self._full_loaded_at = time.monotonic()
+        return Snapshot((AmenityRecord(row, self.version_column) for row in rows),
+                        _max_version(rows, self.version_column))
+
+    def get(self) -> Snapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._load_full()
+                snapshot = self._snapshot
+        elif self._thread is None and time.monotonic() - self._checked_at >= SNAPSHOT_REFRESH_S:
+            self._checked_at = time.monotonic()  # one refresh per interval
+            threading.Thread(target=self._try_refresh, name="poi-snapshot-refresh", daemon=True).start()
+        return snapshot
+
+    def current(self) -> Optional[Snapshot]:
+        """The snapshot being served, or None before the first load. Never loads or refreshes it."""
+        return self._snapshot
+
+    def refresh(self) -> Snapshot:
+        """Brings the snapshot up to date and swaps it in."""
+        with self._lock, stage("snapshot_refresh"):
+            current = self._snapshot
+            dataset = get_mapped_dataset()
+            if dataset is not None:
+                # The build script replaces the file; reload only when its version moved
+                if current is None or current.version != dataset.version:
+                    self._snapshot = _with_text_index_of(self._load_full(), current)
+                return self._snapshot
+            full = (current is None or not self.version_column or current.version is None
+                    or time.monotonic() - self._full_loaded_at >= SNAPSHOT_FULL_RELOAD_S)
+            if full:
+                snapshot = _with_text_index_of(self._load_full(), current)
+            else:
+                since = _overlap_start(current.version, SNAPSHOT_REFRESH_OVERLAP_S)
+                rows = _fetch_rows(self._columns(), since, self.version_column)
+                changed = [row for row in rows if _is_changed(current, row, self.version_column)]
+                snapshot = current.merge(changed, self.version_column) if changed else current
+            self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    def _try_refresh(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Snapshot refresh failed, still serving the previous snapshot: {e}")
+
+    def _run(self, interval_s: float) -> None:
+        while not self._stop.wait(interval_s):
+            self._try_refresh()
+
+    def start(self, interval_s: float = SNAPSHOT_REFRESH_S) -> None:
+        """Loads the snapshot (if needed) and refreshes it every `interval_s` seconds in a daemon thread."""
+        try:
+            self.get()
+        except Exception as e:
+            print(f"Snapshot load failed, retrying on the next request or refresh: {e}")
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(interval_s,), name="poi-snapshot", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+snapshot_store = SnapshotStore()
+
+
+def get_snapshot() -> Snapshot:
+    """The current snapshot shared by the /amenities and /chat endpoints, loaded on first use."""
+    return snapshot_store.get()
+
+
+def dataset_version() -> Optional[str]:
+    """
+    Identifies the data being served; it changes whenever a refresh swaps in
+    a new snapshot. None while no snapshot is loaded: this never loads one,
+    so it is safe to call on the event loop.
+    """
+    snapshot = snapshot_store.current()
+    return None if snapshot is None else f"{snapshot.version}@{snapshot.loaded_at}"
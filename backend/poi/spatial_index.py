@@ -0,0 +1,339 @@
+import heapq
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from poi.distance import METERS_PER_DEG_LAT, distances_m
+
+DEFAULT_CELL_DEG = 0.05  # ~5.5 km north/south per grid cell
+# Columns kept in memory; the embedding vector is deliberately left out
+INDEX_COLUMNS = ("id", "amenity_type", "metadata", "lat", "lon")
+
+
+def _measure(lat: float, lon: float, candidates: List[Tuple[float, float, Dict]]):
+    """Distances in meters to a batch of (lat, lon, row) candidates."""
+    if not candidates:
+        return []
+    lats, lons, _ = zip(*candidates)
+    return distances_m(lat, lon, lats, lons).tolist()
+
+
+class SpatialIndex:
+    """
+    Uniform lat/lon grid of amenity rows, bucketed per amenity type.
+
+    Radius queries only visit the cells overlapping the search circle and
+    k-nearest queries expand ring by ring around the query cell, so the cost
+    of a lookup follows the size of the result instead of the size of the
+    table.
+    """
+
+    def __init__(self, cell_deg: float = DEFAULT_CELL_DEG):
+        self.cell_deg = cell_deg
+        # amenity_type -> (cell_lat, cell_lon) -> [(lat, lon, row), ...]
+        self._cells: Dict[str, Dict[Tuple[int, int], List[Tuple[float, float, Dict]]]] = {}
+        self._size = 0
+        self._bounds: Optional[Tuple[int, int, int, int]] = None  # min/max occupied cell indices
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict], cell_deg: float = DEFAULT_CELL_DEG) -> "SpatialIndex":
+        index = cls(cell_deg)
+        for row in rows:
+            index.add(row)
+        return index
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def amenity_types(self) -> List[str]:
+        return list(self._cells)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def add(self, row: Dict) -> bool:
+        """
+        Adds a `medical_amenity` row to the index.
+
+        Returns:
+            bool: False if the row has no usable coordinates and was skipped.
+        """
+        try:
+            lat, lon = float(row["lat"]), float(row["lon"])
+        except (KeyError, ValueError, TypeError):
+            return False
+        if math.isnan(lat) or math.isnan(lon):
+            return False
+        key = self._cell(lat, lon)
+        cells = self._cells.setdefault(row.get("amenity_type"), {})
+        cells.setdefault(key, []).append((lat, lon, row))
+        self._size += 1
+        if self._bounds is None:
+            self._bounds = (key[0], key[0], key[1], key[1])
+        else:
+            i_lo, i_hi, j_lo, j_hi = self._bounds
+            self._bounds = (min(i_lo, key[0]), max(i_hi, key[0]), min(j_lo, key[1]), max(j_hi, key[1]))
+        return True
+
+    def _buckets(self, amenity_types: Optional[Iterable[str]]):
+        if amenity_types is None:
+            return list(self._cells.values())
+        return [self._cells[t] for t in set(amenity_types) if t in self._cells]
+
+    def within_radius(
+            self,
+            lat: float,
+            lon: float,
+            radius_m: float,
+            amenity_types: Optional[Iterable[str]] = None,
+    ) -> List[Tuple[float, Dict]]:
+        """
+        Finds every indexed row within `radius_m` of the given point.
+
+        Args:
+            lat (float): Latitude of the search centre.
+            lon (float): Longitude of the search centre.
+            radius_m (float): The search radius in meters.
+            amenity_types (Iterable[str], optional): Restrict the search to
+                these amenity types. Searches all types when None.
+
+        Returns:
+            List[Tuple[float, Dict]]: (distance in meters, row) pairs sorted
+                                      by ascending distance.
+        """
+        dlat = radius_m / METERS_PER_DEG_LAT
+        cos_lat = math.cos(math.radians(min(89.0, abs(lat) + dlat)))
+        dlon = min(180.0, dlat / max(cos_lat, 1e-6))
+        lat_lo, lon_lo = self._cell(lat - dlat, lon - dlon)
+        lat_hi, lon_hi = self._cell(lat + dlat, lon + dlon)
+        span = (lat_hi - lat_lo + 1) * (lon_hi - lon_lo + 1)
+
+        candidates = []
+        for cells in self._buckets(amenity_types):
+            if span <= len(cells):
+                keys = ((i, j) for i in range(lat_lo, lat_hi + 1) for j in range(lon_lo, lon_hi + 1))
+            else:
+                # Very large radius: cheaper to walk the occupied cells.
+                keys = (k for k in cells if lat_lo <= k[0] <= lat_hi and lon_lo <= k[1] <= lon_hi)
+            for key in keys:
+                candidates.extend(cells.get(key, ()))
+
+        distances = _measure(lat, lon, candidates)
+        hits = [(d, c[2]) for d, c in zip(distances, candidates) if d <= radius_m]
+        hits.sort(key=lambda hit: hit[0])
+        return hits
+
+    def nearest(
+            self,
+            lat: float,
+            lon: float,
+            k: int,
+            amenity_types: Optional[Iterable[str]] = None,
+            max_radius_m: Optional[float] = None,
+    ) -> List[Tuple[float, Dict]]:
+        """
+        Finds the `k` indexed rows closest to the given point.
+
+        Args:
+            lat (float): Latitude of the search centre.
+            lon (float): Longitude of the search centre.
+            k (int): Maximum number of rows to return.
+            amenity_types (Iterable[str], optional): Restrict the search to
+                these amenity types. Searches all types when None.
+            max_radius_m (float, optional): Ignore rows further than this.
+
+        Returns:
+            List[Tuple[float, Dict]]: Up to `k` (distance in meters, row)
+                                      pairs sorted by ascending distance.
+        """
+        buckets = self._buckets(amenity_types)
+        if k <= 0 or not buckets or self._bounds is None:
+            return []
+
+        c_lat, c_lon = self._cell(lat, lon)
+        i_lo, i_hi, j_lo, j_hi = self._bounds
+        max_ring = max(abs(i_lo - c_lat), abs(i_hi - c_lat), abs(j_lo - c_lon), abs(j_hi - c_lon))
+
+        heap: List[Tuple[float, int, Dict]] = []  # max-heap on distance via negation
+        for ring in range(max_ring + 1):
+            # Any row in this ring is at least (ring - 1) cells away.
+            edge_lat = min(89.0, abs(lat) + (ring + 1) * self.cell_deg)
+            cell_m = self.cell_deg * METERS_PER_DEG_LAT * math.cos(math.radians(edge_lat))
+            lower_bound = max(0, ring - 1) * cell_m
+            if max_radius_m is not None and lower_bound > max_radius_m:
+                break
+            if len(heap) == k and lower_bound > -heap[0][0]:
+                break
+
+            candidates = []
+            for i in range(c_lat - ring, c_lat + ring + 1):
+                on_edge = i in (c_lat - ring, c_lat + ring)
+                cols = range(c_lon - ring, c_lon + ring + 1) if on_edge else (c_lon - ring, c_lon + ring)
+                for j in set(cols):
+                    for cells in buckets:
+                        candidates.extend(cells.get((i, j), ()))
+
+            for distance, (_, _, row) in zip(_measure(lat, lon, candidates), candidates):
+                if max_radius_m is not None and distance > max_radius_m:
+                    continue
+                entry = (-distance, id(row), row)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif distance < -heap[0][0]:
+                    heapq.heapreplace(heap, entry)
+
+        return sorted(((-d, row) for d, _, row in heap), key=lambda hit: hit[0])
+
+
+
+# ArraySpatialIndex sort key: type code, then cell row, then cell column, each cell index offset to be positive
+_CELL_BITS = 20
+_CELL_OFFSET = 1 << (_CELL_BITS - 1)
+
+
+def _sort_key(code, i, j):
+    return (code << 2 * _CELL_BITS) | ((i + _CELL_OFFSET) << _CELL_BITS) | (j + _CELL_OFFSET)
+
+
+class ArraySpatialIndex:
+    """
+    The same grid as SpatialIndex, over coordinate and type-code arrays such
+    as those of the memory-mapped dataset (see poi/dataset.py).
+
+    Instead of buckets of rows, the positions of the rows are sorted once by
+    (type, cell row, cell column), so the cells of one grid row are a
+    contiguous slice found by binary search. The index itself holds that
+    order and its sort keys, 16 bytes per row; the coordinates stay in the
+    arrays it was given. `records(positions)` builds the rows returned for
+    the hits, only for the rows a query returns.
+    """
+
+    def __init__(
+            self,
+            lat: np.ndarray,
+            lon: np.ndarray,
+            type_code: np.ndarray,
+            amenity_types: Sequence[str],
+            records: Callable[[np.ndarray], List[Dict]],
+            cell_deg: float = DEFAULT_CELL_DEG,
+    ):
+        self.cell_deg = cell_deg
+        self._lat, self._lon = lat, lon
+        self._records = records
+        usable = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        i = np.floor(lat[usable] / cell_deg).astype(np.int64)
+        j = np.floor(lon[usable] / cell_deg).astype(np.int64)
+        keys = _sort_key(type_code[usable].astype(np.int64), i, j)
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._positions = usable[order]
+        present = np.unique(type_code[usable])
+        # Unknown types are stored as "" and read back as None, like SpatialIndex's None bucket
+        self._codes = {amenity_types[code] or None: int(code) for code in present}
+        self._bounds = (int(i.min()), int(i.max()), int(j.min()), int(j.max())) if len(usable) else None
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    @property
+    def amenity_types(self) -> List[str]:
+        return list(self._codes)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def _type_codes(self, amenity_types: Optional[Iterable[str]]) -> List[int]:
+        if amenity_types is None:
+            return list(self._codes.values())
+        return [self._codes[t] for t in set(amenity_types) if t in self._codes]
+
+    def _gather(self, codes: List[int], rows: Sequence[int], j_lo: Sequence[int], j_hi: Sequence[int]) -> np.ndarray:
+        """Positions of the rows of these types in cells (rows[s], j_lo[s]..j_hi[s]) for every segment s."""
+        if not codes or not len(rows):
+            return np.empty(0, dtype=np.int64)
+        code = np.asarray(codes, dtype=np.int64)[:, None]
+        rows = np.asarray(rows, dtype=np.int64)[None, :]
+        starts = np.searchsorted(self._keys, _sort_key(code, rows, np.asarray(j_lo, dtype=np.int64)).ravel())
+        ends = np.searchsorted(self._keys, _sort_key(code, rows, np.asarray(j_hi, dtype=np.int64)).ravel(),
+                               side="right")
+        slices = [self._positions[a:b] for a, b in zip(starts, ends) if b > a]
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+    def _hits(self, positions: np.ndarray, distances: np.ndarray) -> List[Tuple[float, Dict]]:
+        order = np.argsort(distances, kind="stable")
+        return list(zip(distances[order].tolist(), self._records(positions[order])))
+
+    def within_radius(
+            self,
+            lat: float,
+            lon: float,
+            radius_m: float,
+            amenity_types: Optional[Iterable[str]] = None,
+    ) -> List[Tuple[float, Dict]]:
+        """Same as SpatialIndex.within_radius."""
+        dlat = radius_m / METERS_PER_DEG_LAT
+        cos_lat = math.cos(math.radians(min(89.0, abs(lat) + dlat)))
+        dlon = min(180.0, dlat / max(cos_lat, 1e-6))
+        lat_lo, lon_lo = self._cell(lat - dlat, lon - dlon)
+        lat_hi, lon_hi = self._cell(lat + dlat, lon + dlon)
+        if self._bounds is not None:
+            # Rows outside the occupied cells cannot hold anything
+            lat_lo, lat_hi = max(lat_lo, self._bounds[0]), min(lat_hi, self._bounds[1])
+        rows = range(lat_lo, lat_hi + 1)
+
+        positions = self._gather(self._type_codes(amenity_types), rows, [lon_lo] * len(rows), [lon_hi] * len(rows))
+        distances = distances_m(lat, lon, self._lat[positions], self._lon[positions])
+        keep = distances <= radius_m
+        return self._hits(positions[keep], distances[keep])
+
+    def nearest(
+            self,
+            lat: float,
+            lon: float,
+            k: int,
+            amenity_types: Optional[Iterable[str]] = None,
+            max_radius_m: Optional[float] = None,
+    ) -> List[Tuple[float, Dict]]:
+        """Same as SpatialIndex.nearest."""
+        codes = self._type_codes(amenity_types)
+        if k <= 0 or not codes or self._bounds is None:
+            return []
+
+        c_lat, c_lon = self._cell(lat, lon)
+        i_lo, i_hi, j_lo, j_hi = self._bounds
+        max_ring = max(abs(i_lo - c_lat), abs(i_hi - c_lat), abs(j_lo - c_lon), abs(j_hi - c_lon))
+
+        best_d, best_p = np.empty(0), np.empty(0, dtype=np.int64)
+        for ring in range(max_ring + 1):
+            # Any row in this ring is at least (ring - 1) cells away.
+            edge_lat = min(89.0, abs(lat) + (ring + 1) * self.cell_deg)
+            cell_m = self.cell_deg * METERS_PER_DEG_LAT * math.cos(math.radians(edge_lat))
+            lower_bound = max(0, ring - 1) * cell_m
+            if max_radius_m is not None and lower_bound > max_radius_m:
+                break
+            if len(best_d) == k and lower_bound > best_d.max():
+                break
+
+            # The top and bottom rows of the ring in full, its left and right columns in between
+            rows, lo, hi = [c_lat - ring], [c_lon - ring], [c_lon + ring]
+            if ring:
+                rows.append(c_lat + ring), lo.append(c_lon - ring), hi.append(c_lon + ring)
+                for i in range(c_lat - ring + 1, c_lat + ring):
+                    rows += [i, i]
+                    lo += [c_lon - ring, c_lon + ring]
+                    hi += [c_lon - ring, c_lon + ring]
+            positions = self._gather(codes, rows, lo, hi)
+            if not len(positions):
+                continue
+            distances = distances_m(lat, lon, self._lat[positions], self._lon[positions])
+            if max_radius_m is not None:
+                keep = distances <= max_radius_m
+                positions, distances = positions[keep], distances[keep]
+            best_d, best_p = np.concatenate([best_d, distances]), np.concatenate([best_p, positions])
+            if len(best_d) > k:
+                keep = np.argpartition(best_d, k - 1)[:k]
+                best_d, best_p = best_d[keep], best_p[keep]
+
+        return self._hits(best_p, best_d)
@@ -0,0 +1,190 @@
+"""
+Trigram inverted index over the amenity names and types, for the `name`
+and `amenity` filters and search-as-you-type.
+
+Texts are normalized (case and accents folded, punctuation turned into
+spaces) and padded with a space on each side; every 3-character substring
+maps to the set of ids whose text contains it. A substring query only
+verifies the ids found under all of its own trigrams, and a prefix query
+is the query preceded by a space, i.e. anchored at the start of a word.
+When nothing matches exactly and typos are tolerated, the texts sharing
+enough trigrams with the query are checked with an edit distance instead.
+"""
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+GRAM = 3
+FIELDS = ("name", "amenity_type")
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_text(text: Any) -> str:
+    """'Apotheek Sint-Jozef ' -> 'apotheek sint jozef', 'Pharmacie Médicale' -> 'pharmacie medicale'"""
+    text = str(text or "")
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return " ".join(_NON_WORD.sub(" ", text.casefold()).split())
+
+
+def _grams(text: str) -> Set[str]:
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+def substring_distance(pattern: str, text: str, enough: int = 0) -> int:
+    """
+    Fewest edits turning `pattern` into some substring of `text`: Sellers'
+    dynamic programme, one column per character of `text`, with Myers'
+    bit-vector encoding of the column. Stops at the first substring within
+    `enough` edits.
+    """
+    if not pattern:
+        return 0
+    equal: Dict[str, int] = {}
+    for i, char in enumerate(pattern):
+        equal[char] = equal.get(char, 0) | 1 << i
+    mask, last = (1 << len(pattern)) - 1, 1 << (len(pattern) - 1)
+    plus, minus, score = mask, 0, len(pattern)
+    best = score
+    for char in text:
+        eq = equal.get(char, 0)
+        x_vertical = eq | minus
+        x_horizontal = (((eq & plus) + plus) ^ plus) | eq
+        h_plus = minus | ~(x_horizontal | plus)
+        h_minus = plus & x_horizontal
+        if h_plus & last:
+            score += 1
+        elif h_minus & last:
+            score -= 1
+        # No carry into the first row: a match may start anywhere in `text`
+        h_plus, h_minus = (h_plus << 1) & mask, (h_minus << 1) & mask
+        plus = (h_minus | ~(x_vertical | h_plus)) & mask
+        minus = h_plus & x_vertical
+        if score < best:
+            best = score
+            if best <= enough:
+                break
+    return best
+
+
+class TextIndex:
+    """
+    Per field (FIELDS): the padded, normalized text of every id, the ids
+    sharing each distinct text, and the trigram postings of the distinct
+    texts.
+    Rows with the same name or type are indexed and verified once.
+    `updated()` derives a new index that shares every set it does not
+    touch, so a snapshot refresh only pays for the rows that changed and
+    readers of the previous index are unaffected.
+    """
+
+    def __init__(self):
+        self._texts: Dict[str, Dict[Any, str]] = {field: {} for field in FIELDS}
+        self._ids: Dict[str, Dict[str, Set]] = {field: {} for field in FIELDS}
+        self._postings: Dict[str, Dict[str, Set[str]]] = {field: {} for field in FIELDS}
+        self._owned: Optional[Set[Tuple[int, str]]] = None  # sets copied during an update
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Tuple[Any, Dict[str, Any]]]) -> "TextIndex":
+        """An index of (id, {field: text}) entries."""
+        index = cls()
+        for amenity_id, texts in entries:
+            index._set(amenity_id, texts)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._texts["name"])
+
+    def updated(self, entries: Iterable[Tuple[Any, Dict[str, Any]]]) -> "TextIndex":
+        """A copy with `entries` added, or replacing the texts of the same ids. This index is left as it is."""
+        index = TextIndex()
+        for name in ("_texts", "_ids", "_postings"):
+            setattr(index, name, {field: dict(values) for field, values in getattr(self, name).items()})
+        index._owned = set()
+        for amenity_id, texts in entries:
+            index._set(amenity_id, texts)
+        index._owned = None
+        return index
+
+    def _writable(self, mapping: Dict[str, Set], key: str) -> Set:
+        """The set under `key`, copied first if it may still be shared with the index it came from."""
+        if self._owned is not None and (id(mapping), key) not in self._owned:
+            self._owned.add((id(mapping), key))
+            if key in mapping:
+                mapping[key] = set(mapping[key])
+        return mapping.setdefault(key, set())
+
+    def _set(self, amenity_id, texts: Dict[str, Any]) -> None:
+        for field in FIELDS:
+            text = f" {normalize_text(texts.get(field))} "
+            old = self._texts[field].get(amenity_id)
+            if old == text:
+                continue
+            ids, postings = self._ids[field], self._postings[field]
+            if old is not None:
+                sharing = self._writable(ids, old)
+                sharing.discard(amenity_id)
+                if not sharing:
+                    del ids[old]
+                    for gram in _grams(old):
+                        texts_with_gram = self._writable(postings, gram)
+                        texts_with_gram.discard(old)
+                        if not texts_with_gram:
+                            del postings[gram]
+            self._texts[field][amenity_id] = text
+            if text not in ids:
+                for gram in _grams(text):
+                    self._writable(postings, gram).add(text)
+            self._writable(ids, text).add(amenity_id)
+
+    def _matching_texts(self, field: str, needle: str, typos: int) -> Iterable[str]:
+        grams = _grams(needle)
+        if not grams:
+            # Shorter than a trigram: check every distinct text
+            return [text for text in self._ids[field] if needle in text]
+        postings = self._postings[field]
+        candidates = set.intersection(*sorted((postings.get(gram, set()) for gram in grams), key=len))
+        exact = [text for text in candidates if needle in text]
+        # Each edit destroys at most GRAM trigrams; keep enough of them to narrow the candidates
+        typos = max(0, min(typos, (len(grams) - 1) // GRAM))
+        if exact or typos == 0:
+            return exact
+
+        shared = Counter()
+        for gram in grams:
+            shared.update(postings.get(gram, ()))
+        needed = len(grams) - GRAM * typos
+        return [text for text, count in shared.items()
+                if count >= needed and substring_distance(needle, text, typos) <= typos]
+
+    def search(self, query: str, field: str = "name", prefix: bool = False, typos: int = 0) -> Set:
+        """
+        Finds the ids whose `field` contains `query`, ignoring case and accents.
+
+        Args:
+            query (str): The text to look for.
+            field (str, optional): "name" or "amenity_type". Defaults to "name".
+            prefix (bool, optional): Only match at the start of a word, as
+                for search-as-you-type. Defaults to substring matches.
+            typos (int, optional): Edits (insertions, deletions or
+                substitutions) tolerated when nothing matches exactly. Each
+                allowed typo needs about three more characters of query,
+                shorter queries only match exactly.
+
+        Returns:
+            Set: The matching ids; every id for an empty query.
+        """
+        needle = normalize_text(query)
+        if not needle:
+            return set(self._texts[field])
+        ids = self._ids[field]
+        matches = set()
+        for text in self._matching_texts(field, " " + needle if prefix else needle, typos):
+            matches |= ids[text]
+        return matches
+
+    def text(self, amenity_id, field: str = "name") -> Optional[str]:
+        """The normalized text of `field` for an id."""
+        text = self._texts[field].get(amenity_id)
+        return None if text is None else text.strip()
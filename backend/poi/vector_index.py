@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from poi.dataset import get_mapped_dataset, parse_embedding
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "BAAI/bge-m3")  # same model as scripts/populate.py
+VECTOR_INDEX_TTL_S = int(os.getenv("POI_VECTOR_INDEX_TTL_S", "3600"))
+# Use an HNSW index from faiss (when installed) once there are at least this many rows
+ANN_MIN_ROWS = int(os.getenv("POI_VECTOR_ANN_MIN_ROWS", "50000"))
+LOAD_PAGE_SIZE = 1000
+
+
+class VectorIndex:
+    """
+    The normalized amenity embeddings stored by scripts/populate.py, held as
+    one contiguous float32 matrix. Cosine similarity is then a single
+    matrix-vector product, optionally restricted to a candidate set.
+    `rows`, when given, are the positions of the rows that have an
+    embedding; the others are never returned.
+    """
+
+    def __init__(self, ids: Sequence[int], vectors: np.ndarray, rows: Optional[np.ndarray] = None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self._rows = None if rows is None else np.asarray(rows, dtype=np.int64)
+        positions = range(len(self.ids)) if self._rows is None else self._rows.tolist()
+        self._positions = {int(self.ids[p]): p for p in positions}
+        self._ann = None
+        if len(self.ids) >= ANN_MIN_ROWS:
+            self._ann = self._build_ann()
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict]) -> "VectorIndex":
+        ids, vectors = [], []
+        for row in rows:
+            embedding = parse_embedding(row.get("embedding"))
+            if embedding:
+                ids.append(row["id"])
+                vectors.append(embedding)
+        matrix = np.array(vectors, dtype=np.float32) if vectors else np.zeros((0, 0), dtype=np.float32)
+        return cls(ids, matrix)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def _build_ann(self):
+        try:
+            import faiss
+        except ImportError:
+            return None
+        index = faiss.IndexHNSWFlat(self.vectors.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        index.add(self.vectors if self._rows is None else self.vectors[self._rows])
+        return index
+
+    def search(
+            self,
+            query: np.ndarray,
+            k: int = 10,
+            candidate_ids: Optional[Iterable[int]] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Finds the `k` amenities whose embedding is most similar to `query`.
+
+        Args:
+            query (np.ndarray): A normalized query embedding.
+            k (int, optional): Number of results. Defaults to 10.
+            candidate_ids (Iterable[int], optional): Only consider these rows,
+                e.g. the result of a distance filter. Exact search is used
+                whenever candidates are given.
+
+        Returns:
+            List[Tuple[int, float]]: (amenity id, cosine similarity) pairs,
+                                     most similar first.
+        """
+        if not len(self) or k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+
+        if candidate_ids is not None:
+            positions = np.array([self._positions[i] for i in candidate_ids if i in self._positions], dtype=np.int64)
+            if not len(positions):
+                return []
+            scores = self.vectors[positions] @ query
+        elif self._ann is not None:
+            distances, found = self._ann.search(query.reshape(1, -1), k)
+            rows = found[0] if self._rows is None else self._rows[np.maximum(found[0], 0)]
+            return [(int(self.ids[p]), float(s)) for p, s, f in zip(rows, distances[0], found[0]) if f >= 0]
+        else:
+            # Rows without an embedding are zeros: scoring them is cheaper than copying the rest out
+            positions = self._rows
+            scores = self.vectors @ query
+            if positions is not None:
+                scores = scores[positions]
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        ids = self.ids if positions is None else self.ids[positions]
+        return [(int(ids[p]), float(scores[p])) for p in top]
+
+
+@lru_cache(maxsize=1)
+def _embedding_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+
+@lru_cache(maxsize=1024)
+def _cached_query_embedding(text: str) -> bytes:
+    vector = _embedding_model().encode(text, normalize_embeddings=True)
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def embed_query(text: str) -> np.ndarray:
+    """Embeds a search query with the ingest model; repeated queries come from an LRU cache."""
+    return np.frombuffer(_cached_query_embedding(" ".join(text.split()).lower()), dtype=np.float32)
+
+
+_index: Optional[VectorIndex] = None
+_index_loaded_at = 0.0
+_index_version: Optional[str] = None
+_index_lock = threading.Lock()
+
+
+def _load_rows() -> List[Dict]:
+    from db import get_supabase
+    supabase = get_supabase()
+    rows, start = [], 0
+    while True:
+        page = (supabase.table("medical_amenity").select("id, embedding").order("id")
+                .range(start, start + LOAD_PAGE_SIZE - 1).execute().data or [])
+        rows.extend(page)
+        if len(page) < LOAD_PAGE_SIZE:
+            return rows
+        start += LOAD_PAGE_SIZE
+
+
+def _from_dataset(dataset) -> VectorIndex:
+    # Views on the shared mapping, never copied: rows without an embedding are zero-filled in the file
+    rows = np.flatnonzero(dataset.has_embedding)
+    return VectorIndex(dataset.ids, dataset.embedding, None if len(rows) == len(dataset.ids) else rows)
+
+
+def get_vector_index() -> VectorIndex:
+    """
+    Returns the process-wide embedding index. With POI_DATASET_PATH it is
+    backed by the memory-mapped dataset and follows its version; otherwise
+    it is (re)loaded from Supabase once older than POI_VECTOR_INDEX_TTL_S
+    seconds.
+    """
+    global _index, _index_loaded_at, _index_version
+    dataset = get_mapped_dataset()
+    if dataset is not None:
+        if _index is None or _index_version != dataset.version:
+            with _index_lock:
+                if _index is None or _index_version != dataset.version:
+                    _index, _index_version = _from_dataset(dataset), dataset.version
+        return _index
+
+    if _index is not None and time.monotonic() - _index_loaded_at < VECTOR_INDEX_TTL_S:
+        return _index
+    with _index_lock:
+        if _index is None or time.monotonic() - _index_loaded_at >= VECTOR_INDEX_TTL_S:
+            _index = VectorIndex.from_rows(_load_rows())
+            _index_loaded_at = time.monotonic()
+    return _index
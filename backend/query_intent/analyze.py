@@ -1,17 +1,29 @@
+import asyncio
 import json
 import os
+import statistics
+import time
+from collections import deque
 
-import google.generativeai as genai
-from google.generativeai import GenerativeModel
-from google.generativeai.types import GenerateContentResponse
 from pydantic import ValidationError, BaseModel
-from typing import List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Union
 from dotenv import load_dotenv
 
+from metrics import count_cache, intent_sources, llm_calls, llm_duration, llm_hedges, record
+from query_intent.cache import intent_cache, intent_flight, normalize_query
+from query_intent.fastpath import FASTPATH_THRESHOLD, FastPathResult, classify_locally
+from query_intent.model import get_model
+
+if TYPE_CHECKING:
+    from google.generativeai.types import GenerateContentResponse
+
 load_dotenv()
 
-# Initialize the Generative AI model
-genai.configure(api_key=os.getenv("GENAI_API_KEY"))
+HEDGE_ENABLED = os.getenv("INTENT_HEDGE", "1") == "1"
+HEDGE_QUANTILE = float(os.getenv("INTENT_HEDGE_QUANTILE", "0.95"))
+HEDGE_DEFAULT_DELAY_S = float(os.getenv("INTENT_HEDGE_DEFAULT_DELAY_S", "2.0"))
+# Maximum number of queries classified by one model call in resolve_intents
+INTENT_BATCH_SIZE = int(os.getenv("INTENT_BATCH_SIZE", "20"))
 
 
 class AmenityQueryIntent(BaseModel):
@@ -19,6 +31,8 @@ class AmenityQueryIntent(BaseModel):
     radius_m: int
     valid_query: bool = True
     reason_invalid: Optional[str] = None
+    source: str = "llm"  # which stage answered: "fastpath", "cache" or "llm"
+    confidence: Optional[float] = None
 
 
 DEFAULT_RADIUS = 50000  # Default radius in meters
@@ -26,6 +40,12 @@ MEDICAL_AMENITIES = [
     "clinic", "hospital", "pharmacy", "dentist", "doctors",
     "nursing_home", "childcare", "veterinary", "social_facility"
 ]
+# Spellings the model tends to use for the amenity_type values in the database
+AMENITY_ALIASES = {
+    "doctor": "doctors", "gp": "doctors", "pharmacies": "pharmacy", "hospitals": "hospital",
+    "clinics": "clinic", "dentists": "dentist", "vet": "veterinary", "vets": "veterinary",
+    "nursing_homes": "nursing_home", "nursing home": "nursing_home",
+}
 
 BASE_PROMPT = """You are an expert at understanding user queries related to medical amenities.
 The user can also provide a query about a specific medical condition or a general inquiry about medical services.
@@ -66,16 +86,38 @@ User query: "hospital within 5 km"
 Output: {"amenity_types": ["hospital"], "radius_m": 5000, "valid_query": true}
 """
 
-BASE_PROMPT = BASE_PROMPT.replace("%DEFAULT_RADIUS%", str(DEFAULT_RADIUS))
+BATCH_PROMPT = """
+You will now get several user queries instead of one, numbered from 0 and each written as a JSON string.
+Analyze every query on its own, exactly as described above.
+Output a JSON array holding one object per query, in the same order, each object with the query's number as "index".
+"""
+
 VALID_AMENITY_TYPES = ', '.join(MEDICAL_AMENITIES)
+# Filled in once at import, so requests only append the query
+BASE_PROMPT = (BASE_PROMPT.replace("%DEFAULT_RADIUS%", str(DEFAULT_RADIUS))
+               .replace("%VALID_AMENITY_TYPES%", VALID_AMENITY_TYPES)
+               .strip())
 
 
-model = genai.GenerativeModel(model_name='gemini-2.0-flash-lite')
+def normalize_amenity_types(amenity_types: List[str]) -> List[str]:
+    """
+    Maps amenity types as returned by the model onto the database values
+    ("doctor" -> "doctors"), splitting comma-joined entries such as
+    "pharmacy, doctor" and dropping duplicates while keeping their order.
+    """
+    normalized = []
+    for entry in amenity_types:
+        for amenity_type in str(entry).split(","):
+            amenity_type = amenity_type.strip().lower()
+            amenity_type = AMENITY_ALIASES.get(amenity_type, amenity_type)
+            if amenity_type and amenity_type not in normalized:
+                normalized.append(amenity_type)
+    return normalized
 
 
 def analyze_intent(user_query: str) -> AmenityQueryIntent:
-    prompt = f"{BASE_PROMPT.strip()}\n\nUser query: {user_query}"
-    response = model.generate_content(prompt)
+    prompt = f"{BASE_PROMPT}\n\nUser query: {user_query}"
+    response = get_model().generate_content(prompt)
     try:
         # Assuming the model returns a JSON string
         return parse_gemini_response(response)
@@ -86,8 +128,209 @@ def analyze_intent(user_query: str) -> AmenityQueryIntent:
                                   reason_invalid="Could not parse the model's response.")
 
 
-def parse_gemini_response(response: GenerateContentResponse) -> Optional[AmenityQueryIntent]:
-    """Parses the GenerateContentResponse and extracts the JSON content."""
+class LatencyTracker:
+    """Sliding window of recent model call latencies, used to decide when to hedge."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self._samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float, default: float) -> float:
+        if len(self._samples) < self.min_samples:
+            return default
+        return statistics.quantiles(self._samples, n=100)[min(98, max(0, int(q * 100) - 1))]
+
+
+model_latency = LatencyTracker()
+
+
+async def _generate(prompt: str) -> "GenerateContentResponse":
+    start = time.perf_counter()
+    try:
+        response = await get_model().generate_content_async(prompt)
+    except asyncio.CancelledError:
+        llm_calls.inc(outcome="cancelled")
+        raise
+    except Exception:
+        llm_calls.inc(outcome="error")
+        raise
+    elapsed = time.perf_counter() - start
+    model_latency.record(elapsed)
+    llm_calls.inc(outcome="ok")
+    llm_duration.observe(elapsed)
+    record("llm", elapsed)
+    return response
+
+
+async def _generate_hedged(prompt: str) -> "GenerateContentResponse":
+    """
+    Sends the prompt to the model and, if no answer arrived within the usual
+    (HEDGE_QUANTILE) latency, sends it once more and takes whichever
+    response comes back first. The loser is cancelled.
+    """
+    tasks = [asyncio.ensure_future(_generate(prompt))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=model_latency.quantile(HEDGE_QUANTILE, HEDGE_DEFAULT_DELAY_S))
+        if not done and HEDGE_ENABLED:
+            print("Model call slower than usual, sending hedged request")
+            llm_hedges.inc()
+            tasks.append(asyncio.ensure_future(_generate(prompt)))
+        error = None
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                return await next_done
+            except Exception as e:
+                error = e
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def analyze_intent_async(user_query: str) -> AmenityQueryIntent:
+    """Non-blocking version of `analyze_intent`, with hedged model calls."""
+    prompt = f"{BASE_PROMPT}\n\nUser query: {user_query}"
+    response = await _generate_hedged(prompt)
+    try:
+        return parse_gemini_response(response)
+    except (json.JSONDecodeError, ValidationError) as e:
+        print(f"Error parsing model response: {e}")
+        return AmenityQueryIntent(amenity_types=[], radius_m=1000, valid_query=False,
+                                  reason_invalid="Could not parse the model's response.")
+
+
+async def analyze_intent_cached(user_query: str) -> AmenityQueryIntent:
+    """
+    Same as `analyze_intent_async`, but answers repeated queries from the intent
+    cache (keyed on the normalized query text) and lets only one model call
+    per key be in flight; concurrent identical queries wait for its result.
+    Only valid intents are cached.
+    """
+    key = normalize_query(user_query)
+    cached = count_cache("intent", intent_cache.get(key))
+    if cached is not None:
+        return AmenityQueryIntent(**{**cached, "source": "cache"})
+
+    async def call_model() -> AmenityQueryIntent:
+        intent = await analyze_intent_async(user_query)
+        if intent is not None and intent.valid_query:
+            intent_cache.set(key, intent.model_dump())
+        return intent
+
+    intent = await intent_flight.do(key, call_model)
+    return intent.model_copy() if intent is not None else None
+
+
+def _fastpath_intent(local: FastPathResult, threshold: float) -> Optional[AmenityQueryIntent]:
+    if local.amenity_types and local.confidence >= threshold:
+        return AmenityQueryIntent(amenity_types=local.amenity_types, radius_m=local.radius_m or DEFAULT_RADIUS,
+                                  source="fastpath", confidence=local.confidence)
+    return None
+
+
+async def resolve_intent(user_query: str, threshold: float = FASTPATH_THRESHOLD) -> AmenityQueryIntent:
+    """
+    Resolves the intent of a query, answering it locally when the keyword
+    fast path is at least `threshold` confident and falling back to the
+    (cached) model otherwise.
+
+    Returns:
+        AmenityQueryIntent: The intent, with `source` and `confidence` telling
+                            which stage answered and how sure the fast path was.
+    """
+    local = classify_locally(user_query)
+    intent = _fastpath_intent(local, threshold)
+    if intent is None:
+        intent = await analyze_intent_cached(user_query)
+        if intent is not None:
+            intent.confidence = local.confidence
+    if intent is not None:
+        intent_sources.inc(source=intent.source)
+    return intent
+
+
+def batch_prompt(user_queries: List[str]) -> str:
+    numbered = "\n".join(f"{i}: {json.dumps(query, ensure_ascii=False)}" for i, query in enumerate(user_queries))
+    return f"{BASE_PROMPT}\n{BATCH_PROMPT}\nUser queries:\n{numbered}"
+
+
+async def analyze_intents_batch(user_queries: List[str]) -> List[Optional[AmenityQueryIntent]]:
+    """Classifies all of `user_queries` with one (hedged) model call; None for the ones it got no answer for."""
+    response = await _generate_hedged(batch_prompt(user_queries))
+    return parse_gemini_batch_response(response, len(user_queries))
+
+
+async def resolve_intents(
+        user_queries: List[str],
+        threshold: float = FASTPATH_THRESHOLD,
+        batch_size: int = INTENT_BATCH_SIZE,
+) -> List[Union[AmenityQueryIntent, Exception]]:
+    """
+    Resolves many queries at once, like `resolve_intent` does one. Queries
+    that normalize to the same text are resolved once. Those the fast path
+    or the intent cache cannot answer are sent to the model `batch_size` per
+    call, the calls running concurrently; a query missing from a batch
+    answer falls back to a call of its own.
+
+    Returns:
+        List[Union[AmenityQueryIntent, Exception]]: One entry per query, in
+            input order: its intent, or the error that kept it from being resolved.
+    """
+    keys = [normalize_query(query) for query in user_queries]
+    queries: Dict[str, str] = {}  # key -> first query with that key
+    for key, query in zip(keys, user_queries):
+        queries.setdefault(key, query)
+    resolved: Dict[str, Union[AmenityQueryIntent, Exception]] = {}
+    confidences: Dict[str, float] = {}
+    pending: List[str] = []
+    for key, query in queries.items():
+        local = classify_locally(query)
+        confidences[key] = local.confidence
+        intent = _fastpath_intent(local, threshold)
+        if intent is None:
+            cached = count_cache("intent", intent_cache.get(key))
+            intent = AmenityQueryIntent(**{**cached, "source": "cache"}) if cached is not None else None
+        if intent is not None:
+            resolved[key] = intent
+        else:
+            pending.append(key)
+
+    chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    answers = await asyncio.gather(*(analyze_intents_batch([queries[key] for key in chunk]) for chunk in chunks),
+                                   return_exceptions=True)
+    unanswered = []
+    for chunk, answer in zip(chunks, answers):
+        if isinstance(answer, Exception):
+            print(f"Batch of {len(chunk)} queries failed, analyzing them one by one: {answer}")
+            answer = [None] * len(chunk)
+        for key, intent in zip(chunk, answer):
+            if intent is None:
+                unanswered.append(key)
+                continue
+            resolved[key] = intent
+            if intent.valid_query:
+                intent_cache.set(key, intent.model_dump())
+
+    singles = await asyncio.gather(*(analyze_intent_cached(queries[key]) for key in unanswered),
+                                   return_exceptions=True)
+    for key, intent in zip(unanswered, singles):
+        resolved[key] = intent if intent is not None else ValueError("Could not parse the model's response.")
+
+    for key, intent in resolved.items():
+        if isinstance(intent, AmenityQueryIntent):
+            if intent.source != "fastpath":
+                intent.confidence = confidences[key]
+            intent_sources.inc(source=intent.source)
+    print(f"Resolved {len(user_queries)} intents ({len(queries)} distinct) with "
+          f"{len(chunks)} batched and {len(unanswered)} single model calls")
+    return [resolved[key] if isinstance(resolved[key], Exception) else resolved[key].model_copy() for key in keys]
+
+
+def _response_json(response: "GenerateContentResponse") -> Optional[str]:
+    """The JSON text of the first candidate of a response, if any."""
     if response and response.candidates:
         first_candidate = response.candidates[0]
         if first_candidate.content and first_candidate.content.parts:
@@ -95,20 +338,57 @@ def parse_gemini_response(response: GenerateContentResponse) -> Optional[Amenity
             # The JSON might be enclosed in markdown code blocks (```json ... ```)
             # Let's try to remove those if present
             if text_part.startswith("```json") and text_part.endswith("```"):
-                json_string = text_part[len("```json"): -len("```")].strip()
-            else:
-                json_string = text_part.strip()
-            try:
-                intent_data = json.loads(json_string)
-                return AmenityQueryIntent(**intent_data)
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON: {e}")
-                return None
-            except ValidationError as e:
-                print(f"Error validating Pydantic model: {e}")
-                return None
+                return text_part[len("```json"): -len("```")].strip()
+            return text_part.strip()
     return None
 
+
+def parse_gemini_response(response: "GenerateContentResponse") -> Optional[AmenityQueryIntent]:
+    """Parses the GenerateContentResponse and extracts the JSON content."""
+    json_string = _response_json(response)
+    if json_string is None:
+        return None
+    try:
+        intent_data = json.loads(json_string)
+        return AmenityQueryIntent(**intent_data)
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON: {e}")
+        return None
+    except ValidationError as e:
+        print(f"Error validating Pydantic model: {e}")
+        return None
+
+
+def parse_gemini_batch_response(response: "GenerateContentResponse", count: int) -> List[Optional[AmenityQueryIntent]]:
+    """
+    Parses the answer to a batch prompt of `count` queries into their intents,
+    in query order. Queries the answer skipped or got wrong are None.
+    """
+    intents: List[Optional[AmenityQueryIntent]] = [None] * count
+    json_string = _response_json(response)
+    if json_string is None:
+        return intents
+    try:
+        items = json.loads(json_string)
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON: {e}")
+        return intents
+    if not isinstance(items, list):
+        print("Error decoding batch response: expected a JSON array")
+        return intents
+
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        index = item.pop("index", position)
+        if not isinstance(index, int) or not 0 <= index < count:
+            continue
+        try:
+            intents[index] = AmenityQueryIntent(**item)
+        except ValidationError as e:
+            print(f"Error validating Pydantic model: {e}")
+    return intents
+
 #
 # if __name__ == '__main__':
 #     # Example usage
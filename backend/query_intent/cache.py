@@ -0,0 +1,154 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+INTENT_CACHE_SIZE = int(os.getenv("INTENT_CACHE_SIZE", "2048"))
+INTENT_CACHE_TTL_S = float(os.getenv("INTENT_CACHE_TTL_S", str(24 * 3600)))
+INTENT_CACHE_PATH = os.getenv("INTENT_CACHE_PATH")  # optional SQLite file shared by workers
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(user_query: str) -> str:
+    """
+    Normalizes a query into its cache key: Unicode-normalized, case-folded,
+    punctuation stripped and whitespace collapsed, so "Pharmacy near me?"
+    and "pharmacy  near me" share an entry. Accents are kept because they
+    can change the meaning of a word.
+    """
+    text = unicodedata.normalize("NFKC", user_query).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache whose entries expire after `ttl_s` seconds."""
+
+    def __init__(self, maxsize: int = INTENT_CACHE_SIZE, ttl_s: float = INTENT_CACHE_TTL_S):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_s, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    On-disk cache backend that several uvicorn workers on one host can
+    share. Values are stored as JSON with an absolute expiry time.
+    """
+
+    def __init__(self, path: str, ttl_s: float = INTENT_CACHE_TTL_S):
+        self.ttl_s = ttl_s
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS intent_cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM intent_cache WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO intent_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + self.ttl_s))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM intent_cache")
+
+
+class TieredCache:
+    """In-process LRU in front of an optional shared backend."""
+
+    def __init__(self, local: LRUCache, shared=None):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key: str) -> Optional[Dict]:
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: Dict) -> None:
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def clear(self) -> None:
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller starts the
+    coroutine as a task, everyone else arriving meanwhile awaits that same
+    task. Waiters are shielded from each other, so one caller timing out
+    does not cancel the call for the rest.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[object]]):
+        future = self._calls.get(key)
+        if future is None:
+            future = self._calls[key] = asyncio.ensure_future(fn())
+            future.add_done_callback(lambda f: self._done(key, f))
+        return await asyncio.shield(future)
+
+    def _done(self, key: str, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            future.exception()  # mark as retrieved even if every waiter gave up
+
+
+intent_cache = TieredCache(
+    LRUCache(),
+    SQLiteCache(INTENT_CACHE_PATH) if INTENT_CACHE_PATH else None,
+)
+intent_flight = SingleFlight()
@@ -0,0 +1,178 @@
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from query_intent.cache import normalize_query
+
+FASTPATH_THRESHOLD = float(os.getenv("INTENT_FASTPATH_THRESHOLD", "0.75"))
+
+DIRECT_CONFIDENCE = 0.95
+SYMPTOM_CONFIDENCE = 0.8
+UNCERTAIN_SYMPTOM_CONFIDENCE = 0.6  # below FASTPATH_THRESHOLD: symptom words without medical context
+NEGATED_CONFIDENCE = 0.4
+OFF_TOPIC_CONFIDENCE = 0.4
+UNCLEAR_DISTANCE_CONFIDENCE = 0.6  # a distance that is not a search radius, or one too small to be meant
+MIN_RADIUS_M = 100
+LONG_QUERY_TOKENS = 12
+LONG_QUERY_PENALTY = 0.15
+
+# Words naming an amenity directly (English, Dutch, French, German).
+# A trailing "*" matches any word starting with the term.
+AMENITY_TERMS: Dict[str, List[str]] = {
+    "pharmacy": ["pharmac*", "chemist*", "drugstore*", "apothe*", "pharmacie*"],
+    "hospital": ["hospital*", "ziekenhui*", "hopita*", "krankenh*", "spoed*", "emergency", "urgence*",
+                 "notaufnahme"],
+    "doctors": ["doctor*", "gp", "physician*", "huisarts*", "dokter*", "de arts", "een arts", "artsen", "medecin*",
+                "generaliste*", "arzt", "arzte", "arztin", "hausarzt*"],
+    "dentist": ["dentist*", "tandarts*", "dentiste*", "zahnarzt*", "tandpijn", "kiespijn", "toothache"],
+    "clinic": ["clinic*", "kliniek*", "polikliniek*", "clinique*", "klinik*"],
+    "veterinary": ["vet", "vets", "veterinar*", "dierenarts*", "veterinaire*", "tierarzt*", "tierklinik*"],
+    "nursing_home": ["nursing home*", "care home*", "rusthuis*", "woonzorgcentr*", "verpleeghui*",
+                     "maison de repos", "maison de retraite", "altenheim*", "pflegeheim*"],
+    "childcare": ["childcare", "daycare", "day care", "kinderopvang", "kinderdagverblijf*", "creche*",
+                  "kita", "kindertagesstatte"],
+    "social_facility": ["social facilit*", "shelter*", "ocmw", "cpas", "opvangcentr*", "daklozenopvang"],
+}
+
+# Symptoms and needs that imply a set of amenities without naming one. Words with a common
+# non-medical sense ("cold", "broken", "rash", "stroke") only appear in medical phrases.
+SYMPTOM_TERMS: List[Tuple[List[str], List[str]]] = [
+    (["fever", "koorts*", "fievre", "fieber", "flu", "griep*", "grippe", "cough*", "hoest*", "toux",
+      "husten", "common cold", "a cold", "verkoudheid", "headache", "hoofdpijn", "sore throat", "keelpijn",
+      "mal de gorge", "skin rash", "huiduitslag"],
+     ["pharmacy", "doctors"]),
+    (["prescription*", "medicine*", "medication*", "medicijn*", "geneesmiddel*", "painkiller*", "paracetamol",
+      "ibuprofen", "medicament*", "medikament*", "voorschrift*", "ordonnance"],
+     ["pharmacy"]),
+    (["broken arm*", "broken leg*", "broken wrist*", "broken ankle*", "broken bone*", "broken rib*",
+      "broken nose", "fracture*", "gebroken arm*", "gebroken been", "botbreuk*", "bleeding", "bloed*",
+      "accident*", "ongeval*", "unconscious", "bewusteloos", "chest pain", "borstpijn", "heart attack",
+      "hartaanval", "had a stroke", "having a stroke", "beroerte"],
+     ["hospital"]),
+]
+
+# A symptom match is only trusted when the query also reads as being about health
+MEDICAL_CONTEXT = ["sick", "ill", "unwell", "pain*", "hurt*", "ache*", "injur*", "symptom*", "ziek*", "pijn*",
+                   "gewond*", "malade", "douleur*", "blesse*", "krank*", "schmerz*", "verletz*"]
+
+# Animals turn the human medical amenities into a vet ("my dog is bleeding")
+ANIMAL_TERMS = ["dog", "dogs", "puppy", "puppies", "cat", "cats", "kitten*", "pet", "pets", "rabbit*",
+                "horse*", "hond", "honden", "hondje", "kat", "katten", "poes*", "huisdier*", "konijn*",
+                "paard*", "chien*", "chiot*", "lapin*", "cheval", "chevaux", "hund", "hunde", "katze*",
+                "haustier*", "kaninchen", "pferd*"]
+HUMAN_MEDICAL = {"hospital", "doctors", "clinic"}
+
+# Queries naming an amenity without looking for one ("I am a doctor looking for a job")
+OFF_TOPIC = ["job", "jobs", "vacanc*", "vacature*", "career*", "hiring", "recruit*", "internship*", "salary",
+             "salaris", "sollicit*", "emploi*", "stellenangebot*", "i am a", "i am an", "i m a", "i m an",
+             "ik ben", "je suis", "ich bin"]
+
+# Contractions lose their apostrophe during normalization ("don't" -> "don t")
+NEGATIONS = {"not", "no", "don", "doesn", "didn", "isn", "without", "geen", "niet", "zonder", "sans", "kein",
+             "keine", "nicht", "ohne"}
+
+_DISTANCE = r"(\d+(?:[.,]\d+)?)\s*(km|kilomet(?:er|re)s?|kilometers?|m|met(?:er|re)s?|mi|miles?|mijl)\b"
+# A distance is only a search radius after a cue word: "dentist 10m from the station" is not a 10 m search
+_RADIUS = re.compile(r"\b(?:within|in|under|max|maximum|up to|less than|binnen|tot|dans un rayon de|a moins de|"
+                     r"innerhalb(?: von)?|im umkreis von)\s+(?:a radius of\s+|een straal van\s+)?" + _DISTANCE)
+_ANY_DISTANCE = re.compile(_DISTANCE)
+_RADIUS_UNITS = {"km": 1000.0, "m": 1.0, "mi": 1609.344, "mijl": 1609.344}
+
+
+class FastPathResult(BaseModel):
+    amenity_types: List[str]
+    radius_m: Optional[int] = None
+    confidence: float
+
+
+def _fold(text: str) -> str:
+    # Accent-insensitive matching: "hôpital" -> "hopital", "ärztin" -> "arztin"
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def _compile(terms: List[str]) -> re.Pattern:
+    parts = [re.escape(t[:-1]) + r"\w*" if t.endswith("*") else re.escape(t) for t in terms]
+    return re.compile(r"\b(?:" + "|".join(parts) + r")\b")
+
+
+@lru_cache(maxsize=1)
+def _patterns() -> Tuple[Dict[str, re.Pattern], List[Tuple[re.Pattern, List[str]]], re.Pattern, re.Pattern,
+                         re.Pattern]:
+    # Compiled on the first classification rather than at import, which keeps cold starts short
+    return ({amenity: _compile(terms) for amenity, terms in AMENITY_TERMS.items()},
+            [(_compile(terms), amenities) for terms, amenities in SYMPTOM_TERMS],
+            _compile(MEDICAL_CONTEXT), _compile(ANIMAL_TERMS), _compile(OFF_TOPIC))
+
+
+def extract_radius_m(text: str) -> Optional[int]:
+    """
+    Extracts an explicit search radius such as "within 5 km" or "binnen 500 m",
+    in meters. The distance must follow a cue word ("within", "binnen", ...).
+    """
+    match = _RADIUS.search(_fold(text))
+    if not match:
+        return None
+    value = float(match.group(1).replace(",", "."))
+    unit = match.group(2)
+    if unit.startswith("k"):
+        factor = _RADIUS_UNITS["km"]
+    elif unit.startswith("mi") or unit == "mijl":
+        factor = _RADIUS_UNITS["mi"]
+    else:
+        factor = _RADIUS_UNITS["m"]
+    return int(value * factor)
+
+
+def classify_locally(user_query: str) -> FastPathResult:
+    """
+    Classifies a query with multilingual keyword rules, without calling the
+    model. Queries naming an amenity directly score highest, symptom-only
+    queries a bit lower, and only when the query also reads as medical (a
+    pain, an injury, a sick person or pet). Negated, long or off-topic
+    queries (a job search) are marked uncertain so they fall through to the
+    LLM, as are distances that are not a search radius ("10m from the
+    station") or one below MIN_RADIUS_M. A query about an animal asks for a
+    vet rather than a doctor or a hospital.
+
+    Returns:
+        FastPathResult: The amenity types and radius found, with a
+                        confidence between 0 (no idea) and 1.
+    """
+    text = _fold(normalize_query(user_query))
+    radius_m = extract_radius_m(user_query.casefold())  # before normalization drops the decimal point
+
+    amenity_patterns, symptom_patterns, medical_context, animals, off_topic = _patterns()
+    amenity_types = [amenity for amenity, pattern in amenity_patterns.items() if pattern.search(text)]
+    confidence = DIRECT_CONFIDENCE if amenity_types else 0.0
+    about_animal = animals.search(text) is not None
+    if not amenity_types:
+        for pattern, amenities in symptom_patterns:
+            if pattern.search(text):
+                amenity_types.extend(a for a in amenities if a not in amenity_types)
+        if amenity_types:
+            medical = about_animal or medical_context.search(text) is not None
+            confidence = SYMPTOM_CONFIDENCE if medical else UNCERTAIN_SYMPTOM_CONFIDENCE
+
+    if about_animal and HUMAN_MEDICAL.intersection(amenity_types):
+        amenity_types = ["veterinary"] + [a for a in amenity_types
+                                          if a not in HUMAN_MEDICAL and a != "veterinary"]
+
+    if amenity_types:
+        tokens = text.split()
+        if NEGATIONS.intersection(tokens):
+            confidence = min(confidence, NEGATED_CONFIDENCE)
+        if off_topic.search(text):
+            confidence = min(confidence, OFF_TOPIC_CONFIDENCE)
+        if len(tokens) > LONG_QUERY_TOKENS:
+            confidence -= LONG_QUERY_PENALTY
+        if (radius_m is None and _ANY_DISTANCE.search(user_query.casefold())) or (
+                radius_m is not None and radius_m < MIN_RADIUS_M):
+            confidence = min(confidence, UNCLEAR_DISTANCE_CONFIDENCE)
+    if radius_m is not None and radius_m < MIN_RADIUS_M:
+        radius_m = None
+
+    return FastPathResult(amenity_types=amenity_types, radius_m=radius_m, confidence=confidence)
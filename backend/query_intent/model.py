@@ -0,0 +1,34 @@
+"""
+The Gemini model shared by every caller. It is created on first use, so
+importing the app (a cold start on Vercel) does not pay for loading
+google.generativeai.
+"""
+import os
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODEL_NAME = "gemini-2.0-flash-lite"
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """The shared GenerativeModel, configured with GENAI_API_KEY on the first call."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GENAI_API_KEY"))
+                _model = genai.GenerativeModel(model_name=MODEL_NAME)
+    return _model
+
+
+def set_model(model) -> None:
+    """Replaces the shared model, e.g. with a local fake in the benchmarks."""
+    global _model
+    _model = model
@@ -0,0 +1,49 @@
+"""
+Builds the memory-mapped POI dataset the API serves from when
+POI_DATASET_PATH points at it (see poi/dataset.py).
+
+    python -m scripts.build_dataset --output data/poi.bin             # from medical_amenity, with embeddings
+    python -m scripts.build_dataset --csv data/medical_amenities_cleaned.csv --output data/poi.bin
+
+The file is replaced atomically; running workers map the new version on
+their next lookup.
+"""
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from poi.dataset import write_dataset
+
+COLUMNS = "id, amenity_type, metadata, lat, lon, embedding"
+PAGE_SIZE = 1000
+
+
+def rows_from_db() -> List[Dict]:
+    from db import supabase
+    rows = []
+    while True:
+        query = supabase.table("medical_amenity").select(COLUMNS).order("id").limit(PAGE_SIZE)
+        if rows:
+            query = query.gt("id", rows[-1]["id"])
+        page = query.execute().data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+
+
+def rows_from_csv(path: str) -> List[Dict]:
+    from db_memory import MemoryClient
+    return MemoryClient.from_csv(path).tables["medical_amenity"].rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the memory-mapped POI dataset.")
+    parser.add_argument("--csv", help="Cleaned amenities CSV to read instead of the database (no embeddings)")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--version", help="Dataset version. Defaults to the current UTC time.")
+    args = parser.parse_args()
+
+    version = args.version or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    rows = rows_from_csv(args.csv) if args.csv else rows_from_db()
+    count = write_dataset(args.output, rows, version)
+    print(f"Wrote {count} amenities to {args.output} (version {version})")
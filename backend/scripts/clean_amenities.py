@@ -0,0 +1,256 @@
+"""
+Cleans a raw OSM amenities extract into the table the later stages read
+(geocodeenrichment.py, populate.py, build_dataset.py), in bounded memory.
+
+The CSV is read `--chunk-size` rows at a time. For each chunk, rows whose
+raw tags cannot name a medical amenity are dropped with one regex match
+over the column, before any of them is parsed; the tags of the rest are
+parsed and the fields read out of them into columns in one pass. The
+amenity, name, website, phone, email, opening_hours and address columns
+are derived from those with column operations. The chunk is then appended
+to a Parquet file (or an Arrow IPC file) as one row group, so memory stays
+flat whatever the size of the extract.
+
+    python -m scripts.clean_amenities --input extract.csv --output medical_amenities.parquet
+"""
+import argparse
+import ast
+import json
+import re
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+CHUNK_SIZE = 50_000
+MEDICAL_AMENITIES = ["baby_hatch", "clinic", "dentist", "doctors", "hospital", "nursing_home", "pharmacy",
+                     "veterinary"]
+# Output column -> OSM tags it is read from, first present tag wins
+FIELD_TAGS: Dict[str, List[str]] = {
+    "name": ["name"],
+    "website": ["website", "contact:website"],
+    "phone": ["phone", "contact:phone"],
+    "email": ["email", "contact:email"],
+    "opening_hours": ["opening_hours"],
+}
+ADDRESS_TAGS = ["addr:street", "addr:housenumber", "addr:postcode", "addr:city"]
+# Every tag clean_chunk reads
+TAG_KEYS = list(dict.fromkeys(["amenity"] + [key for keys in FIELD_TAGS.values() for key in keys] + ADDRESS_TAGS))
+# Output columns and their Arrow types, fixed so that every chunk is written with the same schema
+OUTPUT_SCHEMA: Dict[str, str] = {
+    "id": "int64", "type": "string", "metadata": "string", "lat": "float64", "lon": "float64",
+    "amenity": "string", "name": "string", "website": "string", "phone": "string", "email": "string",
+    "opening_hours": "string", "is_address_null": "bool", "address": "string",
+}
+OUTPUT_COLUMNS = list(OUTPUT_SCHEMA)
+
+# A Python dict repr of string keys and values, as the extracts store their tags
+_STRING = r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\""
+_PAIR = re.compile(rf"\s*({_STRING})\s*:\s*({_STRING})\s*([,}}])")
+
+
+def _unquote(token: str) -> str:
+    return ast.literal_eval(token) if "\\" in token else token[1:-1]
+
+
+def _parse_repr(text: str) -> Optional[Dict[str, str]]:
+    """Parses `{'key': 'value', ...}` without ast; None when the text is anything else."""
+    if not (text.startswith("{") and text.endswith("}")):
+        return None
+    if not text[1:-1].strip():
+        return {}
+    tags, position = {}, 1
+    while True:
+        match = _PAIR.match(text, position)
+        if match is None:
+            return None
+        tags[_unquote(match.group(1))] = _unquote(match.group(2))
+        position = match.end()
+        if match.group(3) == "}":
+            return tags if position == len(text) else None
+
+
+def parse_tags(value: Any) -> Dict[str, Any]:
+    """
+    The tags dict of a metadata cell, whether it holds JSON or the Python
+    repr of a dict (as pandas writes dict columns to CSV). Anything else
+    parses to an empty dict.
+    """
+    if isinstance(value, dict):
+        return value
+    if not isinstance(value, str) or not value:
+        return {}
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        parsed = _parse_repr(value)
+        if parsed is None:
+            try:
+                parsed = ast.literal_eval(value)
+            except (ValueError, SyntaxError, MemoryError, RecursionError):
+                return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+
+def _tag_column(fields: pd.DataFrame, keys: List[str]) -> pd.Series:
+    column = fields[keys[0]]
+    for key in keys[1:]:
+        column = column.fillna(fields[key])
+    return column
+
+
+def _amenity_pattern(amenities: List[str]) -> re.Pattern:
+    """Matches the raw tags, JSON or dict repr, of the rows whose amenity is one of `amenities`."""
+    values = "|".join(re.escape(amenity) for amenity in amenities)
+    return re.compile(rf"""["']amenity["']\s*:\s*["'](?:{values})["']""")
+
+
+def clean_chunk(chunk: pd.DataFrame, amenities: Iterable[str] = MEDICAL_AMENITIES,
+                tags_column: str = "metadata") -> pd.DataFrame:
+    """Cleans one chunk of the extract into OUTPUT_COLUMNS, keeping only `amenities`."""
+    amenities = list(amenities)
+    raw = chunk[tags_column]
+    if raw.dtype == object or pd.api.types.is_string_dtype(raw.dtype):
+        # Only rows that may hold one of the amenities are parsed; cells that are not text are parsed anyway
+        maybe = raw.str.contains(_amenity_pattern(amenities), na=True).to_numpy(dtype=bool)
+        chunk = chunk[maybe]
+    tags = chunk[tags_column].map(parse_tags)
+    fields = pd.DataFrame(tags.tolist(), index=chunk.index, columns=TAG_KEYS, dtype=object)
+    keep = fields["amenity"].isin(amenities).to_numpy()
+    chunk, tags, fields = chunk[keep], tags[keep], fields[keep]
+    amenity = fields["amenity"]
+
+    out = pd.DataFrame({
+        "id": pd.to_numeric(chunk["id"]).astype("int64"),
+        "type": chunk["type"] if "type" in chunk else None,
+        "lat": pd.to_numeric(chunk["lat"], errors="coerce"),
+        "lon": pd.to_numeric(chunk["lon"], errors="coerce"),
+        "amenity": amenity,
+    })
+    for field, keys in FIELD_TAGS.items():
+        derived = _tag_column(fields, keys)
+        # Values the extract already has as columns take precedence over the tags
+        out[field] = chunk[field].where(chunk[field].notna(), derived) if field in chunk else derived
+
+    street, number, postcode, city = (fields[key] for key in ADDRESS_TAGS)
+    complete = street.notna() & number.notna() & postcode.notna() & city.notna()
+    built = (street + " " + number + ", " + postcode + " " + city).where(complete)
+    out["address"] = chunk["address"].where(chunk["address"].notna(), built) if "address" in chunk else built
+    out["is_address_null"] = out["address"].isna()
+
+    # Copy the derived fields into the tags of the rows missing them, which the API reads. Serializing the
+    # tags stays one json.dumps per row: they are free-form, so there is no column layout to write them from.
+    for field in FIELD_TAGS:
+        missing = (fields[field].isna() & out[field].notna()).to_numpy()
+        for row_tags, value in zip(tags[missing], out[field][missing]):
+            row_tags[field] = value
+    out["metadata"] = [json.dumps(t, ensure_ascii=False) for t in tags]
+    return out[OUTPUT_COLUMNS].reset_index(drop=True)
+
+
+def read_chunks(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """`path` (CSV or Parquet) in chunks of `chunk_size` rows."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        # Everything as text, so phone numbers and the like are not read as floats
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype=str)
+
+
+def read_table_chunks(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    A cleaned CSV or Parquet file in chunks of `chunk_size` rows, for the
+    later stages. Unlike read_chunks, CSV columns get their inferred types.
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+class ChunkWriter:
+    """
+    Appends DataFrames of the `schema` columns (OUTPUT_COLUMNS by default) to
+    a Parquet file, an Arrow IPC file (.arrow) or a CSV file (.csv).
+    """
+
+    def __init__(self, path: str, schema: Dict[str, str] = OUTPUT_SCHEMA):
+        self.path = path
+        self.columns = list(schema)
+        self._writer = None
+        self._rows = 0
+        if path.endswith(".csv"):
+            return
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Writing Parquet or Arrow needs pyarrow: pip install pyarrow")
+        import pyarrow as pa
+        self.schema = pa.schema([(name, pa.type_for_alias(type_name)) for name, type_name in schema.items()])
+        if path.endswith(".arrow"):
+            self._writer = pa.ipc.new_file(path, self.schema)
+        else:
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, df: pd.DataFrame) -> None:
+        df = df[self.columns]
+        if self._writer is None:
+            df.to_csv(self.path, mode="a" if self._rows else "w", header=not self._rows, index=False, quoting=1)
+            self._rows += len(df)
+            return
+        import pyarrow as pa
+        for field in self.schema:
+            column = df[field.name]
+            if field.name == "metadata" and column.dtype == object:
+                # Arrow has no type for free-form dicts, so the tags are stored as JSON text
+                df = df.assign(metadata=column.map(
+                    lambda v: json.dumps(v, ensure_ascii=False) if isinstance(v, dict) else v))
+            elif pa.types.is_string(field.type) and column.dtype.kind in "biuf":
+                # A chunk where a text column is all missing, or all numbers (phone numbers), reads it as numbers
+                df = df.assign(**{field.name: column.map(lambda v: None if pd.isna(v) else str(v)).astype(object)})
+        self._writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+        self._rows += len(df)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+def run(input_path: str, output_path: str, chunk_size: int = CHUNK_SIZE,
+        amenities: Iterable[str] = MEDICAL_AMENITIES) -> Dict[str, int]:
+    amenities = list(amenities)
+    writer = ChunkWriter(output_path)
+    stats = {"read": 0, "kept": 0, "chunks": 0}
+    start = time.perf_counter()
+    try:
+        for chunk in read_chunks(input_path, chunk_size):
+            tags_column = "metadata" if "metadata" in chunk else "tags"
+            cleaned = clean_chunk(chunk, amenities, tags_column)
+            if len(cleaned):
+                writer.write(cleaned)
+            stats["read"] += len(chunk)
+            stats["kept"] += len(cleaned)
+            stats["chunks"] += 1
+            print(f"{stats['read']} rows read, {stats['kept']} kept "
+                  f"({stats['read'] / (time.perf_counter() - start):.0f} rows/s)", file=sys.stderr)
+    finally:
+        writer.close()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean a raw OSM amenities extract into Parquet or Arrow.")
+    parser.add_argument("--input", required=True, help="CSV (or Parquet) with id, type, metadata/tags, lat, lon")
+    parser.add_argument("--output", default="medical_amenities.parquet", help="A .parquet or .arrow file")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--amenities", default=",".join(MEDICAL_AMENITIES),
+                        type=lambda s: [a.strip() for a in s.split(",") if a.strip()],
+                        help="Amenity values to keep, comma-separated")
+    args = parser.parse_args()
+    print(run(args.input, args.output, args.chunk_size, args.amenities))
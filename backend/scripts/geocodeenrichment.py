@@ -1,80 +1,263 @@
-import pandas as pd
+"""
+Fills in missing coordinates and addresses of the raw amenities export.
+
+Every distinct address and coordinate pair is looked up once: answers,
+misses included, are kept in a SQLite cache keyed on the normalized address
+or the rounded coordinates. Lookups not in the cache yet run concurrently
+against the configured geocoder, so a rerun on a refreshed export only
+queries what is new, and a crashed run resumes with what it already had.
+The export is read and written `--chunk-size` rows at a time, so memory
+stays flat whatever its size.
+
+    python -m scripts.geocodeenrichment [--input PATH] [--output PATH] [--cache PATH]
+                                        [--backend nominatim|fixture] [--domain HOST]
+                                        [--fixture PATH] [--concurrency N] [--chunk-size N]
+
+The input and output may be CSV or Parquet, by their extension.
+"""
+import argparse
 import json
-from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
+import re
+import sqlite3
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Optional, Tuple
+
+import pandas as pd
 
-# Load the original CSV
-df = pd.read_csv("medical_amenities.csv")
+from scripts.clean_amenities import CHUNK_SIZE, ChunkWriter, parse_tags, read_table_chunks
 
-# Geocoder setup
-geolocator = Nominatim(user_agent="medical_data_enricher")
-geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1)
-reverse = RateLimiter(geolocator.reverse, min_delay_seconds=1)
+COORD_DECIMALS = 5  # ~1 m, finer than any geocoder answer
+PUBLIC_NOMINATIM = "nominatim.openstreetmap.org"
+# Columns written by `enrich` and their Arrow types, for Parquet output
+ENRICHED_SCHEMA: Dict[str, str] = {
+    "id": "int64", "type": "string", "metadata": "string", "lat": "float64", "lon": "float64",
+    "amenity": "string", "website": "string", "phone": "string", "email": "string", "is_address_null": "bool",
+    "address": "string",
+}
+
+Coordinates = Tuple[float, float]
 
 
 # Helper function to parse and clean metadata field
 def parse_metadata(metadata_str):
-    try:
-        return json.loads(metadata_str.replace("'", '"'))
-    except Exception:
-        return {}
+    return dict(parse_tags(metadata_str))
+
+
+def normalize_address(address: str) -> str:
+    text = unicodedata.normalize("NFKC", address).casefold()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def coordinate_key(lat: float, lon: float) -> str:
+    return f"{round(float(lat), COORD_DECIMALS)},{round(float(lon), COORD_DECIMALS)}"
+
+
+class GeocodeCache:
+    """
+    Forward and reverse geocoding answers persisted in SQLite; a None answer
+    is a cached miss. Each table is read once and then kept up to date in
+    memory, so every chunk of the export sees the answers of the previous ones.
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS forward (key TEXT PRIMARY KEY, lat REAL, lon REAL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS reverse (key TEXT PRIMARY KEY, address TEXT)")
+        self._forward: Optional[Dict[str, Optional[Coordinates]]] = None
+        self._reverse: Optional[Dict[str, Optional[str]]] = None
+
+    def forward(self) -> Dict[str, Optional[Coordinates]]:
+        if self._forward is None:
+            rows = self._conn.execute("SELECT key, lat, lon FROM forward")
+            self._forward = {key: None if lat is None else (lat, lon) for key, lat, lon in rows}
+        return self._forward
+
+    def reverse(self) -> Dict[str, Optional[str]]:
+        if self._reverse is None:
+            self._reverse = dict(self._conn.execute("SELECT key, address FROM reverse"))
+        return self._reverse
+
+    def put_forward(self, key: str, value: Optional[Coordinates]) -> None:
+        lat, lon = value if value else (None, None)
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO forward (key, lat, lon) VALUES (?, ?, ?)", (key, lat, lon))
+        self.forward()[key] = value
+
+    def put_reverse(self, key: str, value: Optional[str]) -> None:
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO reverse (key, address) VALUES (?, ?)", (key, value))
+        self.reverse()[key] = value
+
+
+class NominatimBackend:
+    """
+    Geocodes through a Nominatim server. The public instance only allows one
+    request per second, so requests to it are rate limited; point `domain`
+    at a local Nominatim to look up concurrently.
+    """
+
+    def __init__(self, domain: str = PUBLIC_NOMINATIM, user_agent: str = "medical_data_enricher"):
+        from geopy.extra.rate_limiter import RateLimiter
+        from geopy.geocoders import Nominatim
+
+        public = domain == PUBLIC_NOMINATIM
+        geolocator = Nominatim(user_agent=user_agent, domain=domain, scheme="https" if public else "http")
+        self._geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1) if public else geolocator.geocode
+        self._reverse = RateLimiter(geolocator.reverse, min_delay_seconds=1) if public else geolocator.reverse
+        self.max_concurrency = 1 if public else None
 
+    def geocode(self, address: str) -> Optional[Coordinates]:
+        location = self._geocode(address)
+        return (location.latitude, location.longitude) if location else None
 
-# Enrich each row
-enriched_rows = []
+    def reverse(self, lat: float, lon: float) -> Optional[str]:
+        location = self._reverse((lat, lon), language="en")
+        return location.address if location and location.address else None
 
-for _, row in df.iterrows():
-    metadata = parse_metadata(row.get("metadata", "{}"))
 
-    lat = row.get("lat", None)
-    lon = row.get("lon", None)
-    address = row.get("address", None)
-    name = metadata.get("name")
+class FixtureBackend:
+    """
+    Answers from a JSON file instead of a server, for offline runs:
+    {"forward": {"<normalized address>": [lat, lon]}, "reverse": {"<lat>,<lon>": "address"}}.
+    """
+
+    max_concurrency = None
+
+    def __init__(self, path: str):
+        with open(path) as f:
+            fixture = json.load(f)
+        self._forward = fixture.get("forward", {})
+        self._reverse = fixture.get("reverse", {})
+
+    def geocode(self, address: str) -> Optional[Coordinates]:
+        found = self._forward.get(normalize_address(address))
+        return tuple(found) if found else None
+
+    def reverse(self, lat: float, lon: float) -> Optional[str]:
+        return self._reverse.get(coordinate_key(lat, lon))
+
+
+def resolve(
+        queries: Dict[str, tuple],
+        cached: Dict,
+        lookup: Callable,
+        store: Callable[[str, object], None],
+        concurrency: int,
+) -> Dict:
+    """
+    Answers each distinct query key once: from `cached` when possible,
+    otherwise by calling `lookup(*args)` on `concurrency` threads and storing
+    each answer as it arrives. Failed lookups are not stored, so the next
+    run retries them.
+    """
+    answers = {key: cached[key] for key in queries if key in cached}
+    missing = {key: args for key, args in queries.items() if key not in cached}
+    print(f"{len(queries)} distinct lookups, {len(answers)} cached, {len(missing)} to query")
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {pool.submit(lookup, *args): key for key, args in missing.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                answers[key] = future.result()
+            except Exception as e:
+                print(f"Lookup failed for {key}: {e}")
+                continue
+            store(key, answers[key])
+    return answers
+
+
+def _needs_address(row, address) -> bool:
+    return pd.isna(address) or bool(row.get("is_address_null", False))
+
+
+def enrich(df: pd.DataFrame, backend, cache: GeocodeCache, concurrency: int = 8) -> pd.DataFrame:
+    if backend.max_concurrency:
+        concurrency = min(concurrency, backend.max_concurrency)
+    records = df.to_dict("records")
 
     # Add lat/lon if missing and address is present
-    if pd.isna(lat) or pd.isna(lon):
-        if pd.notna(address):
-            location = geocode(address)
-            if location:
-                lat = location.latitude
-                lon = location.longitude
+    forward_queries: Dict[str, tuple] = {}
+    for row in records:
+        if (pd.isna(row.get("lat")) or pd.isna(row.get("lon"))) and pd.notna(row.get("address")):
+            forward_queries.setdefault(normalize_address(row["address"]), (row["address"],))
+    located = resolve(forward_queries, cache.forward(), backend.geocode, cache.put_forward, concurrency)
+    for row in records:
+        if (pd.isna(row.get("lat")) or pd.isna(row.get("lon"))) and pd.notna(row.get("address")):
+            found = located.get(normalize_address(row["address"]))
+            if found:
+                row["lat"], row["lon"] = found
 
     # Add address if missing and lat/lon is present
-    if (pd.isna(address) or row.get("is_address_null", False)) and pd.notna(lat) and pd.notna(lon):
-        location = reverse((lat, lon), language="en")
-        if location and location.address:
-            address = location.address
-
-    # Fill in other missing metadata fields
-    if not metadata.get("name") and pd.notna(row.get("name")):
-        metadata["name"] = row["name"]
-
-    if not metadata.get("website") and pd.notna(row.get("website")):
-        metadata["website"] = row["website"]
-
-    if not metadata.get("phone") and pd.notna(row.get("phone")):
-        metadata["phone"] = row["phone"]
-
-    if not metadata.get("email") and pd.notna(row.get("email")):
-        metadata["email"] = row["email"]
-
-    if not metadata.get("opening_hours") and pd.notna(row.get("opening_hours")):
-        metadata["opening_hours"] = row["opening_hours"]
-
-    enriched_rows.append({
-        "id": row["id"],
-        "type": row["type"],
-        "metadata": metadata,
-        "lat": lat,
-        "lon": lon,
-        "amenity": row["amenity"],
-        "website": row.get("website", ""),
-        "phone": row.get("phone", ""),
-        "email": row.get("email", ""),
-        "is_address_null": row.get("is_address_null", False),
-        "address": address,
-    })
-
-# Save to new CSV
-new_df = pd.DataFrame(enriched_rows)
-new_df.to_csv("medical_amenities_cleaned.csv", index=False, quoting=1)
+    reverse_queries: Dict[str, tuple] = {}
+    for row in records:
+        if _needs_address(row, row.get("address")) and pd.notna(row.get("lat")) and pd.notna(row.get("lon")):
+            reverse_queries.setdefault(coordinate_key(row["lat"], row["lon"]), (row["lat"], row["lon"]))
+    addresses = resolve(reverse_queries, cache.reverse(), backend.reverse, cache.put_reverse, concurrency)
+
+    enriched_rows = []
+    for row in records:
+        metadata = parse_metadata(row.get("metadata", "{}"))
+        lat, lon, address = row.get("lat", None), row.get("lon", None), row.get("address", None)
+
+        if _needs_address(row, address) and pd.notna(lat) and pd.notna(lon):
+            address = addresses.get(coordinate_key(lat, lon)) or address
+
+        # Fill in other missing metadata fields
+        for field in ("name", "website", "phone", "email", "opening_hours"):
+            if not metadata.get(field) and pd.notna(row.get(field)):
+                metadata[field] = row[field]
+
+        enriched_rows.append({
+            "id": row["id"],
+            "type": row["type"],
+            "metadata": metadata,
+            "lat": lat,
+            "lon": lon,
+            "amenity": row["amenity"],
+            "website": row.get("website", ""),
+            "phone": row.get("phone", ""),
+            "email": row.get("email", ""),
+            "is_address_null": row.get("is_address_null", False),
+            "address": address,
+        })
+    return pd.DataFrame(enriched_rows)
+
+
+def run(input_path: str, output_path: str, backend, cache: GeocodeCache, concurrency: int = 8,
+        chunk_size: int = CHUNK_SIZE) -> int:
+    """Enriches `input_path` into `output_path` one chunk of `chunk_size` rows at a time; returns the rows written."""
+    writer = ChunkWriter(output_path, ENRICHED_SCHEMA)
+    written = 0
+    try:
+        for chunk in read_table_chunks(input_path, chunk_size):
+            enriched = enrich(chunk, backend, cache, concurrency)
+            if len(enriched):
+                writer.write(enriched)
+            written += len(enriched)
+    finally:
+        writer.close()
+    return written
+
+
+def _backend(args):
+    if args.backend == "fixture":
+        return FixtureBackend(args.fixture)
+    return NominatimBackend(domain=args.domain)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Geocode missing coordinates and addresses of the amenities export.")
+    parser.add_argument("--input", default="medical_amenities.csv")
+    parser.add_argument("--output", default="medical_amenities_cleaned.csv")
+    parser.add_argument("--cache", default="geocode_cache.sqlite")
+    parser.add_argument("--backend", choices=("nominatim", "fixture"), default="nominatim")
+    parser.add_argument("--domain", default=PUBLIC_NOMINATIM, help="Nominatim host, e.g. localhost:8080")
+    parser.add_argument("--fixture", help="JSON answers for --backend fixture")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    run(args.input, args.output, _backend(args), GeocodeCache(args.cache), args.concurrency, args.chunk_size)
@@ -1,16 +1,50 @@
-import ast
+"""
+Embeds the cleaned amenities and upserts them into medical_amenity.
+
+Metadata is encoded in batches and rows are written in bulk chunks keyed on
+their OSM id. Once a chunk is stored, the content hash of each of its rows
+is recorded in a local SQLite checkpoint: an interrupted run picks up where
+it stopped, and a later run over an updated CSV only re-embeds and uploads
+the rows whose content changed.
+
+    python -m scripts.populate [--csv PATH] [--state PATH] [--force]
+
+`--csv` also takes the Parquet file scripts/clean_amenities.py writes.
+"""
+import argparse
+import hashlib
 import json
+import os
+import sqlite3
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional
+
 import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer
-from db import supabase
 
+from scripts.clean_amenities import parse_tags
+
+DATA_PATH = 'data/medical_amenities_cleaned.csv'
+STATE_PATH = os.getenv("POPULATE_STATE_PATH", "populate_state.sqlite")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "BAAI/bge-m3")
+ENCODE_BATCH_SIZE = 64   # texts per forward pass of the embedding model
+UPLOAD_CHUNK_SIZE = 500  # rows per upsert request
+
+
+def load_amenities(path: str = DATA_PATH) -> pd.DataFrame:
+    """Load the CSV (or Parquet) data into pandas DataFrame"""
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path, na_values=['nan', 'null', 'None', None, np.nan])
+    df['metadata'] = df['metadata'].map(parse_tags)
+    return df
 
-# Load the CSV data into pandas DataFrame
-df = pd.read_csv('../data/medical_amenities_cleaned.csv', na_values=['nan', 'null', 'None', None, np.nan])
-df['metadata'] = df['metadata'].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
 
-model = SentenceTransformer("BAAI/bge-m3")
+@lru_cache(maxsize=1)
+def _model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL)
 
 
 def combine_metadata(metadata: dict) -> str:
@@ -18,30 +52,125 @@ def combine_metadata(metadata: dict) -> str:
     return " ".join([f"{k}: {v}" for k, v in metadata.items()])
 
 
-def upload_data_to_supabase(df):
-    for _, row in df.iterrows():
-        amenity_type = row.get('amenity', None)
-        metadata = row.get('metadata', None)
-        metadata_vec = combine_metadata(metadata) if metadata else None
-        embedding = model.encode(metadata_vec, normalize_embeddings=True) if metadata_vec else None
-        lat = row.get('lat', None)
-        lon = row.get('lon', None)
+def encode_texts(texts: List[str]) -> List[List[float]]:
+    """Normalized embeddings of `texts`, encoded ENCODE_BATCH_SIZE at a time."""
+    vectors = _model().encode(texts, batch_size=ENCODE_BATCH_SIZE, normalize_embeddings=True)
+    return [vector.tolist() for vector in vectors]
+
+
+def build_record(row: Dict) -> Dict:
+    """The medical_amenity row for one CSV record, without its embedding."""
+    metadata = row.get('metadata', None)
+    if not isinstance(metadata, dict):
+        metadata = None
+    record = {
+        'id': int(row['id']),
+        'amenity_type': row.get('amenity', None),
+        'metadata': json.dumps(metadata) if metadata else None,
+    }
+    lat, lon = row.get('lat', None), row.get('lon', None)
+    if not pd.isna(lat) and not pd.isna(lon):
+        record['lat'] = float(lat)
+        record['lon'] = float(lon)
+    return record
+
+
+def record_hash(record: Dict) -> str:
+    return hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+
+class Checkpoint:
+    """Content hash of every row already stored, persisted in SQLite."""
 
-        data = {
-            'amenity_type': amenity_type,
-            'metadata': json.dumps(metadata) if metadata else None,
-            "embedding": embedding.tolist() if embedding is not None else None,
-        }
+    def __init__(self, path: str = STATE_PATH):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS uploaded (id INTEGER PRIMARY KEY, hash TEXT NOT NULL)")
 
-        if not pd.isna(lat) and not pd.isna(lon):
-            data['lat'] = lat
-            data['lon'] = lon
+    def hashes(self) -> Dict[int, str]:
+        return dict(self._conn.execute("SELECT id, hash FROM uploaded"))
+
+    def mark(self, hashes: Dict[int, str]) -> None:
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO uploaded (id, hash) VALUES (?, ?)", hashes.items())
+
+    def clear(self) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM uploaded")
+
+
+def _chunks(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def upload_data_to_supabase(
+        df: pd.DataFrame,
+        client=None,
+        checkpoint: Optional[Checkpoint] = None,
+        encode: Callable[[List[str]], List[List[float]]] = encode_texts,
+        chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> Dict[str, int]:
+    """
+    Embeds and upserts the rows of `df` that are not in the checkpoint yet
+    or whose content changed since they were stored.
+
+    Args:
+        df (pd.DataFrame): The amenities, as returned by `load_amenities`.
+        client: A Supabase client, or a stand-in such as db_memory.MemoryClient.
+            Defaults to the one configured in db.py.
+        checkpoint (Checkpoint, optional): Where progress is recorded. Without
+            one every row is uploaded.
+        encode (Callable, optional): Turns a list of texts into embeddings.
+        chunk_size (int, optional): Rows per upsert request.
+
+    Returns:
+        Dict[str, int]: Number of rows uploaded, skipped as unchanged and failed.
+    """
+    if client is None:
+        from db import supabase as client
+
+    done = checkpoint.hashes() if checkpoint else {}
+    pending = []
+    for row in df.to_dict('records'):
+        record = build_record(row)
+        digest = record_hash(record)
+        if done.get(record['id']) != digest:
+            pending.append((record, digest))
+
+    stats = {'uploaded': 0, 'skipped': len(df) - len(pending), 'failed': 0}
+    for chunk in _chunks(pending, chunk_size):
+        records = [record for record, _ in chunk]
+        texts = [combine_metadata(json.loads(r['metadata'])) if r['metadata'] else None for r in records]
+        to_encode = [text for text in texts if text]
+        embeddings = iter(encode(to_encode) if to_encode else [])
+        for record, text in zip(records, texts):
+            record['embedding'] = next(embeddings) if text else None
 
         try:
-            supabase.table('medical_amenity').insert(data).execute()
-        except Exception:
-            print(f"Error inserting data: {data}")
+            client.table('medical_amenity').upsert(records, on_conflict='id').execute()
+        except Exception as e:
+            # Left out of the checkpoint, so the next run retries this chunk
+            print(f"Error upserting rows {records[0]['id']}..{records[-1]['id']}: {e}")
+            stats['failed'] += len(records)
+            continue
+
+        if checkpoint:
+            checkpoint.mark({record['id']: digest for record, digest in chunk})
+        stats['uploaded'] += len(records)
+        print(f"Uploaded {stats['uploaded']}/{len(pending)} rows")
+
+    return stats
 
 
 if __name__ == '__main__':
-    upload_data_to_supabase(df)
+    parser = argparse.ArgumentParser(description="Embed the cleaned amenities and upsert them into medical_amenity.")
+    parser.add_argument('--csv', default=DATA_PATH)
+    parser.add_argument('--state', default=STATE_PATH, help="SQLite checkpoint of the rows already uploaded")
+    parser.add_argument('--chunk-size', type=int, default=UPLOAD_CHUNK_SIZE)
+    parser.add_argument('--force', action='store_true', help="Forget the checkpoint and upload every row")
+    args = parser.parse_args()
+
+    checkpoint = Checkpoint(args.state)
+    if args.force:
+        checkpoint.clear()
+    print(upload_data_to_supabase(load_amenities(args.csv), checkpoint=checkpoint, chunk_size=args.chunk_size))
@@ -0,0 +1,14 @@
+-- The medical_amenity table as the API and scripts/populate.py use it, for a
+-- local Postgres (see db_postgres.py). Supabase projects already have it.
+-- embedding holds BAAI/bge-m3 vectors (EMBEDDING_MODEL), 1024 dimensions.
+
+create extension if not exists vector;
+
+create table if not exists medical_amenity (
+    id           bigint primary key,
+    amenity_type text,
+    metadata     jsonb,
+    lat          double precision,
+    lon          double precision,
+    embedding    vector(1024)
+);
@@ -0,0 +1,22 @@
+-- Version column for the API's in-memory snapshot (POI_SNAPSHOT_VERSION_COLUMN):
+-- every insert or update stamps the row, so a refresh only fetches the rows
+-- changed since the snapshot was taken.
+
+alter table medical_amenity add column if not exists updated_at timestamptz not null default now();
+
+create index if not exists medical_amenity_updated_at_idx on medical_amenity (updated_at);
+
+create or replace function medical_amenity_touch()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists medical_amenity_touch on medical_amenity;
+create trigger medical_amenity_touch
+    before insert or update on medical_amenity
+    for each row execute function medical_amenity_touch();
@@ -0,0 +1,39 @@
+-- Server-side radius search for the API (enable with POI_NEARBY_RPC=nearby_amenities).
+-- The bounding box lets Postgres use the (lat, lon) index; the haversine
+-- check then drops the corners of the box and orders by distance. 110574 m is the
+-- shortest degree of latitude (WGS-84, at the equator; the haversine sphere has
+-- 111195 m), so the box always holds the whole circle.
+
+create index if not exists medical_amenity_lat_lon_idx on medical_amenity (lat, lon);
+create index if not exists medical_amenity_type_lat_lon_idx on medical_amenity (amenity_type, lat, lon);
+
+create or replace function nearby_amenities(
+    p_lat double precision,
+    p_lon double precision,
+    p_radius_m double precision,
+    p_amenity_types text[] default null,
+    p_limit integer default null
+)
+returns setof medical_amenity
+language sql
+stable
+as $$
+    with box as (
+        select p_radius_m / 110574.0 as dlat,
+               p_radius_m / (110574.0 * greatest(cos(radians(least(89.0, abs(p_lat) + p_radius_m / 110574.0))), 1e-6)) as dlon
+    )
+    select m.*
+    from medical_amenity m, box
+    where m.lat between p_lat - box.dlat and p_lat + box.dlat
+      and m.lon between p_lon - box.dlon and p_lon + box.dlon
+      and (p_amenity_types is null or m.amenity_type = any (p_amenity_types))
+      and 2 * 6371008.8 * asin(sqrt(
+              power(sin(radians(m.lat - p_lat) / 2), 2)
+              + cos(radians(p_lat)) * cos(radians(m.lat)) * power(sin(radians(m.lon - p_lon) / 2), 2)
+          )) <= p_radius_m
+    order by 2 * 6371008.8 * asin(sqrt(
+                 power(sin(radians(m.lat - p_lat) / 2), 2)
+                 + cos(radians(p_lat)) * cos(radians(m.lat)) * power(sin(radians(m.lon - p_lon) / 2), 2)
+             ))
+    limit p_limit;
+$$;
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Tests import the app modules the way the server runs them, from backend/
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
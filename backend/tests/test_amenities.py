@@ -0,0 +1,98 @@
+import asyncio
+import base64
+import json
+import random
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from api import amenities
+from api.amenities import decode_cursor, encode_cursor
+from poi import queries
+from poi.snapshot import AmenityRecord, Snapshot, snapshot_store
+
+POINT = {"lat": 51.2194, "lon": 4.4025}
+
+
+@pytest.fixture
+def snapshot(monkeypatch):
+    rng = random.Random(2)
+    rows = [{"id": i, "amenity_type": rng.choice(["pharmacy", "dentist"]), "metadata": '{"name": "Amenity %d"}' % i,
+             "lat": POINT["lat"] + rng.uniform(-0.05, 0.05), "lon": POINT["lon"] + rng.uniform(-0.05, 0.05)}
+            for i in range(1, 1201)]
+    snapshot = Snapshot([AmenityRecord(row) for row in rows], None)
+    monkeypatch.setattr(queries, "get_snapshot", lambda: snapshot)
+    monkeypatch.setattr(amenities, "get_snapshot", lambda: snapshot)
+    monkeypatch.setattr(snapshot_store, "_snapshot", None)  # nothing is cached without a loaded snapshot
+    return snapshot
+
+
+def _get(path, **params):
+    from main import app
+
+    async def get():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(path, params=params)
+
+    return asyncio.run(get())
+
+
+def _raw(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+@pytest.mark.parametrize("key", [7, 0])
+def test_listing_cursors_round_trip(key):
+    assert decode_cursor(encode_cursor(key)) == key
+    assert decode_cursor(None) is None
+
+
+@pytest.mark.parametrize("key", [[12.5, 7], [0, 3]])
+def test_cursors_around_a_point_round_trip(key):
+    assert decode_cursor(encode_cursor(key), around_point=True) == [float(key[0]), key[1]]
+
+
+@pytest.mark.parametrize("cursor, around_point", [
+    (_raw(7), True),
+    (_raw([12.5, 7]), False),
+    (_raw("7"), False),
+    (_raw(True), False),
+    (_raw([12.5, "7"]), True),
+    (_raw([12.5, 7, 1]), True),
+    (_raw(["near", 7]), True),
+    (_raw({"id": 7}), False),
+    ("not base64!", False),
+])
+def test_malformed_cursors_are_rejected(cursor, around_point):
+    with pytest.raises(HTTPException) as raised:
+        decode_cursor(cursor, around_point)
+    assert raised.value.status_code == 400
+
+
+def test_cursor_of_the_other_listing_is_a_bad_request(snapshot):
+    assert _get("/amenities/", cursor=encode_cursor(7), **POINT).status_code == 400
+    assert _get("/amenities/", cursor=encode_cursor([120.0, 7])).status_code == 400
+
+
+def test_pages_around_a_point_follow_the_cursor(snapshot):
+    first = _get("/amenities/", limit=50, **POINT)
+    second = _get("/amenities/", limit=50, cursor=first.headers["X-Next-Cursor"], **POINT)
+    assert first.status_code == second.status_code == 200
+    ids = [row["id"] for row in first.json() + second.json()]
+    assert ids == [row["id"] for row in _get("/amenities/", limit=100, **POINT).json()]
+
+
+def test_ndjson_around_a_point_streams_the_same_rows(snapshot, monkeypatch):
+    monkeypatch.setattr(amenities, "STREAM_PAGE_SIZE", 64)
+    lines = _get("/amenities/", format="ndjson", limit=300, fields="id,distance_m", **POINT).text.splitlines()
+    page = _get("/amenities/", limit=300, fields="id,distance_m", **POINT).json()
+    assert [json.loads(line) for line in lines] == page
+
+
+def test_ndjson_around_a_point_looks_up_once_the_stream_starts(snapshot, monkeypatch):
+    calls = []
+    monkeypatch.setattr(amenities, "nearby_amenities", lambda *args, **kwargs: calls.append(args) or [])
+    lines = amenities._stream_nearby(amenities.LEAN_FIELDS, None, None, POINT["lat"], POINT["lon"], None, None)
+    assert calls == []
+    assert list(lines) == [] and len(calls) == 1
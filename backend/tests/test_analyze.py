@@ -0,0 +1,34 @@
+from benchmarks.fakes import fake_gemini_response
+from query_intent.analyze import parse_gemini_batch_response
+
+
+def test_intents_in_query_order():
+    response = fake_gemini_response(
+        '```json\n[{"index": 1, "amenity_types": ["dentist"], "radius_m": 2000},'
+        ' {"index": 0, "amenity_types": ["pharmacy"], "radius_m": 5000}]\n```')
+    first, second = parse_gemini_batch_response(response, 2)
+    assert first.amenity_types == ["pharmacy"] and first.radius_m == 5000
+    assert second.amenity_types == ["dentist"] and second.radius_m == 2000
+
+
+def test_position_is_the_index_when_the_answer_has_none():
+    response = fake_gemini_response('[{"amenity_types": ["hospital"], "radius_m": 1000}]')
+    [intent] = parse_gemini_batch_response(response, 1)
+    assert intent.amenity_types == ["hospital"]
+
+
+def test_skipped_invalid_and_out_of_range_items_are_none():
+    response = fake_gemini_response(
+        '[{"index": 0, "amenity_types": ["clinic"], "radius_m": 1000},'
+        ' {"index": 1, "radius_m": "far"},'
+        ' {"index": 7, "amenity_types": ["doctors"], "radius_m": 1000},'
+        ' "not an object"]')
+    intents = parse_gemini_batch_response(response, 3)
+    assert intents[0].amenity_types == ["clinic"]
+    assert intents[1:] == [None, None]
+
+
+def test_unparsable_answers_give_no_intents():
+    assert parse_gemini_batch_response(fake_gemini_response("no json here"), 2) == [None, None]
+    assert parse_gemini_batch_response(fake_gemini_response('{"amenity_types": []}'), 1) == [None]
+    assert parse_gemini_batch_response(None, 1) == [None]
@@ -0,0 +1,91 @@
+import asyncio
+import math
+import random
+
+import pytest
+
+from api import chat
+from poi import queries
+from poi.snapshot import AmenityRecord, Snapshot
+
+USER = (51.2194, 4.4025)
+RADIUS_M = 10000
+NIGHT = "Sun 03:00"
+
+
+def _point(rng, low_m, high_m):
+    distance, bearing = rng.uniform(low_m, high_m), rng.uniform(0, 2 * math.pi)
+    return (USER[0] + distance * math.cos(bearing) / 111195.0,
+            USER[1] + distance * math.sin(bearing) / (111195.0 * math.cos(math.radians(USER[0]))))
+
+
+def _rows(closed=500, open_=3, open_near=0, seed=11):
+    """
+    `closed` daytime pharmacies within 2 km of the user, and `open_` night
+    ones 3 to 4 km away; `open_near` more night ones within 50 m.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for i in range(closed + open_ + open_near):
+        if i < closed:
+            lat, lon = _point(rng, 0, 2000)
+        else:
+            lat, lon = _point(rng, 3000, 4000) if i < closed + open_ else _point(rng, 0, 50)
+        hours = "Mo-Fr 08:00-18:00" if i < closed else "24/7"
+        rows.append({"id": i + 1, "amenity_type": "pharmacy", "lat": lat, "lon": lon,
+                     "metadata": '{"name": "Pharmacy %d", "opening_hours": "%s"}' % (i + 1, hours)})
+    return rows
+
+
+@pytest.fixture
+def lookups(request, monkeypatch):
+    """Limits of the lookups made, with the snapshot of _rows() behind them."""
+    snapshot = Snapshot([AmenityRecord(row) for row in _rows(**getattr(request, "param", {}))], None)
+    monkeypatch.setattr(queries, "get_snapshot", lambda: snapshot)
+    limits = []
+    lookup = chat.get_relevant_locations
+
+    def counting(amenity_types, user_lat, user_lon, radius_m, limit=None):
+        limits.append(limit)
+        return lookup(amenity_types, user_lat, user_lon, radius_m, limit)
+
+    monkeypatch.setattr(chat, "get_relevant_locations", counting)
+    return limits
+
+
+def _ranked_ids(ranked):
+    return [entry["location"]["id"] for entry in ranked]
+
+
+def test_open_locations_behind_closed_ones_are_found_with_bounded_lookups(lookups):
+    ranked = asyncio.run(chat.find_ranked_locations(["pharmacy"], *USER, RADIUS_M, NIGHT))
+    everything = [location for _, location in queries.find_nearby(*USER, RADIUS_M, ["pharmacy"])]
+    assert _ranked_ids(ranked) == _ranked_ids(chat.rank_locations(everything, *USER, NIGHT))
+    assert [entry["open_now"] for entry in ranked] == [True, True, True, False, False]
+    assert None not in lookups and max(lookups) <= chat.CHAT_MAX_CANDIDATES
+
+
+def test_ranking_stops_growing_at_the_cap(lookups, monkeypatch):
+    monkeypatch.setattr(chat, "CHAT_MAX_CANDIDATES", 400)
+    ranked = asyncio.run(chat.find_ranked_locations(["pharmacy"], *USER, RADIUS_M, NIGHT))
+    assert lookups[1:] == [400]
+    assert not any(entry["open_now"] for entry in ranked)
+    assert [entry["distance_m"] for entry in ranked] == sorted(entry["distance_m"] for entry in ranked)
+
+
+def test_open_candidates_of_the_cell_need_no_further_lookup(lookups):
+    ranked = asyncio.run(chat.find_ranked_locations(["pharmacy"], *USER, RADIUS_M, "Mon 10:00"))
+    assert len(lookups) == 1 and all(entry["open_now"] for entry in ranked)
+
+
+@pytest.mark.parametrize("lookups", [{"open_near": 2}], indirect=True)
+def test_final_locations_are_yielded_before_further_lookups(lookups):
+    async def collect():
+        return [(entry["location"]["id"], len(lookups)) async for entry in
+                chat.iter_ranked_locations(["pharmacy"], *USER, RADIUS_M, NIGHT)]
+
+    yielded = asyncio.run(collect())
+    assert [lookups_made for _, lookups_made in yielded] == [1, 1, 3, 3, 3]
+    ranked = asyncio.run(chat.find_ranked_locations(["pharmacy"], *USER, RADIUS_M, NIGHT))
+    assert [amenity_id for amenity_id, _ in yielded] == _ranked_ids(ranked)
+    assert {amenity_id for amenity_id, _ in yielded[:2]} == {504, 505}
@@ -0,0 +1,51 @@
+import json
+
+import pandas as pd
+import pytest
+
+from scripts.clean_amenities import ChunkWriter, clean_chunk, read_table_chunks
+
+RAW = pd.DataFrame({
+    "id": ["1", "2", "3", "4", "5", "6"],
+    "type": ["node"] * 6,
+    "metadata": [
+        repr({"amenity": "pharmacy", "name": "Apotheek", "contact:phone": "+32 3 000",
+              "addr:street": "Meir", "addr:housenumber": "1", "addr:postcode": "2000", "addr:city": "Antwerpen"}),
+        json.dumps({"amenity": "dentist", "name": "O'Brien", "opening_hours": "Mo-Fr 09:00-17:00"}),
+        repr({"amenity": "cafe", "name": "Not medical"}),
+        repr({"name": "pharmacy", "shop": "amenity"}),
+        "not tags at all",
+        None,
+    ],
+    "lat": ["51.2", "51.3", "51.4", "51.5", "51.6", "51.7"],
+    "lon": ["4.4"] * 6,
+})
+
+
+def test_only_the_requested_amenities_are_kept():
+    out = clean_chunk(RAW)
+    assert out["id"].tolist() == [1, 2]
+    assert out["amenity"].tolist() == ["pharmacy", "dentist"]
+    assert out["phone"].tolist()[0] == "+32 3 000"
+    assert out["address"].tolist()[0] == "Meir 1, 2000 Antwerpen"
+    assert out["is_address_null"].tolist() == [False, True]
+    assert clean_chunk(RAW, ["cafe"])["id"].tolist() == [3]
+    assert clean_chunk(RAW.iloc[2:])["id"].tolist() == []
+
+
+def test_derived_fields_are_copied_into_the_tags():
+    metadata = [json.loads(m) for m in clean_chunk(RAW)["metadata"]]
+    assert metadata[0]["phone"] == "+32 3 000"
+    assert metadata[1] == {"amenity": "dentist", "name": "O'Brien", "opening_hours": "Mo-Fr 09:00-17:00"}
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet"])
+def test_chunks_are_appended(tmp_path, suffix):
+    path = str(tmp_path / f"out{suffix}")
+    writer = ChunkWriter(path)
+    for start in range(0, len(RAW), 2):
+        writer.write(clean_chunk(RAW.iloc[start:start + 2]))
+    writer.close()
+    chunks = list(read_table_chunks(path, chunk_size=1))
+    assert [len(chunk) for chunk in chunks] == [1, 1]
+    assert pd.concat(chunks)["id"].tolist() == [1, 2]
@@ -0,0 +1,107 @@
+import pytest
+
+from db_postgres import PostgresClient, PostgresQuery
+
+
+def test_table_select_with_filters_order_and_range():
+    query = (PostgresQuery(None, '"medical_amenity"').select("id, metadata->>name")
+             .gt("id", 5).in_("id", [7, 8]).ilike("amenity_type", "%ph%").order("id", desc=True).range(10, 19))
+    assert query.sql() == (
+        'select "id", ("metadata"::jsonb ->> \'name\') from "medical_amenity"'
+        ' where "id" > $1 and "id" = any($2) and "amenity_type" ilike $3 order by "id" desc limit $4 offset $5',
+        [5, [7, 8], "%ph%", 10, 10])
+
+
+def test_statement_text_does_not_depend_on_values():
+    first = PostgresQuery(None, "t").select("*").in_("id", [1]).limit(10).sql()
+    second = PostgresQuery(None, "t").select("*").in_("id", [1, 2, 3]).limit(500).sql()
+    assert first[0] == second[0] == 'select * from t where "id" = any($1) limit $2'
+
+
+def test_sql_can_be_compiled_twice():
+    query = PostgresQuery(None, "t").select("id").eq("id", 1).limit(1)
+    assert query.sql() == query.sql() == ('select "id" from t where "id" = $1 limit $2', [1, 1])
+
+
+def test_rpc_arguments_come_before_filter_parameters():
+    client = PostgresClient("postgresql://unused")  # the pool is only created by the first query
+    query = client.rpc("nearby_amenities", {"lat": 51.2, "lon": 4.4}).select("id").eq("amenity_type", "pharmacy")
+    assert query.sql() == ('select "id" from "nearby_amenities"("lat" => $1, "lon" => $2)'
+                           ' where "amenity_type" = $3', [51.2, 4.4, "pharmacy"])
+
+
+@pytest.mark.parametrize("column", ["id; drop table x", "metadata->>name'--", ""])
+def test_invalid_identifiers_are_rejected(column):
+    with pytest.raises(ValueError):
+        PostgresQuery(None, "t").select(column)
+
+
+class FakeConnection:
+    """Records the statements sent and returns the rows they would have written."""
+
+    def __init__(self):
+        self.statements = []
+
+    async def fetch(self, sql, *args):
+        self.statements.append((sql, args))
+        columns = sql[sql.index("(") + 1:sql.index(")")].replace('"', "").split(", ")
+        return [dict(zip(columns, args[i:i + len(columns)])) for i in range(0, len(args), len(columns))]
+
+    async def fetchrow(self, sql, *args):
+        return (await self.fetch(sql, *args))[0]
+
+    def transaction(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakePool:
+    def __init__(self):
+        self.connection = FakeConnection()
+
+    def acquire(self):
+        return self.connection
+
+
+@pytest.fixture
+def client():
+    client = PostgresClient("postgresql://unused")
+    pool = FakePool()
+
+    async def fake_pool():
+        return pool
+
+    client.pool = fake_pool
+    client.statements = pool.connection.statements
+    yield client
+    client.close()
+
+
+def test_rows_are_written_in_one_round_trip(client):
+    rows = [{"id": i, "amenity_type": "pharmacy", "metadata": {"name": f"P{i}"}} for i in range(1, 1001)]
+    response = client.table("medical_amenity").upsert(rows, on_conflict="id").execute()
+    [(sql, args)] = client.statements
+    assert sql.startswith('insert into "medical_amenity" ("id", "amenity_type", "metadata") values ($1, $2, $3), ')
+    assert sql.endswith('($2998, $2999, $3000) on conflict ("id") do update set'
+                        ' "amenity_type" = excluded."amenity_type", "metadata" = excluded."metadata" returning *')
+    assert args[:3] == (1, "pharmacy", '{"name": "P1"}')
+    assert [row["id"] for row in response.data] == list(range(1, 1001))
+
+
+def test_statements_stay_within_the_parameter_limit(client, monkeypatch):
+    monkeypatch.setattr("db_postgres.PG_MAX_PARAMETERS", 10)
+    client.table("t").insert([{"a": i, "b": i} for i in range(12)]).execute()
+    assert [len(args) for _, args in client.statements] == [10, 10, 4]
+
+
+def test_repeated_keys_and_other_columns_start_a_new_statement(client):
+    rows = [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}, {"id": 1, "name": "c"}, {"id": 3}]
+    response = client.table("t").upsert(rows).execute()
+    assert [args for _, args in client.statements] == [(1, "a", 2, "b"), (1, "c"), (3,)]
+    assert client.statements[2][0] == 'insert into "t" ("id") values ($1) on conflict ("id") do nothing returning *'
+    assert [row.get("name") for row in response.data] == ["a", "b", "c", None]
@@ -0,0 +1,42 @@
+import pytest
+
+from query_intent.fastpath import FASTPATH_THRESHOLD, classify_locally
+
+
+@pytest.mark.parametrize("query, amenity_types", [
+    ("nearest pharmacy", ["pharmacy"]),
+    ("waar is het dichtstbijzijnde ziekenhuis", ["hospital"]),
+    ("ik zoek een arts", ["doctors"]),
+    ("I have a fever and my head hurts", ["pharmacy", "doctors"]),
+    ("my dog is bleeding", ["veterinary"]),
+    ("doctor for my cat", ["veterinary"]),
+])
+def test_confident_answers(query, amenity_types):
+    result = classify_locally(query)
+    assert result.amenity_types == amenity_types
+    assert result.confidence >= FASTPATH_THRESHOLD
+
+
+@pytest.mark.parametrize("query", ["cold beer", "arts and crafts", "broken phone repair", "rash decision",
+                                   "stroke of luck", "bleeding edge gadgets", "I have a fever",
+                                   "I am a doctor looking for a job", "vacature apotheek assistent",
+                                   "dentist 10m from the station", "pharmacy 5 m", "pharmacy within 5 m"])
+def test_ambiguous_queries_fall_through_to_the_model(query):
+    assert classify_locally(query).confidence < FASTPATH_THRESHOLD
+
+
+def test_negated_query_is_uncertain():
+    assert classify_locally("not a pharmacy").confidence < FASTPATH_THRESHOLD
+
+
+def test_explicit_radius():
+    assert classify_locally("pharmacy within 1.5 km").radius_m == 1500
+    assert classify_locally("apotheek binnen 500 m").radius_m == 500
+    assert classify_locally("pharmacie à moins de 2 km").radius_m == 2000
+    assert classify_locally("hospital in 3 miles").radius_m == 4828
+
+
+@pytest.mark.parametrize("query", ["dentist 10m from the station", "pharmacy 5 m", "pharmacy within 5 m",
+                                   "doctor open in 5 minutes"])
+def test_distances_that_are_not_a_search_radius_are_ignored(query):
+    assert classify_locally(query).radius_m is None
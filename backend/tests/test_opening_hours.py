@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from api import chat
+from poi.dataset import MappedDataset, write_dataset
+from poi.opening_hours import compile_opening_hours, format_minute_of_week, minute_of_week
+from poi.snapshot import AmenityRecord, MappedSnapshot
+
+ROWS = [
+    {"id": 1, "amenity_type": "pharmacy", "lat": 51.2, "lon": 4.4,
+     "metadata": json.dumps({"name": "Day", "opening_hours": "Mo-Fr 09:00-18:00"})},
+    {"id": 2, "amenity_type": "pharmacy", "lat": 51.21, "lon": 4.4,
+     "metadata": json.dumps({"name": "Night", "opening_hours": "24/7"})},
+    {"id": 3, "amenity_type": "pharmacy", "lat": 51.22, "lon": 4.4,
+     "metadata": json.dumps({"name": "Unknown", "opening_hours": "by appointment"})},
+    {"id": 4, "amenity_type": "pharmacy", "lat": 51.23, "lon": 4.4, "metadata": json.dumps({"name": "None"})},
+]
+
+
+def test_weekday_ranges_and_days_off():
+    hours = compile_opening_hours("Mo-Fr 09:00-18:30; Sa 10:30-17:30; Su off")
+    assert hours.is_open(minute_of_week("Mon 09:00"))
+    assert not hours.is_open(minute_of_week("Mon 18:30"))
+    assert hours.is_open(minute_of_week("Sat 12:00"))
+    assert not hours.is_open(minute_of_week("Sun 12:00"))
+    assert format_minute_of_week(hours.next_open(minute_of_week("Sat 18:00"))) == "Mo 09:00"
+
+
+def test_several_spans_per_day():
+    hours = compile_opening_hours("Mo-Fr 09:00-12:30,13:30-18:30")
+    assert not hours.is_open(minute_of_week("Wed 13:00"))
+    assert hours.next_open(minute_of_week("Wed 13:00")) == minute_of_week("Wed 13:30")
+    assert hours.next_open(minute_of_week("Wed 10:00")) == minute_of_week("Wed 10:00")
+
+
+def test_span_past_midnight_wraps_into_the_next_day_and_week():
+    hours = compile_opening_hours("Su 22:00-02:00")
+    assert hours.is_open(minute_of_week("Sun 23:00"))
+    assert hours.is_open(minute_of_week("Mon 01:00"))
+    assert not hours.is_open(minute_of_week("Mon 02:00"))
+
+
+def test_later_rules_override_earlier_ones():
+    hours = compile_opening_hours("Mo-Sa 09:00-18:00; We off")
+    assert hours.is_open(minute_of_week("Tue 10:00"))
+    assert not hours.is_open(minute_of_week("Wed 10:00"))
+
+
+def test_additional_rule_adds_spans():
+    hours = compile_opening_hours("Mo-Fr 09:00-12:00, Sa 10:00-12:00")
+    assert hours.is_open(minute_of_week("Sat 11:00"))
+    assert hours.is_open(minute_of_week("Mon 11:00"))
+
+
+def test_always_open():
+    hours = compile_opening_hours("24/7")
+    assert hours.is_open(minute_of_week("Sun 03:00"))
+
+
+@pytest.mark.parametrize("raw", ["", "by appointment", "PH off"])
+def test_not_understood(raw):
+    assert compile_opening_hours(raw) is None
+
+
+@pytest.fixture(scope="module")
+def mapped(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("dataset") / "amenities.poi")
+    write_dataset(path, ROWS, "v1")
+    return MappedSnapshot(MappedDataset(path))
+
+
+def test_records_carry_their_compiled_hours(mapped):
+    for records in ([AmenityRecord(row) for row in ROWS], list(mapped.scan())):
+        assert records[0].opening_hours is compile_opening_hours("Mo-Fr 09:00-18:00")
+        assert records[1].opening_hours.is_open(minute_of_week("Sun 03:00"))
+        assert records[2].opening_hours is None and records[3].opening_hours is None
+
+
+def test_ranking_reads_the_hours_off_the_records(mapped, monkeypatch):
+    def decode(metadata):
+        raise AssertionError("opening hours decoded again")
+
+    monkeypatch.setattr(chat, "opening_hours_of", decode)
+    monkeypatch.setattr("poi.snapshot.opening_hours_of", decode)
+    for records in ([AmenityRecord(row) for row in ROWS], list(mapped.scan())):
+        ranked = chat.rank_locations(records, 51.2, 4.4, "Sun 03:00")
+        assert [entry["location"].id for entry in ranked] == [2, 1, 3, 4]
+        assert ranked[1]["status"] == "Currently Closed (opens Mo 09:00)"
+    # Plain rows, from the database lookup, still have their metadata decoded
+    monkeypatch.undo()
+    assert [entry["location"]["id"] for entry in chat.rank_locations(ROWS, 51.2, 4.4, "Sun 03:00")] == [2, 1, 3, 4]
@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from db_memory import MemoryClient
+from poi import queries
+from poi.distance import haversine_m
+from poi.queries import bounding_box, fetch_nearby, find_nearby
+from poi.snapshot import AmenityRecord, Snapshot
+
+TYPES = ["pharmacy", "doctors", "dentist"]
+CENTRE = (51.2, 4.4)
+RADIUS_M = 10000
+# 0.0899 degrees of latitude is about 9996 m on the haversine sphere, 0.0901 about 10019 m
+EDGE = [(CENTRE[0] + 0.0899, CENTRE[1]), (CENTRE[0] - 0.0899, CENTRE[1]),
+        (CENTRE[0] + 0.0901, CENTRE[1]), (CENTRE[0] - 0.0901, CENTRE[1]),
+        (CENTRE[0], CENTRE[1] + 0.1435), (CENTRE[0], CENTRE[1] - 0.1435)]
+
+
+def _rows(count=1500, seed=3):
+    rng = random.Random(seed)
+    points = [(rng.uniform(51.05, 51.35), rng.uniform(4.15, 4.65)) for _ in range(count)] + EDGE
+    return [{"id": i + 1, "amenity_type": TYPES[i % len(TYPES)], "metadata": '{"name": "Amenity %d"}' % (i + 1),
+             "lat": lat, "lon": lon} for i, (lat, lon) in enumerate(points)]
+
+
+def _brute_force(rows, lat, lon, radius_m, amenity_types=None):
+    rows = [r for r in rows if amenity_types is None or r["amenity_type"] in amenity_types]
+    distances = haversine_m(lat, lon, [r["lat"] for r in rows], [r["lon"] for r in rows]).tolist()
+    return sorted(r["id"] for d, r in zip(distances, rows) if d <= radius_m)
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return _rows()
+
+
+@pytest.fixture
+def client(rows):
+    return MemoryClient({"medical_amenity": [dict(row) for row in rows]})
+
+
+@pytest.fixture
+def snapshot(rows, monkeypatch):
+    snapshot = Snapshot([AmenityRecord(row) for row in rows], None)
+    monkeypatch.setattr(queries, "get_snapshot", lambda: snapshot)
+    return snapshot
+
+
+def test_bounding_box_contains_the_circle():
+    lat_min, lat_max, lon_min, lon_max = bounding_box(*CENTRE, RADIUS_M)
+    for lat, lon in EDGE[:2] + EDGE[4:]:
+        assert haversine_m(*CENTRE, [lat], [lon])[0] <= RADIUS_M
+        assert lat_min <= lat <= lat_max and lon_min <= lon <= lon_max
+
+
+@pytest.mark.parametrize("rpc", [None, "nearby_amenities"])
+@pytest.mark.parametrize("amenity_types", [None, ["pharmacy"], ["doctors", "dentist"]])
+@pytest.mark.parametrize("radius_m", [500, 3000, RADIUS_M])
+def test_fetch_nearby_matches_a_full_scan(client, rows, monkeypatch, rpc, amenity_types, radius_m):
+    monkeypatch.setattr(queries, "POI_NEARBY_RPC", rpc)
+    for lat, lon in [CENTRE, (51.1, 4.25), (51.33, 4.6)]:
+        hits = fetch_nearby(client, lat, lon, radius_m, amenity_types)
+        assert [d for d, _ in hits] == sorted(d for d, _ in hits)
+        assert sorted(row["id"] for _, row in hits) == _brute_force(rows, lat, lon, radius_m, amenity_types)
+
+
+@pytest.mark.parametrize("amenity_types", [None, ["pharmacy"], ["doctors", "dentist"]])
+@pytest.mark.parametrize("radius_m", [500, 3000, RADIUS_M])
+def test_find_nearby_matches_a_full_scan(snapshot, rows, amenity_types, radius_m):
+    for lat, lon in [CENTRE, (51.1, 4.25), (51.33, 4.6)]:
+        hits = find_nearby(lat, lon, radius_m, amenity_types)
+        assert sorted(row["id"] for _, row in hits) == _brute_force(rows, lat, lon, radius_m, amenity_types)
+
+
+@pytest.mark.parametrize("rpc", [None, "nearby_amenities"])
+def test_points_just_inside_the_radius_due_north_and_south_are_found(client, snapshot, rows, monkeypatch, rpc):
+    monkeypatch.setattr(queries, "POI_NEARBY_RPC", rpc)
+    edge_ids = {row["id"] for row in rows[-len(EDGE):]}
+    inside = {row["id"] for row in rows[-len(EDGE):] if row["lat"] != CENTRE[0] and abs(row["lat"] - CENTRE[0]) < 0.09}
+    assert len(inside) == 2
+    for hits in (fetch_nearby(client, *CENTRE, RADIUS_M), find_nearby(*CENTRE, RADIUS_M)):
+        found = {row["id"] for _, row in hits} & edge_ids
+        assert inside <= found
+        assert not found & {row["id"] for row in rows[-4:-2]}
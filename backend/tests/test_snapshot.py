@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import db
+from db_memory import MemoryClient
+from poi import dataset, snapshot as snapshots
+from poi.snapshot import SnapshotStore, _overlap_start
+
+T0 = datetime(2026, 10, 18, 9, 0, tzinfo=timezone.utc)
+
+
+def _row(amenity_id, seconds, name=None):
+    return {"id": amenity_id, "amenity_type": "pharmacy", "metadata": '{"name": "%s"}' % (name or amenity_id),
+            "lat": 51.2, "lon": 4.4, "updated_at": (T0 + timedelta(seconds=seconds)).isoformat()}
+
+
+@pytest.fixture
+def table(monkeypatch):
+    client = MemoryClient({"medical_amenity": [_row(i, i) for i in range(1, 6)]})
+    monkeypatch.setitem(vars(db), "supabase", client)  # setattr would create the real client first
+    monkeypatch.setattr(dataset, "DATASET_PATH", None)
+    return client.tables["medical_amenity"]
+
+
+@pytest.fixture
+def store(table):
+    store = SnapshotStore("updated_at")
+    store.get()
+    return store
+
+
+def test_overlap_start_moves_the_version_back():
+    assert _overlap_start(T0, 60) == T0 - timedelta(seconds=60)
+    assert _overlap_start(T0.isoformat(), 60) == (T0 - timedelta(seconds=60)).isoformat()
+    assert _overlap_start(1000, 60) == 940
+    assert _overlap_start("not a timestamp", 60) == "not a timestamp"
+    assert _overlap_start(T0, 0) == T0
+
+
+def test_refresh_picks_up_a_row_that_committed_late(table, store):
+    # Stamped when its transaction started, before row 5, but visible only now
+    table.insert_row(_row(6, 2))
+    refreshed = store.refresh()
+    assert sorted(r.id for r in refreshed.scan()) == [1, 2, 3, 4, 5, 6]
+    assert refreshed.version == _row(5, 5)["updated_at"]
+
+
+def test_refresh_replaces_updated_rows_once(table, store):
+    table.upsert_rows([_row(3, 10, name="Renamed")])
+    refreshed = store.refresh()
+    assert [r.id for r in refreshed.scan()].count(3) == 1
+    assert refreshed.get(3).get("metadata") == '{"name": "Renamed"}'
+    assert refreshed.version == _row(3, 10)["updated_at"]
+
+
+def test_refresh_without_changes_keeps_the_snapshot(store):
+    current = store.current()
+    assert store.refresh() is current
+
+
+def test_rows_older_than_the_overlap_are_not_fetched_again(table, store, monkeypatch):
+    monkeypatch.setattr(snapshots, "SNAPSHOT_REFRESH_OVERLAP_S", 1.5)
+    table.insert_row(_row(6, 2))
+    table.insert_row(_row(7, 4))
+    assert sorted(r.id for r in store.refresh().scan()) == [1, 2, 3, 4, 5, 7]
@@ -0,0 +1,93 @@
+import random
+
+import numpy as np
+import pytest
+
+from poi.distance import distances_m
+from poi.spatial_index import ArraySpatialIndex, SpatialIndex
+
+TYPES = ["pharmacy", "doctors", "hospital"]
+
+
+def _rows(count=2000, seed=7):
+    rng = random.Random(seed)
+    rows = [{"id": i, "amenity_type": rng.choice(TYPES), "lat": rng.uniform(51.0, 51.4), "lon": rng.uniform(4.2, 4.6)}
+            for i in range(count)]
+    rows.append({"id": count, "amenity_type": "pharmacy", "lat": None, "lon": None})
+    return rows
+
+
+def _array_index(rows):
+    lat = np.array([np.nan if r["lat"] is None else r["lat"] for r in rows])
+    lon = np.array([np.nan if r["lon"] is None else r["lon"] for r in rows])
+    type_code = np.array([TYPES.index(r["amenity_type"]) for r in rows], dtype=np.uint16)
+    return ArraySpatialIndex(lat, lon, type_code, TYPES, lambda positions: [rows[p] for p in positions.tolist()])
+
+
+def _expected(rows, lat, lon, radius_m, amenity_types=None):
+    rows = [r for r in rows if r["lat"] is not None and (amenity_types is None or r["amenity_type"] in amenity_types)]
+    distances = distances_m(lat, lon, [r["lat"] for r in rows], [r["lon"] for r in rows]).tolist()
+    return sorted((d, r["id"]) for d, r in zip(distances, rows) if d <= radius_m)
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return _rows()
+
+
+@pytest.fixture(scope="module", params=["buckets", "arrays"])
+def index(request, rows):
+    return SpatialIndex.from_rows(rows) if request.param == "buckets" else _array_index(rows)
+
+
+def test_rows_without_coordinates_are_skipped(index, rows):
+    assert len(index) == len(rows) - 1
+    assert sorted(index.amenity_types) == sorted(TYPES)
+
+
+@pytest.mark.parametrize("radius_m", [300, 2500, 20000])
+@pytest.mark.parametrize("amenity_types", [None, ["pharmacy"], ["doctors", "hospital"], ["dentist"]])
+def test_within_radius_finds_exactly_the_rows_in_the_circle(index, rows, radius_m, amenity_types):
+    for lat, lon in [(51.2, 4.4), (51.0, 4.2), (51.38, 4.59)]:
+        hits = index.within_radius(lat, lon, radius_m, amenity_types)
+        assert [d for d, _ in hits] == sorted(d for d, _ in hits)
+        assert sorted((d, row["id"]) for d, row in hits) == pytest.approx(_expected(rows, lat, lon, radius_m,
+                                                                                    amenity_types))
+
+
+@pytest.mark.parametrize("k", [1, 5, 50])
+@pytest.mark.parametrize("amenity_types", [None, ["hospital"]])
+def test_nearest_returns_the_k_closest(index, rows, k, amenity_types):
+    for lat, lon in [(51.2, 4.4), (50.9, 4.1), (51.5, 4.7)]:
+        hits = index.nearest(lat, lon, k, amenity_types)
+        expected = _expected(rows, lat, lon, float("inf"), amenity_types)[:k]
+        assert [d for d, _ in hits] == pytest.approx([d for d, _ in expected])
+
+
+def test_nearest_stops_at_max_radius(index, rows):
+    hits = index.nearest(51.2, 4.4, 100, max_radius_m=1000)
+    expected = _expected(rows, 51.2, 4.4, 1000)
+    assert len(hits) == len(expected) < 100
+    assert all(d <= 1000 for d, _ in hits)
+
+
+def test_empty_lookups(index):
+    assert index.nearest(51.2, 4.4, 0) == []
+    assert index.nearest(51.2, 4.4, 5, ["dentist"]) == []
+    assert index.within_radius(0.0, 0.0, 1000) == []
+
+
+@pytest.mark.parametrize("kind", ["buckets", "arrays"])
+def test_points_just_inside_the_radius_due_north_and_south_are_found(kind):
+    # 0.0899 degrees of latitude is about 9996 m on the haversine sphere
+    rows = [{"id": 1, "amenity_type": "pharmacy", "lat": 51.30001, "lon": 4.4},
+            {"id": 2, "amenity_type": "pharmacy", "lat": 51.2, "lon": 4.4},
+            {"id": 3, "amenity_type": "pharmacy", "lat": 51.2 + 0.0899, "lon": 4.4},
+            {"id": 4, "amenity_type": "pharmacy", "lat": 51.2 - 0.0899, "lon": 4.4}]
+    index = SpatialIndex.from_rows(rows) if kind == "buckets" else _array_index(rows)
+
+    assert [row["id"] for _, row in index.within_radius(51.21015, 4.4, 10000)] == [2, 3, 1]
+    hits = index.within_radius(51.2, 4.4, 10000)
+    assert sorted(row["id"] for _, row in hits) == [2, 3, 4]
+    assert all(9990 < d <= 10000 for d, row in hits if row["id"] != 2)
+    assert sorted(row["id"] for _, row in index.nearest(51.2, 4.4, 10, max_radius_m=10000)) == [2, 3, 4]
@@ -0,0 +1,25 @@
+import os
+import statistics
+
+import pytest
+
+from benchmarks.startup import check, run_child
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUNS = 3
+ROWS = 2000
+BUDGETS = {"import_ms": 1000, "first_request_ms": 2500}  # the defaults of `python -m benchmarks.startup`
+
+
+@pytest.mark.parametrize("startup_mode", ["lazy", "eager"])
+def test_cold_start_within_budget(monkeypatch, startup_mode):
+    monkeypatch.chdir(BACKEND_DIR)  # the child runs `python -m benchmarks.startup`
+    runs = [run_child(ROWS, startup_mode) for _ in range(RUNS)]
+    medians = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+    assert check(medians, BUDGETS) == []
+
+
+def test_check_reports_measurements_over_budget():
+    assert check({"import_ms": 1200.0, "first_request_ms": 900.0}, {"import_ms": 1000, "first_request_ms": None}) \
+        == ["import_ms: 1200 ms > budget 1000 ms"]
@@ -0,0 +1,69 @@
+from poi.text_index import TextIndex, normalize_text, substring_distance
+
+ENTRIES = [
+    (1, {"name": "Apotheek Sint-Jozef", "amenity_type": "pharmacy"}),
+    (2, {"name": "Pharmacie Médicale", "amenity_type": "pharmacy"}),
+    (3, {"name": "Huisartsenpraktijk De Linde", "amenity_type": "doctors"}),
+    (4, {"name": "Apotheek Sint-Jozef", "amenity_type": "pharmacy"}),
+    (5, {"name": None, "amenity_type": "hospital"}),
+]
+
+
+def test_normalize_text_folds_case_accents_and_punctuation():
+    assert normalize_text("  Pharmacie Médicale!") == "pharmacie medicale"
+    assert normalize_text("Sint-Jozef_2") == "sint jozef 2"
+    assert normalize_text(None) == ""
+
+
+def test_substring_distance():
+    assert substring_distance("jozef", " apotheek sint jozef ") == 0
+    assert substring_distance("jozf", " apotheek sint jozef ") == 1
+    assert substring_distance("xyz", "abc") == 3
+
+
+def test_search_substrings_ignoring_case_and_accents():
+    index = TextIndex.from_entries(ENTRIES)
+    assert index.search("JOZEF") == {1, 4}
+    assert index.search("medicale") == {2}
+    assert index.search("pharm", field="amenity_type") == {1, 2, 4}
+    assert index.search("zz") == set()
+    assert index.search("") == {1, 2, 3, 4, 5}
+
+
+def test_prefix_search_matches_at_word_starts_only():
+    index = TextIndex.from_entries(ENTRIES)
+    assert index.search("lin", prefix=True) == {3}
+    assert index.search("inde", prefix=True) == set()
+    assert index.search("inde") == {3}
+
+
+def test_typos_only_when_nothing_matches_exactly():
+    index = TextIndex.from_entries(ENTRIES)
+    assert index.search("apotheke", typos=1) == {1, 4}
+    assert index.search("apotheke") == set()
+    assert index.search("apo", typos=1) == {1, 4}  # too short to tolerate a typo, matched exactly
+    assert index.search("apx", typos=1) == set()
+
+
+def test_updated_leaves_the_original_index_unchanged():
+    index = TextIndex.from_entries(ENTRIES)
+    updated = index.updated([(1, {"name": "Apotheek Centrum", "amenity_type": "pharmacy"}),
+                             (6, {"name": "Tandarts Jozef", "amenity_type": "dentist"})])
+
+    assert updated.search("jozef") == {4, 6}
+    assert updated.search("centrum") == {1}
+    assert updated.text(6) == "tandarts jozef"
+    assert len(updated) == 6
+
+    assert index.search("jozef") == {1, 4}
+    assert index.search("centrum") == set()
+    assert index.text(6) is None
+    assert len(index) == 5
+
+
+def test_updated_drops_texts_no_id_uses_any_more():
+    index = TextIndex.from_entries(ENTRIES)
+    updated = index.updated([(2, {"name": "Apotheek Noord", "amenity_type": "pharmacy"})])
+    assert updated.search("medicale") == set()
+    assert updated.search("medicale", typos=1) == set()
+    assert index.search("medicale") == {2}
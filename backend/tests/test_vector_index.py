@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from poi.dataset import MappedDataset, write_dataset
+from poi.vector_index import VectorIndex, _from_dataset
+
+
+def _rows(count=300, dim=16, seed=5):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(1, count + 1):
+        vector = rng.normal(size=dim)
+        rows.append({"id": i, "amenity_type": "pharmacy", "metadata": "{}", "lat": 51.2, "lon": 4.4,
+                     "embedding": (vector / np.linalg.norm(vector)).tolist() if i % 3 else None})
+    return rows
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return _rows()
+
+
+@pytest.fixture(scope="module")
+def dataset(rows, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("dataset") / "amenities.poi")
+    write_dataset(path, rows, "v1")
+    return MappedDataset(path)
+
+
+def test_dataset_index_shares_the_mapped_embeddings(dataset, rows):
+    index = _from_dataset(dataset)
+    assert np.shares_memory(index.vectors, dataset.embedding)
+    assert len(index) == sum(1 for row in rows if row["embedding"])
+
+
+def test_dataset_index_matches_an_index_over_the_rows(dataset, rows):
+    mapped, loaded = _from_dataset(dataset), VectorIndex.from_rows(rows)
+    query = np.asarray(rows[0]["embedding"], dtype=np.float32)
+    assert mapped.search(query, k=10) == pytest.approx(loaded.search(query, k=10))
+    # Rows without an embedding are never returned, even as candidates
+    candidates = range(1, 40)
+    hits = mapped.search(-query, k=50, candidate_ids=candidates)
+    assert hits == pytest.approx(loaded.search(-query, k=50, candidate_ids=candidates))
+    assert all(amenity_id % 3 for amenity_id, _ in hits)
+    assert all(amenity_id % 3 for amenity_id, _ in mapped.search(-query, k=300))